@@ -0,0 +1,89 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from helpers.dummy import (
+    DUMMY_BCC_OPTIONS,
+    DUMMY_CC_OPTIONS,
+    DUMMY_RECIPIENTS,
+    DUMMY_SENDERS,
+    build_dummy_mail
+)
+from helpers.indexer_by_thread import get_embedding_model
+from helpers.quantized_index import QuantizedIndex, _normalize
+
+# Compares compressed search + rescoring against exact float32 search on a
+# synthetic escalation-mail corpus and reports recall@k, latency and size.
+# "codes MB" is what every query scans; "full MB" are the float32 rescoring
+# vectors mapped next to them, of which only the shortlisted rows are read.
+#
+#   python benchmarks/quantization.py --num-mails 5000 --queries 200 --k 10
+
+CONFIGS = [
+    {"mode": "int8", "pca_dim": None},
+    {"mode": "int8", "pca_dim": 128},
+    {"mode": "binary", "pca_dim": None},
+    {"mode": "binary", "pca_dim": 256},
+]
+
+
+def synthetic_corpus(num_mails, seed):
+    random.seed(seed)
+    return [
+        build_dummy_mail(DUMMY_SENDERS, DUMMY_RECIPIENTS, DUMMY_CC_OPTIONS, DUMMY_BCC_OPTIONS)
+        for _ in range(num_mails)
+    ]
+
+
+def exact_search(vectors, queries, k):
+    scores = queries @ vectors.T
+    return [list(np.argsort(-row)[:k]) for row in scores]
+
+
+def recall_at_k(expected, found):
+    return np.mean([len(set(e) & set(f)) / len(e) for e, f in zip(expected, found)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-mails", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--shortlist-factors", type=int, nargs="+", default=[1, 4, 10, 20])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    embeddings = get_embedding_model()
+    corpus = synthetic_corpus(args.num_mails + args.queries, args.seed)
+    print(f"🧮 Embedding {len(corpus)} synthetic mails...")
+    vectors = _normalize(embeddings.embed_documents(corpus))
+    queries, vectors = vectors[:args.queries], vectors[args.queries:]
+    ids = [str(i) for i in range(len(vectors))]
+
+    started = time.perf_counter()
+    expected = exact_search(vectors, queries, args.k)
+    exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    print(f"\nExact float32: {vectors.nbytes / 1024 / 1024:.1f} MB in RAM, {exact_ms:.2f} ms/query\n")
+
+    print(f"{'mode':<8}{'pca':>6}{'shortlist':>11}{'codes MB':>10}{'x smaller':>11}{'full MB':>9}{'recall@' + str(args.k):>11}{'ms/query':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for config in CONFIGS:
+            index_dir = os.path.join(tmp, f"{config['mode']}-{config['pca_dim']}")
+            index = QuantizedIndex.build(index_dir, ids, vectors, mode=config["mode"], pca_dim=config["pca_dim"])
+            for factor in args.shortlist_factors:
+                started = time.perf_counter()
+                hits = index.search(queries, k=args.k, shortlist_factor=factor)
+                ms = (time.perf_counter() - started) * 1000 / len(queries)
+                found = [[int(doc_id) for doc_id, _ in row] for row in hits]
+                print(
+                    f"{config['mode']:<8}{str(config['pca_dim'] or '-'):>6}{factor:>11}"
+                    f"{index.code_bytes / 1024 / 1024:>10.2f}{vectors.nbytes / index.code_bytes:>11.1f}"
+                    f"{index.full_bytes / 1024 / 1024:>9.2f}"
+                    f"{recall_at_k(expected, found):>11.3f}{ms:>10.2f}"
+                )
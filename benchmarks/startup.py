@@ -0,0 +1,61 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+sys.path.append(ROOT)
+from helpers.daemon import DaemonUnavailable, call_daemon
+
+# Measures what a shell / cron invocation pays before it gets an answer:
+#   - import time of the helper modules (should not load LangChain or models)
+#   - import time of the LangChain stack they used to pull in eagerly
+#   - end-to-end latency of `cli.py query --retrieve-only` in-process vs via the daemon
+#
+#   python benchmarks/startup.py --runs 5
+#   python cli.py daemon &  # then run again to include daemon timings
+
+IMPORTS = {
+    "helpers.query_by_thread": "import helpers.query_by_thread",
+    "helpers.indexer_by_thread": "import helpers.indexer_by_thread",
+    "helpers.scoring": "import helpers.scoring",
+    "langchain stack (previously eager)": (
+        "from langchain_community.embeddings import HuggingFaceEmbeddings; "
+        "from langchain_community.vectorstores import Chroma; "
+        "from langchain_community.llms import Ollama"
+    ),
+}
+
+
+def timed_run(cmd, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(cmd, cwd=ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--question", default="who was invited to the kickoff meeting?")
+    args = parser.parse_args()
+
+    print("⏱️ Import time (median wall clock of a fresh interpreter)")
+    baseline = timed_run([sys.executable, "-c", "pass"], args.runs)
+    for name, statement in IMPORTS.items():
+        seconds = timed_run([sys.executable, "-c", statement], args.runs) - baseline
+        print(f"  {name:<40}{seconds * 1000:>10.0f} ms")
+
+    print("\n⏱️ First-query latency: cli.py query --retrieve-only")
+    query = [sys.executable, "cli.py", "--no-daemon", "query", "--retrieve-only", args.question]
+    print(f"  {'in-process (cold model load)':<40}{timed_run(query, args.runs) * 1000:>10.0f} ms")
+    try:
+        call_daemon("ping")
+        query.remove("--no-daemon")
+        print(f"  {'via warm daemon':<40}{timed_run(query, args.runs) * 1000:>10.0f} ms")
+    except DaemonUnavailable:
+        print("  (no daemon running: start `python cli.py daemon` to compare)")
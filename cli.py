@@ -0,0 +1,143 @@
+import argparse
+import json
+import sys
+
+from helpers.daemon import DaemonUnavailable, call_daemon, run_command, run_daemon
+
+# Fast-start command line for indexing and querying.
+#
+#   python cli.py daemon &                      # optional: keep models warm
+#   python cli.py query "who was invited to the kickoff meeting?"
+#   python cli.py index emails4
+#   python cli.py list-threads
+#   python cli.py eval --cases cases.json
+#   python cli.py eval --retrieval-only         # recall@k / MRR / nDCG sweep, no LLM
+#   python cli.py watch inbox "exports=Project Phoenix"   # live ingestion
+#
+# Commands go to the local daemon when one is running, otherwise they run
+# in-process (and pay the model loading cost once).
+
+
+def _run(args, command, **kwargs):
+    if not args.no_daemon:
+        try:
+            return call_daemon(command, **kwargs)
+        except DaemonUnavailable:
+            pass
+    return run_command(command, **kwargs)
+
+
+def _print_query(result, show_docs):
+    if result["answer"] is not None:
+        print(result["answer"])
+    if show_docs or result["answer"] is None:
+        for i, doc in enumerate(result["documents"], 1):
+            meta = doc["metadata"]
+            print(f"\n--- Document {i}: {meta.get('subject')} | {meta.get('from')} | {meta.get('date')} | {meta.get('thread')}")
+            print(doc["page_content"][:300])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Email RAG assistant CLI")
+    parser.add_argument("--no-daemon", action="store_true", help="Always run in-process")
+    parser.add_argument("--json", action="store_true", help="Print raw JSON results")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    index = sub.add_parser("index", help="Index a directory of .txt emails")
+    index.add_argument("directory")
+
+    query = sub.add_parser("query", help="Ask a question")
+    query.add_argument("question", nargs="+")
+    query.add_argument("--thread", default="All Threads")
+    query.add_argument("--top-k", type=int, default=10)
+    query.add_argument("--retrieve-only", action="store_true", help="Skip the LLM, print retrieved emails")
+    query.add_argument("--show-docs", action="store_true")
+    query.add_argument("--since", help="Only emails sent on or after this ISO date")
+    query.add_argument("--until", help="Only emails sent on or before this ISO date")
+
+    sub.add_parser("list-threads", help="List indexed threads with document counts")
+
+    evaluate = sub.add_parser("eval", help="Run the RAG evaluation")
+    evaluate.add_argument("--cases", help="JSON file with test cases (defaults to evaluate.py's)")
+    evaluate.add_argument("--retrieval-only", action="store_true",
+                          help="Score retrieval against gold_sources/gold_segments without calling the LLM")
+    evaluate.add_argument("--configs", help="JSON file with retrieval configs (defaults to evaluate.py's sweep)")
+    evaluate.add_argument("--json-out", default="rag_results.json")
+    evaluate.add_argument("--csv-out", help="CSV log (default: rag_results.csv or retrieval_results.csv)")
+
+    daemon = sub.add_parser("daemon", help="Run a warm daemon on a Unix socket")
+    daemon.add_argument("--watch", nargs="+", metavar="FOLDER[=THREAD]", help="Also ingest these folders live")
+
+    watch = sub.add_parser("watch", help="Index new and changed emails in folders as they arrive")
+    watch.add_argument("folders", nargs="+", metavar="FOLDER[=THREAD]")
+    watch.add_argument("--debounce", type=float, help="Seconds a file must be quiet before indexing")
+    watch.add_argument("--poll-interval", type=float, help="Scan interval when inotify is unavailable")
+    watch.add_argument("--batch-size", type=int, help="Files embedded per batch")
+    watch.add_argument("--poll", action="store_true", help="Poll even if watchdog is installed")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "daemon":
+        from helpers.watch_folder import parse_folder_specs
+
+        run_daemon(watch_folders=parse_folder_specs(args.watch) if args.watch else None)
+        return 0
+
+    if args.command == "watch":
+        from helpers.watch_folder import FolderWatcher, parse_folder_specs
+
+        options = {"debounce_s": args.debounce, "poll_interval_s": args.poll_interval, "batch_size": args.batch_size}
+        watcher = FolderWatcher(parse_folder_specs(args.folders), use_watchdog=not args.poll,
+                                **{name: value for name, value in options.items() if value is not None})
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if args.command == "index":
+        result = _run(args, "index", directory=args.directory)
+    elif args.command == "query":
+        result = _run(args, "query", question=" ".join(args.question), thread=args.thread,
+                      top_k=args.top_k, retrieve_only=args.retrieve_only, since=args.since, until=args.until)
+    elif args.command == "list-threads":
+        result = _run(args, "list-threads")
+    else:
+        if args.cases:
+            with open(args.cases) as f:
+                test_cases = json.load(f)
+        else:
+            from evaluate import test_cases
+        if args.retrieval_only:
+            if args.configs:
+                with open(args.configs) as f:
+                    configs = json.load(f)
+            else:
+                from evaluate import retrieval_configs as configs
+            result = _run(args, "eval", test_cases=test_cases, retrieval_only=True, configs=configs)
+        else:
+            result = _run(args, "eval", test_cases=test_cases)
+
+    if args.json:
+        print(json.dumps(result, indent=2, default=str))
+    elif args.command == "query":
+        _print_query(result, args.show_docs)
+    elif args.command == "list-threads":
+        for thread, count in result["threads"].items():
+            print(f"{count:>6}  {thread}")
+    elif args.command == "index":
+        print(f"🧵 Threads: {', '.join(result['threads'])}")
+    elif args.retrieval_only:
+        from helpers.scoring import log_retrieval_results_to_csv
+
+        log_retrieval_results_to_csv(result["results"], args.csv_out or "retrieval_results.csv")
+    else:
+        from helpers.scoring import log_results_to_csv, log_results_to_json
+
+        log_results_to_json(result["results"], args.json_out)
+        log_results_to_csv(result["results"], args.csv_out or "rag_results.csv")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,45 @@
+import sys
+
 from helpers.scoring import (
     evaluate_rag,
+    evaluate_retrieval,
     log_results_to_json,
-    log_results_to_csv
+    log_results_to_csv,
+    log_retrieval_results_to_csv,
+    retrieval_config_grid
 )
 
 
 test_cases = [
     {
         "question": "When is the kickoff meeting for Project Phoenix scheduled?",
-        "expected_answer": "Tuesday at 2 PM"
+        "expected_answer": "Tuesday at 2 PM",
+        "gold_segments": ["confirm the kickoff for Tuesday at 2 PM"]
     },
     {
         "question": "Who is expected to attend the Project Phoenix kickoff meeting?",
-        "expected_answer": "Alice, Bob, DevOps Team, QA Team"
+        "expected_answer": "Alice, Bob, DevOps Team, QA Team",
+        "gold_segments": ["confirm the kickoff for Tuesday at 2 PM", "Thanks for the invite"]
     },
     {
         "question": "What will be discussed during the kickoff meeting?",
-        "expected_answer": "Scope and objectives, Sprint 0 planning, Risk identification"
+        "expected_answer": "Scope and objectives, Sprint 0 planning, Risk identification",
+        "gold_segments": ["Scope and objectives"]
     }
 ]
-results = evaluate_rag(test_cases)
-log_results_to_json(results, "rag_results.json")
-log_results_to_csv(results, "rag_results.csv")
\ No newline at end of file
+
+# Retrieval settings compared by `python evaluate.py --retrieval-only`
+retrieval_configs = (
+    retrieval_config_grid(search="similarity", top_k=[3, 5, 10])
+    + retrieval_config_grid(search="mmr", top_k=[3, 5, 10], fetch_k=[20, 50], lambda_mult=[0.25, 0.5, 0.75])
+)
+
+if __name__ == "__main__":
+    if "--retrieval-only" in sys.argv:
+        # No LLM calls: recall@k / MRR / nDCG against the gold segments
+        results = evaluate_retrieval(test_cases, retrieval_configs)
+        log_retrieval_results_to_csv(results, "retrieval_results.csv")
+    else:
+        results = evaluate_rag(test_cases)
+        log_results_to_json(results, "rag_results.json")
+        log_results_to_csv(results, "rag_results.csv")
\ No newline at end of file
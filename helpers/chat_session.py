@@ -0,0 +1,182 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import requests
+
+from helpers.config import (
+    CHAT_KEEP_ALIVE,
+    CHAT_MAX_CONTEXT_TOKENS,
+    CHAT_MAX_SESSIONS,
+    CHAT_NUM_CTX,
+    CHAT_SESSION_TTL_S,
+    OLLAMA_BASE_URL
+)
+from helpers.query_by_thread import LLM_MODEL_NAME, build_email_context, retrieve_email_docs
+from helpers.query_router import format_header_answer, header_context_doc, try_route_header_query
+
+# Static prefix: sent once per session, then kept in Ollama's KV context
+CHAT_PREFIX = """You are an AI assistant helping analyze and summarize corporate email trails. Use only the information provided in the CONTEXT blocks of this conversation to answer each QUESTION.
+Be specific, and do not make assumptions beyond the content.
+"""
+MAX_TURNS_KEPT = 50
+MAX_UNSENT_LOOKUPS = 5
+
+
+def _doc_key(doc):
+    meta = doc.metadata
+    raw = "|".join(str(meta.get(k, "")) for k in ("source", "thread", "date", "from")) + doc.page_content
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ChatSession:
+    """
+    Multi-turn chat over the email index that reuses the LLM's prompt state.
+
+    The first turn sends the static instructions plus the retrieved emails.
+    Later turns send only the emails not sent before, plus the new question,
+    together with the ``context`` token state Ollama returned for the previous
+    turn. Ollama then continues from its cached prefix instead of prefilling
+    everything again, and ``keep_alive`` keeps the model and cache loaded.
+    When the token state grows past ``max_context_tokens`` the session starts
+    a new prefix. The next turn then re-sends the instructions and the emails
+    it retrieves.
+
+    Each turn goes through the same routing as ``/ask``: participant / date
+    questions the header store fully answers skip the LLM (their answer is
+    sent as context with the next LLM turn, so follow-ups can refer to it),
+    partial lookups are sent ahead of the retrieved emails, and retrieval is
+    scoped to the time range of the question or the explicit bounds.
+    """
+
+    def __init__(self, thread="All Threads", top_k=5, max_context_tokens=CHAT_MAX_CONTEXT_TOKENS):
+        self.id = uuid.uuid4().hex
+        self.thread = thread
+        self.top_k = top_k
+        self.max_context_tokens = max_context_tokens
+        self.turns = []
+        self.last_used = time.time()
+        self.prefill_tokens = 0
+        self._context = None
+        self._sent = set()
+        self._unsent_lookups = []
+        self._lock = threading.Lock()
+
+    def reset_context(self):
+        """Forgets the cached prompt state; the next turn re-sends the prefix."""
+        self._context = None
+        self._sent.clear()
+
+    def _build_prompt(self, question, new_docs):
+        parts = []
+        if self._context is None:
+            parts.append(CHAT_PREFIX)
+        if new_docs:
+            parts.append("CONTEXT:\n" + build_email_context(new_docs))
+        parts.append(f"QUESTION:\n{question}\n\n📝 Answer:")
+        return "\n\n".join(parts)
+
+    def ask(self, question, start=None, end=None):
+        """
+        Answers a question within the session.
+
+        Args:
+            question (str): The question or follow-up.
+            start (datetime): Only mail sent at or after this time.
+            end (datetime): Only mail sent at or before this time. Without
+                either bound, a time scope in the question is used.
+
+        Returns:
+            tuple: (answer, retrieved docs, number of newly sent docs)
+        """
+        with self._lock:
+            self.last_used = time.time()
+            routed = try_route_header_query(question, self.thread, start=start, end=end)
+            if routed is not None and routed.complete:
+                answer = format_header_answer(routed)
+                self._unsent_lookups = (self._unsent_lookups + [header_context_doc(routed)])[-MAX_UNSENT_LOOKUPS:]
+                self.turns.append({"question": question, "answer": answer, "new_docs": 0, "prompt_tokens": 0})
+                del self.turns[:-MAX_TURNS_KEPT]
+                return answer, [], 0
+
+            docs = retrieve_email_docs(question, self.thread, top_k=self.top_k, start=start, end=end)
+            if routed is not None:
+                docs = [header_context_doc(routed)] + docs
+            if self._context is not None and len(self._context) > self.max_context_tokens:
+                self.reset_context()
+            new_docs = self._unsent_lookups + [doc for doc in docs if _doc_key(doc) not in self._sent]
+
+            payload = {
+                "model": LLM_MODEL_NAME,
+                "prompt": self._build_prompt(question, new_docs),
+                "stream": False,
+                "keep_alive": CHAT_KEEP_ALIVE,
+                "options": {"num_ctx": CHAT_NUM_CTX},
+            }
+            if self._context is not None:
+                payload["context"] = self._context
+            response = requests.post(f"{OLLAMA_BASE_URL}/api/generate", json=payload, timeout=600)
+            response.raise_for_status()
+            result = response.json()
+
+            self._context = result.get("context")
+            self._sent.update(_doc_key(doc) for doc in new_docs)
+            self._unsent_lookups = []
+            self.prefill_tokens += result.get("prompt_eval_count", 0)
+            answer = result.get("response", "")
+            self.turns.append({
+                "question": question,
+                "answer": answer,
+                "new_docs": len(new_docs),
+                "prompt_tokens": result.get("prompt_eval_count", 0),
+            })
+            del self.turns[:-MAX_TURNS_KEPT]
+            return answer, docs, len(new_docs)
+
+
+class ChatSessionStore:
+    """Bounded in-memory registry of chat sessions (LRU + idle expiry)."""
+
+    def __init__(self, max_sessions=CHAT_MAX_SESSIONS, ttl_s=CHAT_SESSION_TTL_S):
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, thread="All Threads", top_k=5):
+        session = ChatSession(thread=thread, top_k=top_k)
+        with self._lock:
+            self._expire()
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def close(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_s
+        for session_id in [sid for sid, s in self._sessions.items() if s.last_used < cutoff]:
+            del self._sessions[session_id]
+
+
+_store = None
+
+
+def get_chat_session_store():
+    global _store
+    if _store is None:
+        _store = ChatSessionStore()
+    return _store
@@ -0,0 +1,23 @@
+COLLECTION_NAME = "langchain"  # default collection used by langchain's Chroma wrapper
+
+
+def get_collection(db_directory, create=False, metadata=None):
+    """
+    Opens the email collection of a ChromaDB directory without LangChain or
+    the embedding model, for code that only reads or writes stored vectors.
+
+    Args:
+        db_directory (str): ChromaDB persistence directory.
+        create (bool): Create the collection if it does not exist yet;
+            otherwise chromadb raises when it is missing.
+        metadata (dict): Collection metadata used when creating it.
+
+    Returns:
+        chromadb.Collection: The collection.
+    """
+    import chromadb
+
+    client = chromadb.PersistentClient(path=db_directory)
+    if create:
+        return client.get_or_create_collection(COLLECTION_NAME, metadata=metadata)
+    return client.get_collection(COLLECTION_NAME)
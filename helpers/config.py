@@ -0,0 +1,68 @@
+import os
+import tempfile
+
+# Shared settings for indexing and querying. Each value can be overridden
+# through an environment variable so scripts, the UI and services agree.
+EMBEDDING_MODEL_NAME = os.environ.get("EMAIL_RAG_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+DB_DIRECTORY = os.environ.get("EMAIL_RAG_DB_DIRECTORY", "chroma_email_db_3")
+
+# Content-addressed embedding cache, shared by every collection directory
+EMBEDDING_CACHE_DIR = os.environ.get("EMAIL_RAG_EMBEDDING_CACHE_DIR", "embedding_cache")
+EMBEDDING_CACHE_MAX_BYTES = int(os.environ.get("EMAIL_RAG_EMBEDDING_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+# Optional quantized index (see helpers/quantized_index.py); empty disables it
+QUANTIZED_INDEX_DIR = os.environ.get("EMAIL_RAG_QUANTIZED_INDEX_DIR", "")
+QUANTIZED_SHORTLIST_FACTOR = int(os.environ.get("EMAIL_RAG_QUANTIZED_SHORTLIST_FACTOR", 10))
+
+# Base URL of a running query service (helpers/query_service.py); empty means
+# the UI loads the model and vectorstore in-process
+QUERY_SERVICE_URL = os.environ.get("EMAIL_RAG_QUERY_SERVICE_URL", "")
+# Chat sessions need a single-worker service; defaults to the query service
+CHAT_SERVICE_URL = os.environ.get("EMAIL_RAG_CHAT_SERVICE_URL", QUERY_SERVICE_URL)
+
+# Persistent conversation index (helpers/thread_reconstruction.py)
+THREAD_INDEX_PATH = os.environ.get("EMAIL_RAG_THREAD_INDEX_PATH", DB_DIRECTORY + "_threads.json")
+
+# Unix socket of the warm local daemon used by cli.py (helpers/daemon.py)
+DAEMON_SOCKET_PATH = os.environ.get(
+    "EMAIL_RAG_DAEMON_SOCKET", os.path.join(tempfile.gettempdir(), f"email_rag_{os.getuid()}.sock")
+)
+
+# Ollama and chat sessions (helpers/chat_session.py)
+OLLAMA_BASE_URL = os.environ.get("EMAIL_RAG_OLLAMA_URL", "http://localhost:11434")
+CHAT_KEEP_ALIVE = os.environ.get("EMAIL_RAG_CHAT_KEEP_ALIVE", "30m")
+CHAT_NUM_CTX = int(os.environ.get("EMAIL_RAG_CHAT_NUM_CTX", 8192))
+CHAT_MAX_CONTEXT_TOKENS = int(os.environ.get("EMAIL_RAG_CHAT_MAX_CONTEXT_TOKENS", 6000))
+CHAT_MAX_SESSIONS = int(os.environ.get("EMAIL_RAG_CHAT_MAX_SESSIONS", 100))
+CHAT_SESSION_TTL_S = int(os.environ.get("EMAIL_RAG_CHAT_SESSION_TTL_S", 3600))
+
+# Near-duplicate collapsing at ingest (helpers/near_duplicates.py); 0 disables it
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get("EMAIL_RAG_NEAR_DUPLICATE_THRESHOLD", 0.9))
+NEAR_DUPLICATE_REPORT_PATH = os.environ.get("EMAIL_RAG_NEAR_DUPLICATE_REPORT", "results/near_duplicate_report.json")
+# Only collapse copies within one thread; off by default, as forwarded / re-sent copies usually start new threads
+NEAR_DUPLICATE_SAME_THREAD = os.environ.get("EMAIL_RAG_NEAR_DUPLICATE_SAME_THREAD", "").lower() in ("1", "true", "yes")
+# MinHash signatures and duplicate -> representative map of everything ingested
+NEAR_DUPLICATE_INDEX_PATH = os.environ.get("EMAIL_RAG_NEAR_DUPLICATE_INDEX", DB_DIRECTORY + "_duplicates.sqlite3")
+
+# Structured header store for participant / date questions (helpers/header_store.py)
+HEADER_STORE_PATH = os.environ.get("EMAIL_RAG_HEADER_STORE_PATH", DB_DIRECTORY + "_headers.sqlite3")
+
+# Retrieval-only evaluation results, keyed by (index version, retrieval config) (helpers/scoring.py)
+RETRIEVAL_EVAL_CACHE_PATH = os.environ.get("EMAIL_RAG_RETRIEVAL_EVAL_CACHE", "results/retrieval_eval_cache.json")
+
+# Watch-folder live ingestion (helpers/watch_folder.py)
+WATCH_CHECKPOINT_PATH = os.environ.get("EMAIL_RAG_WATCH_CHECKPOINT", DB_DIRECTORY + "_watch_checkpoint.json")
+WATCH_DEBOUNCE_S = float(os.environ.get("EMAIL_RAG_WATCH_DEBOUNCE_S", 1.0))
+WATCH_POLL_INTERVAL_S = float(os.environ.get("EMAIL_RAG_WATCH_POLL_INTERVAL_S", 2.0))
+WATCH_BATCH_SIZE = int(os.environ.get("EMAIL_RAG_WATCH_BATCH_SIZE", 32))
+# A file that keeps failing is retried with exponential backoff, then skipped until it changes
+WATCH_MAX_ATTEMPTS = int(os.environ.get("EMAIL_RAG_WATCH_MAX_ATTEMPTS", 5))
+WATCH_RETRY_BACKOFF_S = float(os.environ.get("EMAIL_RAG_WATCH_RETRY_BACKOFF_S", 5.0))
+WATCH_MAX_BACKOFF_S = float(os.environ.get("EMAIL_RAG_WATCH_MAX_BACKOFF_S", 300.0))
+
+# Time-partitioned retrieval (helpers/time_partitions.py); an empty directory disables partitions
+TIME_PARTITION_DIR = os.environ.get("EMAIL_RAG_TIME_PARTITION_DIR", "")
+TIME_PARTITIONS_MAX_LOADED = int(os.environ.get("EMAIL_RAG_TIME_PARTITIONS_MAX_LOADED", 24))
+# Score bonus for recent mail: RECENCY_WEIGHT * 0.5 ** (age in days / half-life); 0 disables it
+RECENCY_WEIGHT = float(os.environ.get("EMAIL_RAG_RECENCY_WEIGHT", 0.0))
+RECENCY_HALF_LIFE_DAYS = float(os.environ.get("EMAIL_RAG_RECENCY_HALF_LIFE_DAYS", 30))
@@ -0,0 +1,180 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from helpers.config import DAEMON_SOCKET_PATH
+
+
+class DaemonUnavailable(ConnectionError):
+    """Raised when no daemon is listening on the socket."""
+
+
+# 1. Commands shared by the CLI (in-process) and the daemon
+def _docs_to_dicts(docs):
+    return [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs or []]
+
+
+def cmd_index(directory):
+    from helpers.indexer_by_thread import index_email_directory
+
+    threads = index_email_directory(directory)
+    return {"directory": directory, "threads": threads}
+
+
+def cmd_query(question, thread="All Threads", top_k=10, retrieve_only=False, since=None, until=None):
+    from helpers.query_by_thread import retrieve_email_docs
+    from helpers.query_router import answer_email_query
+    from helpers.time_partitions import parse_iso_bounds
+
+    start, end = parse_iso_bounds(since, until)
+    if retrieve_only:
+        docs = retrieve_email_docs(question, thread, top_k=top_k, start=start, end=end)
+        return {"answer": None, "documents": _docs_to_dicts(docs)}
+    result = answer_email_query(question, thread, top_k=top_k, start=start, end=end)
+    if not result:
+        return {"answer": "⚠️ No relevant documents found for the query.", "documents": []}
+    answer, docs = result
+    return {"answer": answer, "documents": _docs_to_dicts(docs)}
+
+
+def cmd_list_threads():
+    from helpers.query_by_thread import get_query_vectorstore
+
+    metadatas = get_query_vectorstore()._collection.get(include=["metadatas"])["metadatas"]
+    counts = {}
+    for metadata in metadatas:
+        thread = (metadata or {}).get("thread", "Unknown")
+        counts[thread] = counts.get(thread, 0) + 1
+    return {"threads": dict(sorted(counts.items()))}
+
+
+def cmd_eval(test_cases, retrieval_only=False, configs=None):
+    from helpers.scoring import evaluate_rag, evaluate_retrieval
+
+    if retrieval_only:
+        return {"results": evaluate_retrieval(test_cases, configs)}
+    return {"results": evaluate_rag(test_cases)}
+
+
+COMMANDS = {
+    "index": cmd_index,
+    "query": cmd_query,
+    "list-threads": cmd_list_threads,
+    "eval": cmd_eval,
+}
+
+
+def run_command(command, **kwargs):
+    if command not in COMMANDS:
+        raise ValueError(f"Unknown command: {command}")
+    return COMMANDS[command](**kwargs)
+
+
+# 2. Server
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            command = request["command"]
+            if command == "ping":
+                response = {"ok": True, "result": {"pid": os.getpid(), "uptime_s": time.time() - self.server.started_at}}
+            else:
+                # One command at a time: the model and Chroma are shared state
+                with self.server.lock:
+                    response = {"ok": True, "result": run_command(command, **request.get("kwargs", {}))}
+        except Exception as e:
+            response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        self.wfile.write((json.dumps(response, default=str) + "\n").encode("utf-8"))
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _socket_in_use(path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(path)
+            return True
+        except OSError:
+            return False
+
+
+def run_daemon(socket_path=DAEMON_SOCKET_PATH, watch_folders=None):
+    """
+    Loads the embedding model and Chroma once, then serves CLI commands over
+    a Unix socket until interrupted.
+
+    Args:
+        socket_path (str): Unix socket to listen on.
+        watch_folders (dict): Optional {folder: thread or None} to ingest live
+            in a background thread (see ``helpers.watch_folder``).
+    """
+    if os.path.exists(socket_path):
+        if _socket_in_use(socket_path):
+            raise RuntimeError(f"A daemon is already listening on {socket_path}")
+        os.remove(socket_path)  # stale socket from a crashed daemon
+
+    started = time.time()
+    from helpers.query_by_thread import get_query_vectorstore, get_quantized_index
+
+    get_query_vectorstore().embeddings.embed_query("warm-up")
+    get_quantized_index()
+    print(f"🔥 Models loaded in {time.time() - started:.1f}s")
+
+    server = _Server(socket_path, _Handler)
+    server.lock = threading.Lock()
+    server.started_at = time.time()
+    os.chmod(socket_path, 0o600)
+    print(f"🛰️ Email RAG daemon listening on {socket_path} (pid {os.getpid()})")
+    watcher = None
+    if watch_folders:
+        from helpers.watch_folder import FolderWatcher
+
+        # Shares the command lock: a batch never overlaps an index/query command
+        watcher = FolderWatcher(watch_folders, index_lock=server.lock)
+        watcher.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+# 3. Client
+def call_daemon(command, socket_path=DAEMON_SOCKET_PATH, timeout=None, **kwargs):
+    """
+    Sends one command to a running daemon and returns its result.
+
+    Raises:
+        DaemonUnavailable: If nothing is listening on ``socket_path``.
+        RuntimeError: If the command failed inside the daemon.
+    """
+    if not os.path.exists(socket_path):
+        raise DaemonUnavailable(socket_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        try:
+            s.connect(socket_path)
+        except OSError as e:
+            raise DaemonUnavailable(socket_path) from e
+        s.sendall((json.dumps({"command": command, "kwargs": kwargs}) + "\n").encode("utf-8"))
+        with s.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise RuntimeError("Daemon closed the connection without a response")
+    response = json.loads(line)
+    if not response["ok"]:
+        raise RuntimeError(response["error"])
+    return response["result"]
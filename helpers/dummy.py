@@ -3,7 +3,8 @@ import random
 from datetime import datetime, timedelta
 import zipfile
 
-def generate_dummy_mail(mail_id, senders, recipients, cc_options, bcc_options):
+def build_dummy_mail(senders, recipients, cc_options, bcc_options):
+    """Returns the text of one random escalation email (headers + body)."""
     sender = random.choice(senders)
     to = random.choice(recipients)
     
@@ -86,29 +87,35 @@ def generate_dummy_mail(mail_id, senders, recipients, cc_options, bcc_options):
             mail_content += f"\nBcc: {', '.join(bcc)}"
 
     mail_content += f"\n\n{body}\n"
+    return mail_content
 
+def generate_dummy_mail(mail_id, senders, recipients, cc_options, bcc_options):
+    mail_content = build_dummy_mail(senders, recipients, cc_options, bcc_options)
     filename = f"mail_{mail_id:02d}.txt"
     with open(filename, "w") as f:
         f.write(mail_content)
     return filename
 
+DUMMY_SENDERS = [
+    "bob@acmecorp.com", "alice@acmecorp.com", "charlie@acmecorp.com",
+    "diana@acmecorp.com", "eve@acmecorp.com", "frank@acmecorp.com"
+]
+DUMMY_RECIPIENTS = [
+    "grace@acmecorp.com", "heidi@acmecorp.com", "ivan@acmecorp.com",
+    "judy@acmecorp.com", "kevin@acmecorp.com", "liam@acmecorp.com",
+    "maya@acmecorp.com"
+]
+DUMMY_CC_OPTIONS = [
+    "qa@acmecorp.com", "devops@acmecorp.com", "marketing@acmecorp.com",
+    "legal@acmecorp.com", "support@acmecorp.com", "finance@acmecorp.com"
+]
+DUMMY_BCC_OPTIONS = [
+    "ceo@acmecorp.com", "cto@acmecorp.com", "hr@acmecorp.com"
+]
+
 def create_and_zip_mails(num_mails=20):
-    senders = [
-        "bob@acmecorp.com", "alice@acmecorp.com", "charlie@acmecorp.com",
-        "diana@acmecorp.com", "eve@acmecorp.com", "frank@acmecorp.com"
-    ]
-    recipients = [
-        "grace@acmecorp.com", "heidi@acmecorp.com", "ivan@acmecorp.com",
-        "judy@acmecorp.com", "kevin@acmecorp.com", "liam@acmecorp.com",
-        "maya@acmecorp.com"
-    ]
-    cc_options = [
-        "qa@acmecorp.com", "devops@acmecorp.com", "marketing@acmecorp.com",
-        "legal@acmecorp.com", "support@acmecorp.com", "finance@acmecorp.com"
-    ]
-    bcc_options = [
-        "ceo@acmecorp.com", "cto@acmecorp.com", "hr@acmecorp.com"
-    ]
+    senders, recipients = DUMMY_SENDERS, DUMMY_RECIPIENTS
+    cc_options, bcc_options = DUMMY_CC_OPTIONS, DUMMY_BCC_OPTIONS
 
     generated_files = []
     print(f"Generating {num_mails} dummy mail files...")
@@ -127,4 +134,5 @@ def create_and_zip_mails(num_mails=20):
     print(f"All files have been zipped into '{zip_filename}' and individual .txt files have been removed.")
 
 # Run the script
-create_and_zip_mails(20)
\ No newline at end of file
+if __name__ == "__main__":
+    create_and_zip_mails(20)
\ No newline at end of file
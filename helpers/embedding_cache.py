@@ -0,0 +1,320 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def text_key(text):
+    """Content address of a text: SHA-256 of its UTF-8 bytes."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _model_slug(model_name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache keyed by (model ID, text hash).
+
+    Vectors for one model live in a single append-only float32 file that is
+    read through ``np.memmap``; a small SQLite index maps each text hash to its
+    row and tracks when it was last used, which drives size-based eviction.
+    The cache is independent of any Chroma directory, so every collection,
+    re-index and experiment shares it.
+
+    Eviction never rewrites the live file: it writes the compacted vectors
+    under the next generation's file name and switches the generation number
+    in SQLite together with the new row numbers. Readers look up rows and the
+    generation in one read transaction, so another process can never pair new
+    row numbers with an old memory map.
+
+    Args:
+        cache_dir (str): Root directory of the cache.
+        model_name (str): Embedding model ID the vectors belong to.
+        max_bytes (int): Vector file size that triggers eviction.
+    """
+
+    def __init__(self, cache_dir, model_name, max_bytes):
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.directory = os.path.join(cache_dir, _model_slug(model_name))
+        os.makedirs(self.directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._mmap = None
+        self._mmap_key = None
+        self._lock = threading.RLock()
+
+        self._conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, row INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+    # -- metadata ------------------------------------------------------------
+    @property
+    def dim(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        return int(row[0]) if row else None
+
+    @property
+    def generation(self):
+        """Number of the vector file in use; bumped by every eviction."""
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _vectors_path(self, generation):
+        # Generation 0 keeps the original file name, so existing caches stay valid
+        name = "vectors.f32" if not generation else f"vectors.{generation}.f32"
+        return os.path.join(self.directory, name)
+
+    @property
+    def vectors_path(self):
+        return self._vectors_path(self.generation)
+
+    def _rows_on_disk(self, dim, generation):
+        path = self._vectors_path(generation)
+        if not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // (4 * dim)
+
+    def _vectors(self, dim, generation):
+        rows = self._rows_on_disk(dim, generation)
+        if rows == 0:
+            return None
+        if self._mmap is None or self._mmap_key != (generation, rows):
+            self._mmap = np.memmap(self._vectors_path(generation), dtype=np.float32, mode="r", shape=(rows, dim))
+            self._mmap_key = (generation, rows)
+        return self._mmap
+
+    # -- lookups -------------------------------------------------------------
+    def _lookup_rows(self, keys):
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        # Chunked to stay under SQLite's bound-parameter limit
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(self._conn.execute(
+                f"SELECT key, row FROM entries WHERE key IN ({placeholders})", chunk
+            ).fetchall())
+        return found
+
+    def get_many(self, keys):
+        """
+        Looks up vectors by text hash.
+
+        Returns:
+            dict: Mapping of key -> list[float] for the keys that were cached.
+        """
+        with self._lock:
+            dim = self.dim
+            if dim is None or not keys:
+                self.misses += len(keys)
+                return {}
+
+            # Rows, generation and the vectors they point at are read in one
+            # transaction, which an eviction in another process cannot commit into
+            self._conn.execute("BEGIN")
+            try:
+                generation = self.generation
+                found = self._lookup_rows(keys)
+                vectors = self._vectors(dim, generation) if found else None
+                result = {}
+                for key, row in found.items():
+                    if vectors is not None and row < len(vectors):
+                        result[key] = vectors[row].tolist()
+            finally:
+                self._conn.commit()
+
+            if result:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in result]
+                )
+                self._conn.commit()
+
+        self.hits += sum(1 for key in keys if key in result)
+        self.misses += sum(1 for key in keys if key not in result)
+        return result
+
+    def put_many(self, keys, vectors):
+        """Appends new vectors to the cache, then evicts if it grew too large."""
+        if not keys:
+            return
+        array = np.asarray(vectors, dtype=np.float32)
+        dim = array.shape[1]
+
+        with self._lock:
+            # BEGIN IMMEDIATE serialises writers across processes, so the row
+            # numbers derived from the file size stay consistent.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                stored_dim = self.dim
+                if stored_dim is None:
+                    self._conn.execute("INSERT INTO meta (name, value) VALUES ('dim', ?)", (str(dim),))
+                elif stored_dim != dim:
+                    raise ValueError(f"Cache for {self.model_name} holds {stored_dim}-dim vectors, got {dim}")
+
+                existing = self._lookup_rows(keys)
+                new_rows = []
+                seen = set()
+                for key, vector in zip(keys, array):
+                    if key in existing or key in seen:
+                        continue
+                    seen.add(key)
+                    new_rows.append((key, vector))
+
+                generation = self.generation
+                first_row = self._rows_on_disk(dim, generation)
+                with open(self._vectors_path(generation), "ab") as f:
+                    for _, vector in new_rows:
+                        f.write(vector.tobytes())
+                now = time.time()
+                self._conn.executemany(
+                    "INSERT INTO entries (key, row, last_used) VALUES (?, ?, ?)",
+                    [(key, first_row + i, now) for i, (key, _) in enumerate(new_rows)],
+                )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+            if os.path.getsize(self._vectors_path(generation)) > self.max_bytes:
+                self.evict()
+
+    # -- maintenance -----------------------------------------------------------
+    def evict(self, target_fraction=0.8):
+        """
+        Drops least-recently-used vectors until the file fits in
+        ``target_fraction * max_bytes``. The kept vectors are compacted into
+        the next generation's file; the old file is removed once the new
+        generation is committed.
+        """
+        with self._lock:
+            dim = self.dim
+            if dim is None:
+                return 0
+            keep_rows = int(self.max_bytes * target_fraction) // (4 * dim)
+
+            self._conn.execute("BEGIN IMMEDIATE")
+            new_path = None
+            try:
+                entries = self._conn.execute(
+                    "SELECT key, row, last_used FROM entries ORDER BY last_used DESC"
+                ).fetchall()
+                kept, dropped = entries[:keep_rows], entries[keep_rows:]
+                if not dropped:
+                    self._conn.rollback()
+                    return 0
+
+                generation = self.generation
+                old_path, new_path = self._vectors_path(generation), self._vectors_path(generation + 1)
+                old = np.memmap(old_path, dtype=np.float32, mode="r", shape=(self._rows_on_disk(dim, generation), dim))
+                with open(new_path, "wb") as f:
+                    for _, row, _ in kept:
+                        f.write(np.asarray(old[row]).tobytes())
+                del old
+
+                self._conn.execute("DELETE FROM entries")
+                self._conn.executemany(
+                    "INSERT INTO entries (key, row, last_used) VALUES (?, ?, ?)",
+                    [(key, i, last_used) for i, (key, _, last_used) in enumerate(kept)],
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES ('generation', ?)", (str(generation + 1),)
+                )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                if new_path is not None and os.path.exists(new_path):
+                    os.remove(new_path)
+                raise
+
+            self._mmap = None
+            # Readers that still map the old file keep their pages until they next look up
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+        self.evictions += len(dropped)
+        print(f"🧹 Evicted {len(dropped)} cached embedding(s) for {self.model_name}")
+        return len(dropped)
+
+    def stats(self):
+        """Returns entry count, on-disk size and hit/miss counters."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            vectors_path = self.vectors_path
+        size = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain embeddings wrapper that checks an ``EmbeddingCache`` before
+    calling the underlying model, and only embeds the texts it has never seen.
+    """
+
+    def __init__(self, base, cache):
+        self.base = base
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        keys = [text_key(t) for t in texts]
+        cached = self.cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.base.embed_documents(list(missing.values()))
+            self.cache.put_many(list(missing.keys()), vectors)
+            cached.update(zip(missing.keys(), vectors))
+
+        return [list(cached[key]) for key in keys]
+
+    def embed_query(self, text):
+        # Kept apart from document keys: some models embed queries differently
+        key = "query:" + text_key(text)
+        cached = self.cache.get_many([key])
+        if key in cached:
+            return cached[key]
+        vector = self.base.embed_query(text)
+        self.cache.put_many([key], [vector])
+        return vector
+
+    def embed_queries(self, texts):
+        """
+        Embeds many questions in one model call (cached under the same keys as
+        ``embed_query``). Only valid for models that embed queries and
+        documents alike, such as the sentence transformers used here.
+        """
+        keys = ["query:" + text_key(t) for t in texts]
+        cached = self.cache.get_many(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+        if missing:
+            vectors = self.base.embed_documents(list(missing.values()))
+            self.cache.put_many(list(missing.keys()), vectors)
+            cached.update(zip(missing.keys(), vectors))
+        return [list(cached[key]) for key in keys]
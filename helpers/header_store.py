@@ -0,0 +1,286 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from email.utils import getaddresses, parsedate_to_datetime
+
+from helpers.config import HEADER_STORE_PATH
+from helpers.thread_reconstruction import email_key
+
+ROLES = ("from", "to", "cc", "bcc")
+
+
+def parse_email_date(value):
+    """
+    Parses the Date header formats seen in our mail ("2024-09-01",
+    "2025-07-09 23:59:22", RFC 2822). Returns a naive datetime or None.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            parsed = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def _thread_condition(thread, column="thread"):
+    """SQL condition (and params) matching a thread label and its "<label> [abc123]" siblings."""
+    # GLOB has no escape character: brackets make the label's wildcards literal
+    literal = re.sub(r"([*?\[])", r"[\1]", thread)
+    return f"({column} = ? OR {column} GLOB ?)", [thread, literal + " [[]" + "[0-9a-f]" * 6 + "]"]
+
+
+def metadata_email_key(meta, text):
+    """``email_key`` of an email from its indexer metadata and body, as recorded in the store."""
+    headers = {
+        "from": meta.get("from"), "to": meta.get("to"), "subject": meta.get("subject"),
+        "date": meta.get("date"), "message-id": meta.get("message_id"),
+    }
+    return email_key(headers, text or "")
+
+
+class HeaderStore:
+    """
+    SQLite store of who emailed whom and when, one row per email plus one row
+    per (email, role, address). Built at ingest so participant and date
+    questions can be answered without vector search or the LLM.
+
+    Args:
+        path (str): SQLite file.
+    """
+
+    def __init__(self, path=HEADER_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS emails (
+                id INTEGER PRIMARY KEY,
+                email_key TEXT UNIQUE NOT NULL,
+                source TEXT,
+                thread TEXT,
+                subject TEXT,
+                date TEXT,
+                ts REAL,
+                sender TEXT
+            );
+            CREATE TABLE IF NOT EXISTS participants (
+                email_id INTEGER NOT NULL REFERENCES emails(id) ON DELETE CASCADE,
+                role TEXT NOT NULL,
+                address TEXT NOT NULL,
+                name TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_participants_address ON participants(address, role);
+            CREATE INDEX IF NOT EXISTS idx_participants_email ON participants(email_id);
+            CREATE INDEX IF NOT EXISTS idx_emails_thread ON emails(thread);
+            CREATE INDEX IF NOT EXISTS idx_emails_ts ON emails(ts);
+        """)
+        if "sender" not in {row["name"] for row in self._conn.execute("PRAGMA table_info(emails)")}:
+            # Older stores: filled in as emails are re-recorded (or by build_header_store_from_chroma)
+            self._conn.execute("ALTER TABLE emails ADD COLUMN sender TEXT")
+
+    # -- ingest ----------------------------------------------------------------
+    def record_emails(self, docs):
+        """
+        Upserts the headers of parsed emails (metadata from the indexer).
+
+        Returns:
+            int: Number of emails recorded.
+        """
+        with self._lock, self._conn:
+            for doc in docs:
+                meta = doc.metadata
+                key = metadata_email_key(meta, doc.page_content)
+                parsed = parse_email_date(meta.get("date"))
+                self._conn.execute("""
+                    INSERT INTO emails (email_key, source, thread, subject, date, ts, sender)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(email_key) DO UPDATE SET
+                        source = excluded.source, thread = excluded.thread, subject = excluded.subject,
+                        date = excluded.date, ts = excluded.ts, sender = excluded.sender
+                """, (key, meta.get("source"), meta.get("thread"), meta.get("subject"), meta.get("date"),
+                      parsed.timestamp() if parsed else None, meta.get("from")))
+                email_id = self._conn.execute("SELECT id FROM emails WHERE email_key = ?", (key,)).fetchone()[0]
+                self._conn.execute("DELETE FROM participants WHERE email_id = ?", (email_id,))
+                rows = []
+                for role in ROLES:
+                    for name, address in getaddresses([meta.get(role) or ""]):
+                        if "@" in address:
+                            rows.append((email_id, role, address.lower(), name or None))
+                self._conn.executemany(
+                    "INSERT INTO participants (email_id, role, address, name) VALUES (?, ?, ?, ?)", rows
+                )
+        return len(docs)
+
+    def rename_threads(self, merges):
+        """Applies {old label: new label} thread merges from the thread grouper."""
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE emails SET thread = ? WHERE thread = ?",
+                                   [(new, old) for old, new in merges.items()])
+
+    def delete_emails(self, keys):
+        """
+        Forgets emails (by ``email_key``) and their participants.
+
+        Returns:
+            int: Number of deleted emails.
+        """
+        deleted = 0
+        with self._lock, self._conn:
+            for key in set(keys):
+                row = self._conn.execute("SELECT id FROM emails WHERE email_key = ?", (key,)).fetchone()
+                if row is None:
+                    continue
+                self._conn.execute("DELETE FROM participants WHERE email_id = ?", (row[0],))
+                self._conn.execute("DELETE FROM emails WHERE id = ?", (row[0],))
+                deleted += 1
+        return deleted
+
+    # -- lookups -----------------------------------------------------------------
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params).fetchall()]
+
+    def resolve_person(self, name):
+        """
+        Maps a name or address fragment ("bob", "Bob Smith", "bob@acmecorp.com")
+        to the known addresses it refers to.
+        """
+        name = name.strip().lower()
+        if "@" in name:
+            return [name]
+        rows = self._query(
+            "SELECT DISTINCT address FROM participants "
+            "WHERE address LIKE ? OR address LIKE ? OR LOWER(name) LIKE ?",
+            (f"{name}@%", f"{name}.%@%", f"%{name}%"),
+        )
+        return [row["address"] for row in rows]
+
+    def find_emails(self, sender=None, recipients=None, thread=None, subject_words=None,
+                    start_ts=None, end_ts=None, order="ts DESC", limit=None):
+        """
+        Filters emails by sender addresses, recipient addresses (to/cc/bcc),
+        thread (including its "<thread> [abc123]" siblings), subject words
+        (any match, ranked by how many match) and time.
+        """
+        clauses, params = [], []
+        if sender:
+            clauses.append(f"id IN (SELECT email_id FROM participants WHERE role = 'from' "
+                           f"AND address IN ({','.join('?' * len(sender))}))")
+            params.extend(sender)
+        if recipients:
+            clauses.append(f"id IN (SELECT email_id FROM participants WHERE role IN ('to', 'cc', 'bcc') "
+                           f"AND address IN ({','.join('?' * len(recipients))}))")
+            params.extend(recipients)
+        if thread:
+            condition, thread_params = _thread_condition(thread)
+            clauses.append(condition)
+            params.extend(thread_params)
+        if start_ts is not None:
+            clauses.append("ts >= ?")
+            params.append(start_ts)
+        if end_ts is not None:
+            clauses.append("ts <= ?")
+            params.append(end_ts)
+
+        score = "0"
+        if subject_words:
+            score = " + ".join("(LOWER(subject) LIKE ?)" for _ in subject_words)
+            params = [f"%{w.lower()}%" for w in subject_words] + params
+            clauses.append("score > 0")
+            order = "score DESC, " + order
+
+        sql = f"SELECT *, {score} AS score FROM emails"
+        if clauses:
+            sql = f"SELECT * FROM ({sql}) WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY {order}"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return self._query(sql, params)
+
+    def participants_of(self, email_ids, roles=ROLES):
+        if not email_ids:
+            return []
+        return self._query(
+            f"SELECT email_id, role, address, name FROM participants "
+            f"WHERE email_id IN ({','.join('?' * len(email_ids))}) AND role IN ({','.join('?' * len(roles))})",
+            list(email_ids) + list(roles),
+        )
+
+    def threads(self):
+        return [row["thread"] for row in self._query(
+            "SELECT DISTINCT thread FROM emails WHERE thread IS NOT NULL ORDER BY thread")]
+
+    def senders(self):
+        """Distinct From headers as written in the Chroma metadata (for ``where`` filters)."""
+        return [row["sender"] for row in self._query(
+            "SELECT DISTINCT sender FROM emails WHERE sender IS NOT NULL ORDER BY sender")]
+
+    def time_span(self):
+        """(first, last) email timestamp, or (None, None) when no dated email is recorded."""
+        row = self._query("SELECT MIN(ts) AS first, MAX(ts) AS last FROM emails")[0]
+        return row["first"], row["last"]
+
+    def thread_family(self, thread):
+        """``thread`` plus the recorded "<thread> [abc123]" labels filed under the same name."""
+        condition, params = _thread_condition(thread)
+        rows = self._query(f"SELECT DISTINCT thread FROM emails WHERE {condition}", params)
+        return tuple(sorted({thread, *(row["thread"] for row in rows)}))
+
+    def top_senders(self, thread=None, start_ts=None, end_ts=None, limit=5):
+        """Most frequent senders, optionally within a thread and a time span."""
+        sql = ("SELECT p.address, COUNT(*) AS emails FROM participants p JOIN emails e ON e.id = p.email_id "
+               "WHERE p.role = 'from'")
+        params = []
+        if thread:
+            condition, thread_params = _thread_condition(thread, "e.thread")
+            sql += f" AND {condition}"
+            params.extend(thread_params)
+        if start_ts is not None:
+            sql += " AND e.ts >= ?"
+            params.append(start_ts)
+        if end_ts is not None:
+            sql += " AND e.ts <= ?"
+            params.append(end_ts)
+        sql += " GROUP BY p.address ORDER BY emails DESC LIMIT ?"
+        return self._query(sql, params + [limit])
+
+    def count(self):
+        return self._query("SELECT COUNT(*) AS n FROM emails")[0]["n"]
+
+
+_stores = {}
+
+
+def get_header_store(path=HEADER_STORE_PATH):
+    if path not in _stores:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _stores[path] = HeaderStore(path)
+    return _stores[path]
+
+
+def build_header_store_from_chroma(vectorstore, batch_size=1000):
+    """Backfills the header store from emails that are already indexed."""
+    from langchain.schema import Document
+
+    collection = vectorstore._collection
+    store = get_header_store()
+    recorded = 0
+    for offset in range(0, collection.count(), batch_size):
+        page = collection.get(limit=batch_size, offset=offset, include=["documents", "metadatas"])
+        docs = [Document(page_content=text or "", metadata=meta or {})
+                for text, meta in zip(page["documents"], page["metadatas"])]
+        recorded += store.record_emails(docs)
+    print(f"✅ Recorded headers of {recorded} email(s) in {store.path}")
+    return recorded
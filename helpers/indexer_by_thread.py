@@ -1,27 +1,63 @@
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain_community.llms import Ollama
-from langchain.prompts import PromptTemplate
-from langchain.schema import Document
 import os
 import glob
 import datetime
 import hashlib
 import time
+from helpers.config import (
+    DB_DIRECTORY,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_MAX_BYTES,
+    EMBEDDING_MODEL_NAME,
+    NEAR_DUPLICATE_REPORT_PATH,
+    NEAR_DUPLICATE_SAME_THREAD,
+    NEAR_DUPLICATE_THRESHOLD,
+    THREAD_INDEX_PATH
+)
+from helpers.header_store import get_header_store, parse_email_date
+from helpers.thread_reconstruction import ThreadGrouper, apply_thread_merges, email_key
+
+# LangChain, numpy and the embedding model are imported inside the functions
+# that need them, so importing this module stays fast.
+_embedding_caches = {}
 
 
 # 1. Setup: Embedding + Chroma
-def get_embedding_model(model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+def get_embedding_cache(model_name: str = EMBEDDING_MODEL_NAME):
     """
-    Returns a HuggingFace embedding model instance.
+    Returns the shared on-disk embedding cache for a model.
 
     Args:
         model_name (str): Name of the HuggingFace sentence transformer model.
 
     Returns:
-        HuggingFaceEmbeddings: An initialized embedding model.
+        EmbeddingCache: Cache keyed by (model ID, text hash).
+    """
+    if model_name not in _embedding_caches:
+        from helpers.embedding_cache import EmbeddingCache
+
+        _embedding_caches[model_name] = EmbeddingCache(EMBEDDING_CACHE_DIR, model_name, EMBEDDING_CACHE_MAX_BYTES)
+    return _embedding_caches[model_name]
+
+
+def get_embedding_model(model_name: str = EMBEDDING_MODEL_NAME):
     """
-    return HuggingFaceEmbeddings(model_name=model_name)
+    Returns a HuggingFace embedding model instance that reuses cached vectors.
+
+    Args:
+        model_name (str): Name of the HuggingFace sentence transformer model.
+
+    Returns:
+        CachedEmbeddings: An initialized embedding model backed by the cache.
+    """
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    from helpers.embedding_cache import CachedEmbeddings
+
+    return CachedEmbeddings(HuggingFaceEmbeddings(model_name=model_name), get_embedding_cache(model_name))
+
+
+def embedding_cache_stats(model_name: str = EMBEDDING_MODEL_NAME):
+    """Returns hit/miss counters and on-disk size of the embedding cache."""
+    return get_embedding_cache(model_name).stats()
 
 
 def get_vectorstore(db_directory: str):
@@ -34,7 +70,9 @@ def get_vectorstore(db_directory: str):
     Returns:
         Chroma: Configured vectorstore instance.
     """
-    embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+    from langchain_community.vectorstores import Chroma
+
+    embedding_model = get_embedding_model()
     
     vectorstore = Chroma(
         persist_directory=db_directory,
@@ -46,6 +84,8 @@ def get_vectorstore(db_directory: str):
 # 2. Load and parse emails from .txt files
 
 def parse_email_file2(filepath):
+    from langchain.schema import Document
+
     with open(filepath, 'r') as f:
         raw = f.read()
 
@@ -69,6 +109,8 @@ def parse_email_file2(filepath):
     )
 
 def parse_email(file_path):
+    from langchain.schema import Document
+
     with open(file_path, "r", encoding="utf-8") as f:
         raw = f.read()
 
@@ -97,10 +139,7 @@ def parse_email(file_path):
     )
 
 
-def parse_email_r(file_path, email_dir):
-    with open(file_path, "r", encoding="utf-8") as f:
-        raw = f.read()
-
+def _split_headers_and_trail(raw):
     lines = raw.splitlines()
     headers, body = {}, []
     in_body = False
@@ -119,30 +158,259 @@ def parse_email_r(file_path, email_dir):
     body_text = "\n".join(body)
     segments = body_text.split("\n---\n")
     reordered_body = "\n---\n".join(reversed(segments))  # latest reply first
+    return headers, reordered_body.strip()
+
+
+def _email_metadata(headers, source, thread):
+    from helpers.time_partitions import time_metadata
+
+    return {
+        "from": headers.get("from"),
+        "to": headers.get("to"),
+        "cc": headers.get("cc", ""),
+        "bcc": headers.get("bcc", ""),
+        "subject": headers.get("subject"),
+        "date": headers.get("date"),
+        "message_id": headers.get("message-id", ""),
+        "in_reply_to": headers.get("in-reply-to", ""),
+        "references": headers.get("references", ""),
+        "source": source,
+        "thread": thread,
+        **time_metadata(headers.get("date"))
+    }
+
+
+def parse_email_r(file_path, email_dir):
+    from langchain.schema import Document
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        raw = f.read()
 
+    headers, body = _split_headers_and_trail(raw)
     return Document(
-        page_content=reordered_body.strip(),
-        metadata={
-            "from": headers.get("from"),
-            "to": headers.get("to"),
-            "subject": headers.get("subject"),
-            "date": headers.get("date"),
-            "source": os.path.basename(file_path),
-            "thread": email_dir
-        }
+        page_content=body,
+        metadata=_email_metadata(headers, os.path.basename(file_path), email_dir)
     )
 
 
+def _message_body(message):
+    """Plain-text body of a ``mailbox`` / ``email`` message."""
+    parts = message.walk() if message.is_multipart() else [message]
+    for part in parts:
+        if part.get_content_type() == "text/plain" and not part.is_multipart():
+            payload = part.get_payload(decode=True) or b""
+            return payload.decode(part.get_content_charset() or "utf-8", errors="replace")
+    return ""
+
+
+def parse_mbox(file_path, email_dir):
+    """
+    Parses every message of an mbox file. Sources are "<file>#<n>" so each
+    message stays distinguishable in results.
+    """
+    import mailbox
+    from langchain.schema import Document
+
+    docs = []
+    for i, message in enumerate(mailbox.mbox(file_path, create=False)):
+        headers = {key.lower(): str(value) for key, value in message.items()}
+        body = "\n---\n".join(reversed(_message_body(message).split("\n---\n"))).strip()
+        docs.append(Document(
+            page_content=body,
+            metadata=_email_metadata(headers, f"{os.path.basename(file_path)}#{i}", email_dir)
+        ))
+    return docs
+
+
+def delete_indexed_paths(vectorstore, paths):
+    """
+    Removes the emails parsed from the given files (matched on the "path"
+    metadata set by the folder watcher): their vectors, header-store rows and
+    thread-grouper entries. When a deleted email was the representative of
+    collapsed near-duplicates, the earliest surviving duplicate is embedded
+    in its place.
+
+    Returns:
+        int: Number of deleted vectors.
+    """
+    from langchain.schema import Document
+    from helpers.header_store import metadata_email_key
+    from helpers.near_duplicates import get_duplicate_index
+    from helpers.quantized_index import update_quantized_index
+    from helpers.time_partitions import month_key, refresh_time_partitions
+
+    collection = vectorstore._collection
+    duplicate_index = get_duplicate_index()
+    deleted_ids, months = [], set()
+    # Near-duplicates were never embedded, so their keys come from the duplicate index
+    keys = set(duplicate_index.keys_for_paths(paths))
+    for path in paths:
+        found = collection.get(where={"path": path}, include=["metadatas", "documents"])
+        if found["ids"]:
+            collection.delete(ids=found["ids"])
+            deleted_ids.extend(found["ids"])
+            months.update(month_key((m or {}).get("timestamp")) for m in found["metadatas"])
+            keys.update(metadata_email_key(m or {}, text) for m, text in zip(found["metadatas"], found["documents"]))
+
+    get_header_store().delete_emails(keys)
+    with get_thread_grouper() as grouper:
+        for key in keys:
+            grouper.remove_email(key)
+
+    promoted, touched = duplicate_index.remove_paths(paths)
+    added_ids = []
+    if promoted:
+        docs = [Document(page_content=text, metadata=metadata) for text, metadata in promoted]
+        added_ids = vectorstore.add_documents(docs)
+        print(f"🧬 Promoted {len(docs)} near-duplicate(s) of deleted representative(s)")
+    refresh_duplicate_metadata(vectorstore, touched)
+    update_quantized_index(collection, added_ids=added_ids, removed_ids=deleted_ids)
+    refresh_time_partitions(collection, added_ids=added_ids, removed_ids=deleted_ids, months=months)
+    return len(deleted_ids)
+
+
+def get_thread_grouper():
+    """
+    Locks and loads the persistent conversation index used to assign thread
+    labels; use as ``with get_thread_grouper() as grouper:`` (saved on exit).
+    """
+    return ThreadGrouper.locked(THREAD_INDEX_PATH)
+
+
+def assign_threads(docs, vectorstore, preferred_label=None):
+    """
+    Sets each document's "thread" from Message-ID / In-Reply-To / References,
+    falling back to normalised subject + participant overlap. Conversations
+    that new mail joins together are relabelled in the vectorstore as well.
+
+    Args:
+        docs (list[Document]): Parsed emails (metadata from ``_email_metadata``).
+        vectorstore (Chroma): Store holding previously indexed emails.
+        preferred_label (str): Label for conversations that start in this batch
+            (made unique per conversation by the grouper).
+    """
+    from helpers.near_duplicates import get_duplicate_index
+    from helpers.quantized_index import rename_quantized_threads
+    from helpers.time_partitions import rename_partition_threads
+
+    # Held until the merges are applied, so a concurrent ingest sees the relabelled stores
+    with get_thread_grouper() as grouper:
+        keyed = []
+        for doc in docs:
+            headers = {
+                "from": doc.metadata.get("from"),
+                "to": doc.metadata.get("to"),
+                "cc": doc.metadata.get("cc"),
+                "subject": doc.metadata.get("subject"),
+                "date": doc.metadata.get("date"),
+                "message-id": doc.metadata.get("message_id"),
+                "in-reply-to": doc.metadata.get("in_reply_to"),
+                "references": doc.metadata.get("references"),
+            }
+            keyed.append((email_key(headers, doc.page_content), headers, doc))
+
+        # Oldest first (by parsed date, undated last), so a conversation is labelled after its first message
+        def sent_at(item):
+            parsed = parse_email_date(item[1]["date"])
+            return (parsed is None, parsed.timestamp() if parsed else 0.0)
+
+        for key, headers, _ in sorted(keyed, key=sent_at):
+            grouper.add_email(key, headers, preferred_label)
+
+        # Labels are read back after the whole batch, so merges inside it are applied
+        for key, _, doc in keyed:
+            doc.metadata["thread"] = grouper.thread_of(key)
+
+        merges = grouper.pop_merges()
+        apply_thread_merges(vectorstore, merges)
+        get_header_store().rename_threads(merges)
+        get_duplicate_index().rename_threads(merges)
+        rename_partition_threads(merges)
+        rename_quantized_threads(merges)
+    print(f"🧵 Grouped {len(docs)} email(s) into {len({d.metadata['thread'] for d in docs})} thread(s)")
+
+
+def collapse_duplicates(docs, threshold=NEAR_DUPLICATE_THRESHOLD, vectorstore=None):
+    """
+    Drops near-identical emails (MinHash/LSH over the bodies, across threads
+    unless EMAIL_RAG_NEAR_DUPLICATE_SAME_THREAD is set) before embedding,
+    keeping one representative per cluster. New mail is also compared with
+    the signatures of everything indexed before; representatives in
+    ``vectorstore`` that gain duplicates get their metadata updated.
+    A threshold of 0 disables it.
+    """
+    if not threshold:
+        return docs
+    from helpers.near_duplicates import collapse_near_duplicates, get_duplicate_index
+
+    kept, report = collapse_near_duplicates(docs, threshold=threshold, report_path=NEAR_DUPLICATE_REPORT_PATH,
+                                            index=get_duplicate_index(), same_thread=NEAR_DUPLICATE_SAME_THREAD)
+    if vectorstore is not None:
+        refresh_duplicate_metadata(vectorstore, {r["representative_key"] for r in report if r.get("existing")})
+    return kept
+
+
+def refresh_duplicate_metadata(vectorstore, representative_keys):
+    """Rewrites ``duplicate_sources`` / ``duplicate_count`` of embedded representatives."""
+    from helpers.near_duplicates import get_duplicate_index
+
+    index = get_duplicate_index()
+    collection = vectorstore._collection
+    for key in representative_keys:
+        found = collection.get(where={"email_key": key}, include=["metadatas"])
+        if not found["ids"]:
+            continue
+        duplicates = index.duplicate_metadata(key)
+        collection.update(ids=found["ids"], metadatas=[dict(m or {}, **duplicates) for m in found["metadatas"]])
+
+
+def index_documents(docs, preferred_label=None, group_threads=True, dedupe_threshold=NEAR_DUPLICATE_THRESHOLD,
+                    vectorstore=None):
+    """
+    Threads, records, de-duplicates and embeds parsed emails.
+
+    Args:
+        docs (list[Document]): Parsed emails (metadata from ``_email_metadata``).
+        preferred_label (str): Label for conversations that start in this batch.
+        group_threads (bool): Assign threads from the headers.
+        dedupe_threshold (float): Near-duplicate threshold, 0 disables it.
+        vectorstore (Chroma): Target store (defaults to DB_DIRECTORY).
+
+    Returns:
+        list[str]: Thread labels of the indexed emails.
+    """
+    if not docs:
+        return []
+    vectorstore = vectorstore or get_vectorstore(DB_DIRECTORY)
+    if group_threads:
+        assign_threads(docs, vectorstore, preferred_label=preferred_label)
+    threads = sorted({doc.metadata["thread"] for doc in docs})
+    # Headers of every email, including near-duplicates that are not embedded
+    get_header_store().record_emails(docs)
+    docs = collapse_duplicates(docs, dedupe_threshold, vectorstore=vectorstore)
+    ids = vectorstore.add_documents(docs) if docs else []
+    vectorstore.persist()
+    # Newly indexed mail must be searchable through the quantized index too
+    from helpers.quantized_index import update_quantized_index
+
+    update_quantized_index(vectorstore._collection, added_ids=ids)
+    print(f"✅ Indexed {len(docs)} email(s) with trail into Chroma.")
+    print(f"📦 Embedding cache: {embedding_cache_stats()}")
+    # Appended to the monthly segments too, when time partitions are built
+    from helpers.time_partitions import refresh_time_partitions
+
+    refresh_time_partitions(vectorstore._collection, added_ids=ids)
+    return threads
+
+
 # 3. Index all emails from a directory
-def index_email_directory(email_dir):
+def index_email_directory(email_dir, group_threads=True, dedupe_threshold=NEAR_DUPLICATE_THRESHOLD):
     txt_files = glob.glob(os.path.join(email_dir, "*.txt"))
     txt_files = [f for f in txt_files if not f.endswith("-parsed.txt")]
     docs = [parse_email_r(fp, email_dir) for fp in txt_files]
-    vectorstore = get_vectorstore("chroma_email_db_3")
-    # print(docs)
-    vectorstore.add_documents(docs)
-    vectorstore.persist()
-    print(f"✅ Indexed {len(docs)} email(s) with trail into Chroma.")
+    # The folder name labels the conversations that start in it
+    return index_documents(docs, preferred_label=os.path.basename(os.path.normpath(email_dir)),
+                           group_threads=group_threads, dedupe_threshold=dedupe_threshold)
 
 def generate_sha256_timestamp():
     """Generate SHA-256 hash using current timestamp"""
@@ -150,49 +418,27 @@ def generate_sha256_timestamp():
     return hashlib.sha256(timestamp).hexdigest()
 
 def parse_email_from_uploaded(file, email_dir="emails"):
+    from langchain.schema import Document
+
     file.seek(0)
     raw = file.read().decode("utf-8")
-    lines = raw.splitlines()
-    headers, body = {}, []
-    in_body = False
-    for line in lines:
-        if line.strip() == "":
-            in_body = True
-            continue
-        if not in_body:
-            if ":" in line:
-                key, val = line.split(":", 1)
-                headers[key.strip().lower()] = val.strip()
-        else:
-            body.append(line)
-
-    # Reverse trail logic: split by quote markers and reorder
-    body_text = "\n".join(body)
-    segments = body_text.split("\n---\n")
-    reordered_body = "\n---\n".join(reversed(segments))  # latest reply first
 
+    headers, body = _split_headers_and_trail(raw)
     return Document(
-        page_content=reordered_body.strip(),
-        metadata={
-            "from": headers.get("from"),
-            "to": headers.get("to"),
-            "subject": headers.get("subject"),
-            "date": headers.get("date"),
-            "source": os.path.basename(file.name),
-            "thread": email_dir
-        }
+        page_content=body,
+        metadata=_email_metadata(headers, os.path.basename(file.name), email_dir)
     )
 
 
 # 3. Index all emails from a directory
-def index_email_uploaded(txt_files,email_dir):
-    if not email_dir:
-        email_dir = generate_sha256_timestamp()
+def index_email_uploaded(txt_files,email_dir, dedupe_threshold=NEAR_DUPLICATE_THRESHOLD):
+    """
+    Indexes uploaded files. Emails are grouped into conversations from their
+    headers; a typed thread name (email_dir) labels conversations that start
+    in this upload, while replies to already indexed mail join that thread.
+    """
     docs = [parse_email_from_uploaded(fp, email_dir) for fp in txt_files]
-    vectorstore = get_vectorstore("chroma_email_db_3")
-    vectorstore.add_documents(docs)
-    vectorstore.persist()
-    print(f"✅ Indexed {len(docs)} email(s) with trail into Chroma.")
+    return index_documents(docs, preferred_label=email_dir or None, dedupe_threshold=dedupe_threshold)
 
 # -----------------------------
 # Run: Index and Query Example
@@ -0,0 +1,462 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+
+import numpy as np
+from helpers.config import NEAR_DUPLICATE_INDEX_PATH
+from helpers.header_store import metadata_email_key, parse_email_date
+
+MATCH_ANY_THREAD = object()  # DuplicateIndex.match without a thread restriction
+# What the signatures are computed from; recorded in the index so older ones can be recognised
+SIGNATURE_TEXT = "body"
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def shingles(text, size=5):
+    """Hashes of the overlapping ``size``-word shingles of a text."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))}
+    return {zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)}
+
+
+def lsh_params(num_perm, threshold):
+    """
+    Picks (bands, rows) with bands * rows == num_perm whose S-curve midpoint
+    (1 / bands) ** (1 / rows) is closest to the similarity threshold.
+    """
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(options, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+
+class MinHasher:
+    """MinHash signatures with ``num_perm`` universal hash functions."""
+
+    def __init__(self, num_perm=128, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_hashes):
+        x = np.fromiter(shingle_hashes, dtype=np.uint64)[:, None]
+        # a, x < 2**32 so a * x + b fits in uint64 before the modulus
+        hashes = ((x * self.a + self.b) % _MERSENNE_PRIME) & _MAX_HASH
+        return hashes.min(axis=0)
+
+
+def minhash_signatures(texts, num_perm=128):
+    """MinHash signatures of texts' shingles, one row per text."""
+    hasher = MinHasher(num_perm)
+    return np.stack([hasher.signature(shingles(t)) for t in texts])
+
+
+def find_near_duplicate_clusters(texts, threshold=0.9, num_perm=128, groups=None, signatures=None):
+    """
+    Clusters texts whose estimated Jaccard similarity is at least ``threshold``.
+
+    Candidates come from LSH buckets over banded MinHash signatures and are
+    confirmed against the signature agreement before being joined with a
+    union-find.
+
+    Args:
+        texts (list[str]): Texts to compare.
+        threshold (float): Minimum estimated Jaccard similarity (0-1).
+        num_perm (int): MinHash permutations; more is slower but more precise.
+        groups (list): Optional group key per text; only texts in the same
+            group are compared (e.g. the thread).
+        signatures (np.ndarray): Precomputed ``minhash_signatures`` of the texts.
+
+    Returns:
+        list[list[int]]: Clusters of text indices with more than one member.
+    """
+    if not texts:
+        return []
+    if signatures is None:
+        signatures = minhash_signatures(texts, num_perm)
+    num_perm = signatures.shape[1]
+    bands, rows = lsh_params(num_perm, threshold)
+    groups = groups or [None] * len(texts)
+
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(bands):
+        buckets = {}
+        chunk = signatures[:, band * rows:(band + 1) * rows]
+        for i, row in enumerate(chunk):
+            buckets.setdefault((groups[i], row.tobytes()), []).append(i)
+        for members in buckets.values():
+            first = members[0]
+            for other in members[1:]:
+                root_a, root_b = find(first), find(other)
+                if root_a == root_b:
+                    continue
+                if np.mean(signatures[first] == signatures[other]) >= threshold:
+                    parent[root_b] = root_a
+
+    clusters = {}
+    for i in range(len(texts)):
+        clusters.setdefault(find(i), []).append(i)
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+def _sent_at(date):
+    """Sort key: oldest first, undated last."""
+    parsed = parse_email_date(date)
+    return (parsed is None, parsed.timestamp() if parsed else 0.0)
+
+
+def collapse_near_duplicates(docs, threshold=0.9, report_path=None, index=None, same_thread=False):
+    """
+    Keeps one representative per cluster of near-identical emails.
+
+    The representative is the earliest email of its cluster. The others are
+    not embedded. Their sources are attached to the representative as
+    ``duplicate_sources`` and counted in ``duplicate_count``. Only the bodies
+    are compared: a forward or re-send changes the subject ("FW: ...") and
+    usually lands in another thread, so by default emails are compared
+    across threads. ``same_thread`` restricts clusters to one thread, so
+    thread-scoped queries still see every conversation.
+
+    With a ``DuplicateIndex``, new mail is also checked against everything
+    indexed before: a match joins the already embedded representative (which
+    stays the representative even if the new mail is older). Every email is
+    recorded in the index, so a duplicate can be promoted when its
+    representative is deleted.
+
+    Args:
+        docs (list[Document]): Parsed emails.
+        threshold (float): Minimum estimated Jaccard similarity to collapse.
+        report_path (str): Optional JSON file the collapse report is appended to.
+        index (DuplicateIndex): Optional persistent signature index.
+        same_thread (bool): Only collapse emails of the same thread.
+
+    Returns:
+        tuple: (documents to index, report list of collapsed clusters). Report
+        entries with ``"existing": True`` joined an already indexed
+        representative, identified by ``representative_key``.
+    """
+    if not docs:
+        return [], []
+    texts = [d.page_content for d in docs]
+    threads = [d.metadata.get("thread") for d in docs]
+    signatures = minhash_signatures(texts)
+    clusters = find_near_duplicate_clusters(texts, threshold=threshold, groups=threads if same_thread else None,
+                                            signatures=signatures)
+    keys = [metadata_email_key(d.metadata, d.page_content) for d in docs]
+
+    clustered = {i for members in clusters for i in members}
+    clusters += [[i] for i in range(len(docs)) if i not in clustered]
+    dropped = set()
+    report = []
+    for members in clusters:
+        members.sort(key=lambda i: _sent_at(docs[i].metadata.get("date")))
+        first = members[0]
+        existing = None
+        if index is not None:
+            existing = index.match(signatures[first], threads[first] if same_thread else MATCH_ANY_THREAD,
+                                   threshold, exclude=keys[first])
+        if existing is not None:
+            # Already embedded: the whole cluster becomes duplicates of the indexed representative
+            for i in members:
+                index.add(keys[i], docs[i], signatures[i], representative=existing)
+            dropped.update(members)
+            report.append({
+                "thread": threads[first],
+                "representative": index.source_of(existing),
+                "representative_key": existing,
+                "existing": True,
+                "members": [docs[i].metadata.get("source") for i in members],
+            })
+            continue
+
+        representative, others = docs[first], [docs[i] for i in members[1:]]
+        if index is not None:
+            # Lets the representative be found again when its duplicates change
+            representative.metadata["email_key"] = keys[first]
+            index.add(keys[first], representative, signatures[first])
+            for i in members[1:]:
+                index.add(keys[i], docs[i], signatures[i], representative=keys[first])
+        if not others:
+            continue
+        representative.metadata["duplicate_sources"] = ", ".join(d.metadata.get("source") or "" for d in others)
+        representative.metadata["duplicate_count"] = len(others)
+        dropped.update(members[1:])
+        report.append({
+            "thread": threads[first],
+            "representative": representative.metadata.get("source"),
+            "members": [d.metadata.get("source") for d in others],
+        })
+
+    kept = [doc for i, doc in enumerate(docs) if i not in dropped]
+    if report:
+        print(f"🧬 Collapsed {len(dropped)} near-duplicate email(s) into {len(report)} representative(s) "
+              f"(threshold {threshold})")
+        if report_path:
+            _append_report(report_path, threshold, report)
+    return kept, report
+
+
+def _append_report(report_path, threshold, report):
+    existing = []
+    if os.path.exists(report_path):
+        with open(report_path) as f:
+            existing = json.load(f)
+    existing.append({
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "threshold": threshold,
+        "clusters": report,
+    })
+    os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+    with open(report_path, "w") as f:
+        json.dump(existing, f, indent=2)
+
+
+class DuplicateIndex:
+    """
+    SQLite record of every ingested email's MinHash signature and, for emails
+    that were not embedded, the representative they were collapsed into.
+
+    LSH band buckets make new mail comparable with everything indexed before.
+    Dropped duplicates keep their text and metadata, so one of them can be
+    embedded in place of a deleted representative.
+
+    Args:
+        path (str): SQLite file.
+    """
+
+    def __init__(self, path=NEAR_DUPLICATE_INDEX_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS emails (
+                email_key TEXT PRIMARY KEY,
+                thread TEXT,
+                source TEXT,
+                path TEXT,
+                date TEXT,
+                signature BLOB NOT NULL,
+                representative TEXT,
+                document TEXT,
+                metadata TEXT
+            );
+            CREATE TABLE IF NOT EXISTS buckets (
+                band INTEGER NOT NULL,
+                bucket BLOB NOT NULL,
+                email_key TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE INDEX IF NOT EXISTS idx_buckets ON buckets(band, bucket);
+            CREATE INDEX IF NOT EXISTS idx_buckets_email ON buckets(email_key);
+            CREATE INDEX IF NOT EXISTS idx_emails_path ON emails(path);
+            CREATE INDEX IF NOT EXISTS idx_emails_representative ON emails(representative);
+        """)
+        with self._conn:
+            recorded = self._conn.execute("SELECT value FROM meta WHERE key = 'signature_text'").fetchone()
+            if recorded is None:
+                if self._conn.execute("SELECT 1 FROM emails LIMIT 1").fetchone():
+                    # Older signatures covered subject + body, so re-sent copies match them less well
+                    print(f"⚠️ {path} was built from subject+body signatures; new mail is signed on the body only")
+                self._conn.execute("INSERT INTO meta (key, value) VALUES ('signature_text', ?)", (SIGNATURE_TEXT,))
+
+    # -- LSH buckets -------------------------------------------------------------------
+    def _banding(self, num_perm, threshold):
+        """(bands, rows) for the threshold; buckets are rebuilt when it changes."""
+        bands, rows = lsh_params(num_perm, threshold)
+        current = self._conn.execute("SELECT value FROM meta WHERE key = 'banding'").fetchone()
+        if current is None or current[0] != f"{bands}x{rows}":
+            with self._conn:
+                self._conn.execute("DELETE FROM buckets")
+                for row in self._conn.execute("SELECT email_key, signature FROM emails").fetchall():
+                    self._insert_buckets(row["email_key"], np.frombuffer(row["signature"], dtype=np.uint64),
+                                         bands, rows)
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('banding', ?)",
+                                   (f"{bands}x{rows}",))
+        return bands, rows
+
+    def _insert_buckets(self, key, signature, bands, rows):
+        self._conn.executemany(
+            "INSERT INTO buckets (band, bucket, email_key) VALUES (?, ?, ?)",
+            [(band, signature[band * rows:(band + 1) * rows].tobytes(), key) for band in range(bands)],
+        )
+
+    # -- ingest ------------------------------------------------------------------------
+    def match(self, signature, thread, threshold, exclude=None):
+        """
+        Finds an indexed email whose estimated Jaccard similarity is at least
+        ``threshold``: in the same thread, or in any thread when ``thread`` is
+        ``MATCH_ANY_THREAD``.
+
+        Returns:
+            str | None: Email key of the embedded representative it belongs to.
+        """
+        with self._lock:
+            bands, rows = self._banding(len(signature), threshold)
+            candidates = set()
+            for band in range(bands):
+                bucket = signature[band * rows:(band + 1) * rows].tobytes()
+                if thread is MATCH_ANY_THREAD:
+                    found = self._conn.execute("SELECT email_key FROM buckets WHERE band = ? AND bucket = ?",
+                                               (band, bucket)).fetchall()
+                else:
+                    found = self._conn.execute(
+                        "SELECT b.email_key FROM buckets b JOIN emails e ON e.email_key = b.email_key "
+                        "WHERE b.band = ? AND b.bucket = ? AND e.thread IS ?",
+                        (band, bucket, thread),
+                    ).fetchall()
+                candidates.update(row[0] for row in found)
+            candidates.discard(exclude)
+            best, best_rank = None, None
+            for key in sorted(candidates):
+                row = self._conn.execute("SELECT signature, representative, date FROM emails WHERE email_key = ?",
+                                         (key,)).fetchone()
+                stored = np.frombuffer(row["signature"], dtype=np.uint64)
+                if len(stored) != len(signature):
+                    continue
+                score = float(np.mean(stored == signature))
+                if score < threshold or row["representative"] == exclude:
+                    continue
+                # Most similar first; ties go to the earliest email
+                sent = _sent_at(row["date"])
+                rank = (-score, sent[0], sent[1])
+                if best_rank is None or rank < best_rank:
+                    best, best_rank = row["representative"] or key, rank
+            return best
+
+    def add(self, key, doc, signature, representative=None):
+        """
+        Records an email. Duplicates (``representative`` set) keep their text
+        and metadata so they can be promoted later.
+        """
+        meta = doc.metadata
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM buckets WHERE email_key = ?", (key,))
+            if representative:
+                # A former representative hands its own duplicates on
+                self._conn.execute("UPDATE emails SET representative = ? WHERE representative = ?",
+                                   (representative, key))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO emails (email_key, thread, source, path, date, signature, representative, "
+                "document, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, meta.get("thread"), meta.get("source"), meta.get("path"), meta.get("date"),
+                 np.asarray(signature, dtype=np.uint64).tobytes(), representative,
+                 doc.page_content if representative else None,
+                 json.dumps(meta) if representative else None),
+            )
+            banding = self._conn.execute("SELECT value FROM meta WHERE key = 'banding'").fetchone()
+            if banding is not None:
+                bands, rows = (int(n) for n in banding[0].split("x"))
+                self._insert_buckets(key, np.asarray(signature, dtype=np.uint64), bands, rows)
+
+    def rename_threads(self, merges):
+        """Applies {old label: new label} thread merges from the thread grouper."""
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE emails SET thread = ? WHERE thread = ?",
+                                   [(new, old) for old, new in merges.items()])
+
+    # -- lookups -----------------------------------------------------------------------
+    def source_of(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT source FROM emails WHERE email_key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def duplicates_of(self, key):
+        """Sources of the emails collapsed into a representative, oldest first."""
+        with self._lock:
+            rows = self._conn.execute("SELECT source, date FROM emails WHERE representative = ?", (key,)).fetchall()
+        return [row["source"] or "" for row in sorted(rows, key=lambda r: _sent_at(r["date"]))]
+
+    def duplicate_metadata(self, key):
+        """``duplicate_sources`` / ``duplicate_count`` metadata of a representative."""
+        sources = self.duplicates_of(key)
+        return {"duplicate_sources": ", ".join(sources), "duplicate_count": len(sources)}
+
+    # -- deletion ------------------------------------------------------------------------
+    def keys_for_paths(self, paths):
+        """Email keys of everything recorded from the given files, embedded or not."""
+        paths = list(paths)
+        if not paths:
+            return []
+        with self._lock:
+            rows = self._conn.execute(f"SELECT email_key FROM emails WHERE path IN ({','.join('?' * len(paths))})",
+                                      paths).fetchall()
+        return [row[0] for row in rows]
+
+    def remove_paths(self, paths):
+        """
+        Forgets the emails parsed from the given files. A deleted
+        representative with surviving duplicates hands over to the earliest
+        of them, which must then be embedded.
+
+        Returns:
+            tuple: (promoted, touched) where promoted is a list of
+            (page_content, metadata) to embed and touched the keys of
+            representatives whose duplicate list changed.
+        """
+        paths = list(paths)
+        if not paths:
+            return [], set()
+        promoted, touched = [], set()
+        with self._lock, self._conn:
+            marks = ",".join("?" * len(paths))
+            removed = self._conn.execute(f"SELECT * FROM emails WHERE path IN ({marks})", paths).fetchall()
+            removed_keys = {row["email_key"] for row in removed}
+            for row in removed:
+                if row["representative"]:
+                    touched.add(row["representative"])
+                    continue
+                survivors = [r for r in self._conn.execute(
+                    "SELECT * FROM emails WHERE representative = ?", (row["email_key"],)
+                ).fetchall() if r["email_key"] not in removed_keys]
+                if not survivors:
+                    continue
+                survivors.sort(key=lambda r: _sent_at(r["date"]))
+                heir = survivors[0]
+                self._conn.execute("UPDATE emails SET representative = ? WHERE representative = ?",
+                                   (heir["email_key"], row["email_key"]))
+                self._conn.execute(
+                    "UPDATE emails SET representative = NULL, document = NULL, metadata = NULL WHERE email_key = ?",
+                    (heir["email_key"],))
+                metadata = json.loads(heir["metadata"])
+                metadata.update(thread=heir["thread"], email_key=heir["email_key"])
+                promoted.append((heir["document"], metadata))
+            self._conn.executemany("DELETE FROM buckets WHERE email_key = ?", [(key,) for key in removed_keys])
+            self._conn.execute(f"DELETE FROM emails WHERE path IN ({marks})", paths)
+        touched -= removed_keys
+        for _, metadata in promoted:
+            metadata.pop("duplicate_sources", None)
+            metadata.pop("duplicate_count", None)
+            duplicates = self.duplicate_metadata(metadata["email_key"])
+            if duplicates["duplicate_count"]:
+                metadata.update(duplicates)
+        return promoted, touched
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM emails").fetchone()[0]
+
+
+_indexes = {}
+
+
+def get_duplicate_index(path=NEAR_DUPLICATE_INDEX_PATH):
+    if path not in _indexes:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _indexes[path] = DuplicateIndex(path)
+    return _indexes[path]
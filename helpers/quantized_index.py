@@ -0,0 +1,492 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+QUANTIZED_FORMAT_VERSION = 2
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _fit_pca(vectors, dim, sample_size=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    else:
+        sample = np.asarray(vectors)
+    mean = sample.mean(axis=0)
+    _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+    return mean.astype(np.float32), vt[:dim].T.astype(np.float32)
+
+
+def _map_rows(path, dtype, shape):
+    """Read-only memory map of the first ``shape[0]`` rows of a raw array file."""
+    if not shape[0] or not os.path.exists(path):
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+def _append_rows(path, array, count):
+    """Appends rows after the first ``count`` ones, dropping leftovers of an interrupted append."""
+    array = np.ascontiguousarray(array)
+    row_bytes = array.itemsize * int(np.prod(array.shape[1:], dtype=np.int64))
+    with open(path, "ab") as f:
+        f.truncate(count * row_bytes)
+        f.write(array.tobytes())
+
+
+def _write_json(path, payload):
+    with open(path + ".tmp", "w") as f:
+        json.dump(payload, f)
+    os.replace(path + ".tmp", path)
+
+
+@contextmanager
+def _write_lock(index_dir):
+    """Serialises writers (ingest in several processes) on one index directory."""
+    import fcntl
+
+    with open(os.path.join(index_dir, ".lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class QuantizedIndex:
+    """
+    Compressed search over email vectors with exact rescoring.
+
+    Vectors are (optionally) PCA-reduced and then stored either as int8 codes
+    with a per-row scale or as packed sign bits. A query first scans the
+    compressed codes to build a shortlist of ``k * shortlist_factor``
+    candidates, which are then rescored with the full-precision float32
+    vectors. Codes and vectors are raw files read through memory maps, so
+    worker processes share one copy through the page cache.
+
+    The index is append-only: newly indexed mail is encoded with the stored
+    PCA basis and appended, and removed or re-indexed emails are marked
+    deleted. The manifest is written last, so readers (which reload when it
+    changes) only ever map complete rows.
+
+    Scores are cosine similarities (vectors are L2-normalised at build time).
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self._manifest_stamp = None
+        self._load_state()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def code_bytes(self):
+        """Bytes of compressed codes scanned per query (memory-mapped, shared between processes)."""
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    @property
+    def full_bytes(self):
+        """Bytes of the full-precision rescoring vectors (memory-mapped; only shortlisted rows are read)."""
+        return self.full.nbytes
+
+    def _path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    # -- build / load ----------------------------------------------------------
+    @classmethod
+    def build(cls, index_dir, ids, vectors, threads=None, mode="int8", pca_dim=None):
+        """
+        Builds and saves an index.
+
+        Args:
+            index_dir (str): Output directory.
+            ids (list[str]): Chroma ids, one per vector.
+            vectors (array-like): float32 vectors (may be a memmap).
+            threads (list[str]): Thread label per vector, used for filtering.
+            mode (str): "int8" or "binary".
+            pca_dim (int): Keep this many PCA dimensions for the codes
+                (None keeps all).
+
+        Returns:
+            QuantizedIndex: The loaded index.
+        """
+        if mode not in ("int8", "binary"):
+            raise ValueError(f"Unsupported quantisation mode: {mode}")
+        os.makedirs(index_dir, exist_ok=True)
+        full = _normalize(vectors)
+
+        mean, components = None, None
+        if pca_dim:
+            mean, components = _fit_pca(full, pca_dim)
+        elif mode == "binary":
+            # Centre before taking signs so every bit carries information
+            mean = full.mean(axis=0).astype(np.float32)
+        pca_path = os.path.join(index_dir, "pca.npz")
+        if mean is not None:
+            np.savez(pca_path, mean=mean, components=components if components is not None
+                     else np.zeros((0, 0), np.float32))
+        elif os.path.exists(pca_path):
+            os.remove(pca_path)
+
+        code_width = components.shape[1] if components is not None else full.shape[1]
+        if mode == "binary":
+            code_width = (code_width + 7) // 8
+        for name in ("full.f32", "codes.bin", "scales.f32", "deleted.json"):
+            if os.path.exists(os.path.join(index_dir, name)):
+                os.remove(os.path.join(index_dir, name))
+        _write_json(os.path.join(index_dir, "ids.json"), {"ids": [], "threads": []})
+        _write_json(os.path.join(index_dir, "manifest.json"), {
+            "format_version": QUANTIZED_FORMAT_VERSION,
+            "mode": mode,
+            "pca_dim": pca_dim,
+            "count": 0,
+            "dim": int(full.shape[1]),
+            "code_width": int(code_width),
+        })
+        index = cls(index_dir)
+        index.append(ids, full, threads)
+        return index
+
+    @classmethod
+    def load(cls, index_dir):
+        """Memory-maps the codes and the full-precision vectors."""
+        return cls(index_dir)
+
+    def _load_state(self):
+        manifest_path = self._path("manifest.json")
+        stamp = os.stat(manifest_path).st_mtime_ns
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest["format_version"] not in (1, QUANTIZED_FORMAT_VERSION):
+            raise ValueError(f"Unsupported quantized index format: {manifest['format_version']}")
+        with open(self._path("ids.json")) as f:
+            labels = json.load(f)
+
+        mean, components = None, None
+        if os.path.exists(self._path("pca.npz")):
+            pca = np.load(self._path("pca.npz"))
+            mean = pca["mean"]
+            components = pca["components"] if pca["components"].size else None
+
+        count, mode = manifest["count"], manifest["mode"]
+        if manifest["format_version"] == 1:
+            # Read-only: indexes built before incremental updates keep working until rebuilt
+            codes = np.load(self._path("codes.npy"), mmap_mode="r")
+            scales = np.load(self._path("scales.npy"), mmap_mode="r") if mode == "int8" else None
+            full = np.load(self._path("full.npy"), mmap_mode="r")
+        else:
+            code_dtype = np.int8 if mode == "int8" else np.uint8
+            codes = _map_rows(self._path("codes.bin"), code_dtype, (count, manifest["code_width"]))
+            scales = _map_rows(self._path("scales.f32"), np.float32, (count,)) if mode == "int8" else None
+            full = _map_rows(self._path("full.f32"), np.float32, (count, manifest["dim"]))
+
+        deleted = []
+        if os.path.exists(self._path("deleted.json")):
+            with open(self._path("deleted.json")) as f:
+                deleted = [row for row in json.load(f) if row < count]
+
+        self.manifest = manifest
+        self.mode = mode
+        self.ids = labels["ids"][:count]
+        self.threads = np.asarray(labels["threads"][:count], dtype=object)
+        self.codes, self.scales, self.full = codes, scales, full
+        self.mean, self.components = mean, components
+        self.live = np.ones(count, dtype=bool)
+        self.live[deleted] = False
+        self._row_of = None
+        self._manifest_stamp = stamp
+
+    def refresh(self):
+        """Reloads the index if another process appended to it; cheap when nothing changed."""
+        try:
+            stamp = os.stat(self._path("manifest.json")).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if stamp == self._manifest_stamp:
+            return False
+        self._load_state()
+        return True
+
+    # -- incremental updates ---------------------------------------------------
+    def _rows_of(self, ids):
+        if self._row_of is None:
+            self._row_of = {}
+            for row, doc_id in enumerate(self.ids):
+                if self.live[row]:
+                    self._row_of[doc_id] = row
+        return [self._row_of[doc_id] for doc_id in ids if doc_id in self._row_of]
+
+    def _encode(self, full):
+        reduced = self._reduce(full).astype(np.float32)
+        if self.mode == "int8":
+            scales = np.abs(reduced).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            return np.round(reduced / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return np.packbits(reduced > 0, axis=1), None
+
+    def _commit(self, ids, threads, deleted, count):
+        _write_json(self._path("deleted.json"), sorted(int(row) for row in deleted))
+        _write_json(self._path("ids.json"), {"ids": ids, "threads": threads})
+        # Written last: readers only pick up rows the manifest counts
+        _write_json(self._path("manifest.json"), dict(self.manifest, count=count, updated_at=time.time()))
+        self._load_state()
+
+    def _require_appendable(self):
+        if self.manifest["format_version"] != QUANTIZED_FORMAT_VERSION:
+            raise ValueError(f"{self.index_dir} predates incremental updates; rebuild it with build_quantized_index")
+
+    def append(self, ids, vectors, threads=None, columns=None):
+        """
+        Encodes new vectors with the stored PCA basis and appends them. Rows
+        that already hold one of ``ids`` are marked deleted, so re-indexed
+        emails are replaced.
+
+        Args:
+            ids (list[str]): Chroma ids of the new vectors.
+            vectors (array-like): float32 vectors.
+            threads (list[str]): Thread label per vector.
+            columns (dict): Optional {file name: per-row array} stored next to
+                the codes in the same raw, append-only way (e.g. timestamps).
+
+        Returns:
+            int: Number of appended vectors.
+        """
+        ids = list(ids)
+        if not ids:
+            return 0
+        self._require_appendable()
+        threads = list(threads) if threads is not None else [None] * len(ids)
+        full = _normalize(vectors)
+        codes, scales = self._encode(full)
+        with _write_lock(self.index_dir):
+            self.refresh()
+            count = len(self.ids)
+            deleted = set(np.flatnonzero(~self.live).tolist()) | set(self._rows_of(ids))
+            _append_rows(self._path("full.f32"), full, count)
+            _append_rows(self._path("codes.bin"), codes, count)
+            if scales is not None:
+                _append_rows(self._path("scales.f32"), scales, count)
+            for name, values in (columns or {}).items():
+                _append_rows(self._path(name), values, count)
+            self._commit(self.ids + ids, list(self.threads) + threads, deleted, count + len(ids))
+        return len(ids)
+
+    def remove(self, ids):
+        """Marks the rows of deleted emails so searches skip them."""
+        if not ids:
+            return 0
+        self._require_appendable()
+        with _write_lock(self.index_dir):
+            self.refresh()
+            rows = self._rows_of(ids)
+            if rows:
+                deleted = set(np.flatnonzero(~self.live).tolist()) | set(rows)
+                self._commit(self.ids, list(self.threads), deleted, len(self.ids))
+        return len(rows)
+
+    def rename_threads(self, merges):
+        """Applies {old label: new label} thread merges to the thread filter."""
+        if not merges or not any(thread in merges for thread in self.threads):
+            return
+        self._require_appendable()
+        with _write_lock(self.index_dir):
+            self.refresh()
+            threads = [merges.get(thread, thread) for thread in self.threads]
+            self._commit(self.ids, threads, np.flatnonzero(~self.live).tolist(), len(self.ids))
+
+    # -- search ----------------------------------------------------------------
+    def _reduce(self, queries):
+        if self.components is not None:
+            return (queries - self.mean) @ self.components
+        if self.mode == "binary":
+            return queries - self.mean
+        return queries
+
+    def _approx_scores(self, queries, block_size=65536):
+        reduced = self._reduce(queries).astype(np.float32)
+        n = len(self.codes)
+        scores = np.empty((len(queries), n), dtype=np.float32)
+        if self.mode == "int8":
+            # Approximate inner product; codes are widened one block at a time
+            # so the float32 copy never covers the whole index.
+            for start in range(0, n, block_size):
+                block = self.codes[start:start + block_size].astype(np.float32)
+                scores[:, start:start + block_size] = (reduced @ block.T) * self.scales[None, start:start + block_size]
+            return scores
+        # Smaller Hamming distance is better, so negate it
+        bits = np.packbits(reduced > 0, axis=1)
+        for i, b in enumerate(bits):
+            scores[i] = -_POPCOUNT[np.bitwise_xor(self.codes, b)].sum(axis=1, dtype=np.int32)
+        return scores
+
+    def search(self, query_vectors, k=10, shortlist_factor=10, thread=None, rescore=True, mask=None):
+        """
+        Searches one or more query vectors.
+
+        Args:
+            query_vectors (array-like): One vector or a (n, dim) batch.
+            k (int): Results per query.
+            shortlist_factor (int): Candidates kept from the compressed scan
+                per result; higher improves recall at the cost of latency.
+            thread (str | tuple[str]): Only return vectors from this thread
+                (or these threads).
+            rescore (bool): Rescore the shortlist at full precision.
+            mask (np.ndarray): Optional boolean row filter (e.g. a date range);
+                rows past its end are excluded.
+
+        Returns:
+            list[list[tuple]]: Per query, (id, score) pairs sorted best-first.
+        """
+        self.refresh()
+        queries = _normalize(np.atleast_2d(query_vectors))
+        approx = self._approx_scores(queries)
+        if thread is not None:
+            approx[:, ~thread_mask(self.threads, thread)] = -np.inf
+        if mask is not None:
+            # Rows appended after the mask was computed are excluded
+            approx[:, len(mask):] = -np.inf
+            approx[:, :len(mask)][:, ~mask] = -np.inf
+        if not self.live.all():
+            approx[:, ~self.live] = -np.inf
+
+        n = approx.shape[1]
+        shortlist_size = min(n, max(k, k * shortlist_factor if rescore else k))
+        results = []
+        for q, row in zip(queries, approx):
+            if shortlist_size < n:
+                candidates = np.argpartition(-row, shortlist_size - 1)[:shortlist_size]
+            else:
+                candidates = np.arange(n)
+            candidates = np.sort(candidates[np.isfinite(row[candidates])])
+            if rescore:
+                scores = np.asarray(self.full[candidates]) @ q
+            else:
+                scores = row[candidates]
+            order = np.argsort(-scores)[:k]
+            results.append([(self.ids[candidates[i]], float(scores[i])) for i in order])
+        return results
+
+
+def thread_mask(threads, thread):
+    """Boolean mask of the rows of ``threads`` labelled ``thread`` (a label or a tuple of labels)."""
+    if isinstance(thread, str):
+        return threads == thread
+    labels = set(thread)
+    return np.fromiter((label in labels for label in threads), dtype=bool, count=len(threads))
+
+
+def build_quantized_index(index_dir, db_directory=None, mode="int8", pca_dim=None, batch_size=1000):
+    """
+    Builds a quantized index from the vectors already stored in Chroma.
+
+    Args:
+        index_dir (str): Output directory.
+        db_directory (str): ChromaDB persistence directory.
+        mode (str): "int8" or "binary".
+        pca_dim (int): Optional PCA dimension for the codes.
+        batch_size (int): Records read from Chroma per page.
+
+    Returns:
+        QuantizedIndex: The built index.
+    """
+    from helpers.config import DB_DIRECTORY
+    from helpers.collection import get_collection
+
+    started = time.time()
+    collection = get_collection(db_directory or DB_DIRECTORY)
+    ids, threads, vectors = [], [], []
+    for offset in range(0, collection.count(), batch_size):
+        page = collection.get(limit=batch_size, offset=offset, include=["embeddings", "metadatas"])
+        ids.extend(page["ids"])
+        threads.extend((m or {}).get("thread") for m in page["metadatas"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+
+    index = QuantizedIndex.build(index_dir, ids, np.concatenate(vectors), threads, mode=mode, pca_dim=pca_dim)
+    print(f"✅ Built {mode} index over {len(index)} vector(s) "
+          f"({index.code_bytes / 1024 / 1024:.1f} MB of codes + {index.full_bytes / 1024 / 1024:.1f} MB of "
+          f"rescoring vectors) in {time.time() - started:.1f}s")
+    return index
+
+
+def quantized_similarity_search(index, vectorstore, query, k=10, thread=None, shortlist_factor=10):
+    """
+    Runs a compressed search and returns LangChain documents from Chroma.
+
+    Args:
+        index (QuantizedIndex): Loaded quantized index.
+        vectorstore (Chroma): Store holding the texts and metadata.
+        query (str): Question text.
+        k (int): Number of documents.
+        thread (str | tuple[str]): Optional thread filter.
+        shortlist_factor (int): Recall/latency knob passed to ``search``.
+
+    Returns:
+        list[Document]: Best-first documents.
+    """
+    from langchain.schema import Document
+
+    query_vector = vectorstore.embeddings.embed_query(query)
+    hits = index.search(query_vector, k=k, thread=thread, shortlist_factor=shortlist_factor)[0]
+    if not hits:
+        return []
+    found = vectorstore._collection.get(ids=[doc_id for doc_id, _ in hits], include=["documents", "metadatas"])
+    by_id = {doc_id: (text, meta) for doc_id, text, meta in zip(found["ids"], found["documents"], found["metadatas"])}
+    return [
+        Document(page_content=by_id[doc_id][0], metadata=by_id[doc_id][1] or {})
+        for doc_id, _ in hits if doc_id in by_id
+    ]
+
+
+def _open_for_update(index_dir=None):
+    from helpers.config import QUANTIZED_INDEX_DIR
+
+    index_dir = index_dir or QUANTIZED_INDEX_DIR
+    if not index_dir or not os.path.exists(os.path.join(index_dir, "manifest.json")):
+        return None
+    index = QuantizedIndex.load(index_dir)
+    if index.manifest["format_version"] != QUANTIZED_FORMAT_VERSION:
+        print(f"⚠️ {index_dir} cannot be updated incrementally; rebuild it to search newly indexed mail")
+        return None
+    return index
+
+
+def update_quantized_index(collection, added_ids=(), removed_ids=(), index_dir=None):
+    """
+    Keeps the quantized index in step with Chroma after ingest: vectors of
+    new emails are appended and deleted emails are masked out. A no-op
+    unless QUANTIZED_INDEX_DIR points at a built index.
+
+    Args:
+        collection: Chroma collection holding the vectors.
+        added_ids (list[str]): Ids just added to Chroma.
+        removed_ids (list[str]): Ids just deleted from Chroma.
+        index_dir (str): Index directory (defaults to QUANTIZED_INDEX_DIR).
+    """
+    index = _open_for_update(index_dir)
+    if index is None:
+        return
+    removed = index.remove(list(removed_ids))
+    appended = 0
+    if added_ids:
+        found = collection.get(ids=list(added_ids), include=["embeddings", "metadatas"])
+        if found["ids"]:
+            appended = index.append(found["ids"], np.asarray(found["embeddings"], dtype=np.float32),
+                                    [(m or {}).get("thread") for m in found["metadatas"]])
+    print(f"🗜️ Quantized index: +{appended} / -{removed} vector(s), {int(index.live.sum())} searchable")
+
+
+def rename_quantized_threads(merges, index_dir=None):
+    """Applies {old label: new label} thread merges to the quantized index."""
+    index = _open_for_update(index_dir) if merges else None
+    if index is not None:
+        index.rename_threads(merges)
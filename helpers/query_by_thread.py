@@ -1,23 +1,79 @@
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain_community.llms import Ollama
-from langchain.prompts import PromptTemplate
-from langchain.schema import Document
 import os
 import glob
 import datetime
+from helpers.config import (
+    DB_DIRECTORY,
+    EMBEDDING_MODEL_NAME,
+    HEADER_STORE_PATH,
+    QUANTIZED_INDEX_DIR,
+    QUANTIZED_SHORTLIST_FACTOR,
+    RECENCY_WEIGHT,
+    TIME_PARTITION_DIR
+)
+
+# LangChain, the embedding model and Chroma are only imported/loaded on first
+# use, so importing this module (e.g. from helpers/scoring or the CLI) is cheap.
+_loaded = {}
+
 
 # 1. Setup: Embedding + Chroma
-embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-vectorstore = Chroma(
-    persist_directory="chroma_email_db_3",
-    embedding_function=embedding_model
-)
+def get_query_vectorstore():
+    """
+    Returns the shared Chroma vectorstore, loading the embedding model on first call.
+
+    Returns:
+        Chroma: Vectorstore over DB_DIRECTORY.
+    """
+    if "vectorstore" not in _loaded:
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        from langchain_community.vectorstores import Chroma
+
+        embedding_model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+        _loaded["vectorstore"] = Chroma(
+            persist_directory=DB_DIRECTORY,
+            embedding_function=embedding_model
+        )
+    return _loaded["vectorstore"]
+
+
+def get_quantized_index():
+    """Returns the optional compressed index (None unless QUANTIZED_INDEX_DIR is set)."""
+    if "quantized_index" not in _loaded:
+        index = None
+        if QUANTIZED_INDEX_DIR:
+            from helpers.quantized_index import QuantizedIndex
+            # Searched first, shortlist rescored at full precision
+            index = QuantizedIndex.load(QUANTIZED_INDEX_DIR)
+        _loaded["quantized_index"] = index
+    return _loaded["quantized_index"]
+
+
+def get_time_partitions():
+    """Returns the monthly segment index (None unless TIME_PARTITION_DIR has been built)."""
+    if "time_partitions" not in _loaded:
+        index = None
+        if TIME_PARTITION_DIR and os.path.exists(os.path.join(TIME_PARTITION_DIR, "manifest.json")):
+            from helpers.time_partitions import TimePartitionedIndex
+            # Segments themselves are loaded lazily, per month, on first search
+            index = TimePartitionedIndex(TIME_PARTITION_DIR)
+        _loaded["time_partitions"] = index
+    return _loaded["time_partitions"]
+
+
+def __getattr__(name):
+    # Keeps `from helpers.query_by_thread import vectorstore` working, lazily
+    if name == "vectorstore":
+        return get_query_vectorstore()
+    if name == "embedding_model":
+        return get_query_vectorstore().embeddings
+    if name == "quantized_index":
+        return get_quantized_index()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # 4. Query the email vectorstore
 def query_email_store(question):
-    retriever = vectorstore.as_retriever()
+    retriever = get_query_vectorstore().as_retriever()
     results = retriever.get_relevant_documents(question)
     print("\n🔎 Top Matches:\n")
     for doc in results:
@@ -30,7 +86,10 @@ def query_email_store(question):
 # 4. Query + Ask LLaMA 3.2 via Prompt Template
 # ---------------------------------------------
 def ask_email_agent(query, top_k=10):
-    retriever = vectorstore.as_retriever()
+    from langchain.prompts import PromptTemplate
+    from langchain_community.llms import Ollama
+
+    retriever = get_query_vectorstore().as_retriever()
     docs = retriever.get_relevant_documents(query, k=top_k)
 
     context = "\n\n---\n\n".join([doc.page_content for doc in docs])
@@ -63,7 +122,10 @@ CONTEXT:
 
 
 def ask_email_agent2(query,email_dir, top_k=10):
-    retriever = vectorstore.as_retriever(
+    from langchain.prompts import PromptTemplate
+    from langchain_community.llms import Ollama
+
+    retriever = get_query_vectorstore().as_retriever(
         search_type="mmr",  # More diverse retrieval
         search_kwargs={"k": top_k,
         "filter": {"thread": email_dir}
@@ -110,50 +172,141 @@ CONTEXT:
     return response
 
 
-def ask_email_agent3(query,email_dir, top_k=10):
+# Stronger grounding prompt shared by ask_email_agent3 and the query service
+GROUNDED_EMAIL_TEMPLATE = """
+You are an AI assistant helping analyze and summarize corporate email trails. Use only the information provided in the CONTEXT to answer the QUESTION. 
+Be specific, and do not make assumptions beyond the content.
+
+QUESTION:
+{question}
+
+CONTEXT:
+{context}
+
+📝 Answer:"""
+
+LLM_MODEL_NAME = "llama3.2"
+
+
+def thread_filter(email_dir):
+    """
+    Maps the UI thread selection to the thread labels to search (None = all
+    threads). A folder name only labels the first conversation filed under it,
+    so its later "<name> [abc123]" conversations are included too.
+
+    Returns:
+        tuple[str] | None: Thread labels.
+    """
+    if not email_dir or email_dir == "All Threads":
+        return None
+    if not os.path.exists(HEADER_STORE_PATH):
+        return (email_dir,)
+    from helpers.header_store import get_header_store
+
+    return get_header_store().thread_family(email_dir)
+
+
+def _search_email_docs(query, thread, top_k, start, end):
+    vectorstore = get_query_vectorstore()
+    time_partitions = get_time_partitions()
+    if time_partitions is not None:
+        from helpers.time_partitions import time_partitioned_search
+
+        return time_partitioned_search(
+            time_partitions, vectorstore, query, k=top_k, thread=thread, start=start, end=end,
+            shortlist_factor=QUANTIZED_SHORTLIST_FACTOR
+        )
+
+    quantized_index = get_quantized_index()
+    # The quantized index has no dates, so date-bounded questions go to Chroma
+    if quantized_index is not None and start is None and end is None and not RECENCY_WEIGHT:
+        from helpers.quantized_index import quantized_similarity_search
+
+        return quantized_similarity_search(
+            quantized_index, vectorstore, query, k=top_k, thread=thread,
+            shortlist_factor=QUANTIZED_SHORTLIST_FACTOR
+        )
+
+    from helpers.time_partitions import date_filter, rerank_by_recency
+
     search_kwargs={"k": top_k}
-    if email_dir and email_dir != "All Threads":
-        search_kwargs["filter"] = {"thread": email_dir}
+    where = date_filter(thread, start, end)
+    if where:
+        search_kwargs["filter"] = where
+    if RECENCY_WEIGHT:
+        scored = vectorstore.similarity_search_with_relevance_scores(query, k=top_k * 3, filter=where)
+        return rerank_by_recency(scored, top_k)
     retriever = vectorstore.as_retriever(
         search_type="mmr",  # More diverse retrieval
         search_kwargs=search_kwargs
     )
-    docs = retriever.get_relevant_documents(query)
-
-    if not docs:
-        print("⚠️ No relevant documents found for the query.")
-        return
-
+    return retriever.get_relevant_documents(query)
+
+
+def retrieve_email_docs(query, email_dir, top_k=10, start=None, end=None):
+    """
+    Retrieves the documents ask_email_agent3 grounds its answer on.
+
+    Args:
+        query (str): The user question.
+        email_dir (str): Thread to search, or "All Threads".
+        top_k (int): Number of documents to return.
+        start (datetime): Only mail sent at or after this time.
+        end (datetime): Only mail sent at or before this time. Without
+            either bound, a time scope in the question ("last week", "since
+            July") is used.
+
+    Returns:
+        list[Document]: Retrieved documents.
+    """
+    from helpers.time_partitions import parse_date_bounds
+
+    thread = thread_filter(email_dir)
+    explicit = start is not None or end is not None
+    if not explicit:
+        start, end = parse_date_bounds(query)
+    docs = _search_email_docs(query, thread, top_k, start, end)
+    if not docs and not explicit and (start is not None or end is not None):
+        # A misread time scope should not hide everything else
+        print(f"🗓️ No emails between {start} and {end}, searching all dates")
+        docs = _search_email_docs(query, thread, top_k, None, None)
+    return docs
+
+
+def build_email_context(docs):
     # Include metadata for better grounding
-    context = "\n\n---\n\n".join([
+    return "\n\n---\n\n".join([
         f"From: {doc.metadata.get('from', 'Unknown')}\n"
         f"To: {doc.metadata.get('to', 'Unknown')}\n"
         f"Subject: {doc.metadata.get('subject', 'No Subject')}\n"
-        f"Date: {doc.metadata.get('date', 'Unknown')}\n\n"
-        f"{doc.page_content.strip()}"
+        f"Date: {doc.metadata.get('date', 'Unknown')}\n"
+        + (f"Near-identical copies: {doc.metadata['duplicate_count']} ({doc.metadata.get('duplicate_sources', '')})\n"
+           if doc.metadata.get("duplicate_count") else "")
+        + f"\n{doc.page_content.strip()}"
         for doc in docs
     ])
 
-    # Stronger grounding prompt
-    prompt = PromptTemplate(
-        input_variables=["question", "context"],
-        template="""
-You are an AI assistant helping analyze and summarize corporate email trails. Use only the information provided in the CONTEXT to answer the QUESTION. 
-Be specific, and do not make assumptions beyond the content.
 
-QUESTION:
-{question}
+def generate_email_answer(query, docs):
+    """Runs the grounded prompt over already retrieved documents."""
+    from langchain.prompts import PromptTemplate
+    from langchain_community.llms import Ollama
 
-CONTEXT:
-{context}
+    prompt = PromptTemplate(input_variables=["question", "context"], template=GROUNDED_EMAIL_TEMPLATE)
+    llm = Ollama(model=LLM_MODEL_NAME)  # Ensure Ollama is running locally
 
-📝 Answer:"""
-    )
+    final_prompt = prompt.format(question=query, context=build_email_context(docs))
+    return llm.invoke(final_prompt)
 
-    llm = Ollama(model="llama3.2")  # Ensure Ollama is running locally
 
-    final_prompt = prompt.format(question=query, context=context)
-    response = llm.invoke(final_prompt)
+def ask_email_agent3(query,email_dir, top_k=10, start=None, end=None):
+    docs = retrieve_email_docs(query, email_dir, top_k=top_k, start=start, end=end)
+
+    if not docs:
+        print("⚠️ No relevant documents found for the query.")
+        return
+
+    response = generate_email_answer(query, docs)
 
     # print(response)
     return response, docs
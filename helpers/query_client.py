@@ -0,0 +1,125 @@
+import requests
+from langchain.schema import Document
+
+
+class ChatSessionError(RuntimeError):
+    """The service cannot hold the chat (e.g. it runs several workers)."""
+
+
+class ChatSessionExpired(ChatSessionError):
+    """The session is unknown to the service: expired, evicted or created by another worker."""
+
+
+class QueryServiceClient:
+    """
+    Thin HTTP client for the query service, so callers can query without
+    loading the embedding model or Chroma in-process.
+
+    Args:
+        base_url (str): e.g. "http://127.0.0.1:8800".
+        timeout (float): Seconds to wait for a response (RAG calls include LLM time).
+    """
+
+    def __init__(self, base_url, timeout=300):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _post_json(self, path, payload):
+        response = requests.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _post(self, path, query, email_dir, top_k, since=None, until=None):
+        return self._post_json(path, {
+            "query": query, "thread": email_dir or "All Threads", "top_k": top_k, "since": since, "until": until
+        })
+
+    @staticmethod
+    def _docs(payload):
+        return [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in payload["documents"]]
+
+    def retrieve(self, query, email_dir="All Threads", top_k=10, since=None, until=None):
+        return self._docs(self._post("/retrieve", query, email_dir, top_k, since, until))
+
+    def ask(self, query, email_dir="All Threads", top_k=10, since=None, until=None):
+        """Same contract as ``ask_email_agent3``: returns (response, docs)."""
+        payload = self._post("/ask", query, email_dir, top_k, since, until)
+        return payload["answer"], self._docs(payload)
+
+    def create_chat_session(self, email_dir="All Threads", top_k=5):
+        """
+        Starts a chat on the service and returns its session id.
+
+        Raises:
+            ChatSessionError: If the service refuses chat sessions (several workers).
+        """
+        try:
+            payload = self._post_json("/chat/sessions", {"thread": email_dir or "All Threads", "top_k": top_k})
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 409:
+                raise ChatSessionError(e.response.json().get("detail", str(e))) from e
+            raise
+        return payload["session_id"]
+
+    def chat(self, session_id, query, since=None, until=None):
+        """
+        Sends one turn of a chat session.
+
+        Returns:
+            dict: "answer", "documents" (list[Document]), "new_documents" and "prompt_tokens".
+
+        Raises:
+            ChatSessionExpired: If the service no longer knows the session.
+            ChatSessionError: If the service refuses chat sessions.
+        """
+        try:
+            payload = self._post_json(f"/chat/{session_id}", {"query": query, "since": since, "until": until})
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status == 404:
+                raise ChatSessionExpired(f"Chat session {session_id} is unknown to the service "
+                                         f"(expired, evicted or held by another worker)") from e
+            if status == 409:
+                raise ChatSessionError(e.response.json().get("detail", str(e))) from e
+            raise
+        return dict(payload, documents=self._docs(payload))
+
+    def chat_session(self, email_dir="All Threads", top_k=5):
+        return RemoteChatSession(self, email_dir, top_k)
+
+    def threads(self):
+        response = requests.get(f"{self.base_url}/threads", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["threads"]
+
+    def health(self):
+        response = requests.get(f"{self.base_url}/health", timeout=5)
+        response.raise_for_status()
+        return response.json()
+
+
+class RemoteChatSession:
+    """
+    ``ChatSession`` look-alike backed by the query service's ``/chat``
+    endpoints. The prompt state lives in the service; turns are mirrored
+    locally for display. An expired session raises ``ChatSessionExpired``
+    rather than silently starting over without the cached prompt state.
+    """
+
+    def __init__(self, client, thread="All Threads", top_k=5):
+        self.client = client
+        self.thread = thread
+        self.top_k = top_k
+        self.turns = []
+        self.id = client.create_chat_session(thread, top_k)
+
+    def ask(self, question, since=None, until=None):
+        """Same contract as ``ChatSession.ask``: returns (answer, docs, number of newly sent docs)."""
+        result = self.client.chat(self.id, question, since, until)
+        self.turns.append({
+            "question": question,
+            "answer": result["answer"],
+            "new_docs": result["new_documents"],
+            "prompt_tokens": result.get("prompt_tokens", 0),
+        })
+        return result["answer"], result["documents"], result["new_documents"]
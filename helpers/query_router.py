@@ -0,0 +1,194 @@
+import re
+from datetime import datetime
+
+from helpers.header_store import get_header_store
+
+# Words that never identify the topic of a "who was on the ... email" question
+_STOPWORDS = {
+    "the", "a", "an", "to", "for", "of", "on", "in", "about", "regarding", "re", "email", "emails",
+    "mail", "mails", "thread", "message", "messages", "this", "that", "our", "meeting", "call",
+}
+# Roles whose real answer is usually in the body (an invite or attendee list),
+# so From/To/Cc alone never complete the answer
+_BODY_ROLES = ("invited", "in", "involved")
+# A name, address or "First Last". The routes are case-insensitive, but the
+# surname must be capitalised (?-i:), so "email alice about" stops at "alice".
+_PERSON = r"(?P<{}>[\w.@+-]+(?: (?-i:[A-Z][\w-]+))?)"
+_EMAIL_VERB = r"(?:e-?mail(?:ed)?|mail(?:ed)?|write to|wrote to|message(?:d)?|contact(?:ed)?|reply to|replied to|send (?:an? )?(?:e-?mail|message) to)"
+
+# (name, pattern). Patterns are matched case-insensitively against the question.
+_ROUTES = [
+    ("last_contact", re.compile(
+        rf"when did {_PERSON.format('a')} (?P<which>last|first|most recently) {_EMAIL_VERB} {_PERSON.format('b')}", re.I)),
+    ("last_from", re.compile(
+        rf"when did {_PERSON.format('a')} (?P<which>last|first|most recently) (?:send|write|reply)", re.I)),
+    ("count_sent", re.compile(
+        rf"how many (?:e-?mails|mails|messages) (?:did|has|have) {_PERSON.format('a')} (?:send|sent|written|write)"
+        rf"(?: to {_PERSON.format('b')})?", re.I)),
+    ("top_senders", re.compile(r"who (?:sent|wrote|sends) the most (?:e-?mails|mails|messages)?", re.I)),
+    ("senders_to", re.compile(rf"who (?:{_EMAIL_VERB}|sent (?:e-?mails? |messages? )?to) {_PERSON.format('b')}", re.I)),
+    ("participants", re.compile(
+        r"who (?:was|were|is|are|got) (?P<role>invited|included|cc'?d|copied|on|sent|emailed|addressed|involved|in)"
+        r"(?: (?:to|on|in))?(?P<topic>(?: (?!(?:and|but|what|why|how|when)\b)[\w'-]+)+)", re.I)),
+]
+
+
+class HeaderAnswer:
+    """Result of a header lookup: a direct answer plus the facts behind it."""
+
+    def __init__(self, route, answer, facts, complete):
+        self.route = route
+        self.answer = answer
+        self.facts = facts
+        # True when the pattern covered the whole question, so no LLM is needed
+        self.complete = complete
+
+    def as_context(self):
+        return "STRUCTURED HEADER LOOKUP:\n" + self.answer + "\n" + "\n".join(self.facts)
+
+
+def _covers_question(match, question):
+    leftover = (question[:match.start()] + question[match.end():]).strip(" ?.!")
+    return not leftover
+
+
+def _format_email(row):
+    return f"- {row['date'] or 'unknown date'} | {row['subject'] or 'No Subject'} | {row['source'] or ''}"
+
+
+def _names(addresses):
+    return ", ".join(sorted(addresses)) or "nobody"
+
+
+def route_header_query(question, email_dir=None, start=None, end=None):
+    """
+    Answers participant / date questions from the header store.
+
+    Args:
+        question (str): The user question.
+        email_dir (str): Thread to scope the lookup to, or "All Threads".
+        start (datetime): Only mail sent at or after this time.
+        end (datetime): Only mail sent at or before this time. Without
+            either bound, a time scope in the question is used.
+
+    Returns:
+        HeaderAnswer | None: None when the question is not a header lookup or
+        the store has nothing relevant, so the caller falls back to RAG.
+    """
+    from helpers.time_partitions import parse_date_bounds
+
+    store = get_header_store()
+    thread = email_dir if email_dir and email_dir != "All Threads" else None
+    question = question.strip()
+    if start is None and end is None:
+        start, end = parse_date_bounds(question)
+    span = {"start_ts": start.timestamp() if start else None, "end_ts": end.timestamp() if end else None}
+
+    for route, pattern in _ROUTES:
+        match = pattern.search(question)
+        if not match:
+            continue
+        groups = match.groupdict()
+        a = store.resolve_person(groups["a"]) if groups.get("a") else None
+        b = store.resolve_person(groups["b"]) if groups.get("b") else None
+        if (groups.get("a") and not a) or (groups.get("b") and not b):
+            continue  # unknown person: let RAG handle it
+        complete = _covers_question(match, question)
+
+        if route in ("last_contact", "last_from"):
+            order = "ts ASC" if groups["which"].lower() == "first" else "ts DESC"
+            rows = store.find_emails(sender=a, recipients=b, thread=thread, order=order, limit=5, **span)
+            if not rows:
+                continue
+            target = f" {groups['b']}" if b else ""
+            answer = f"{groups['a']} {groups['which'].lower()} emailed{target} on {rows[0]['date']} (subject: {rows[0]['subject']})."
+            return HeaderAnswer(route, answer, [_format_email(r) for r in rows], complete)
+
+        if route == "count_sent":
+            rows = store.find_emails(sender=a, recipients=b, thread=thread, **span)
+            target = f" to {groups['b']}" if b else ""
+            answer = f"{groups['a']} sent {len(rows)} email(s){target}."
+            return HeaderAnswer(route, answer, [_format_email(r) for r in rows[:20]], complete)
+
+        if route == "top_senders":
+            rows = store.top_senders(thread=thread, **span)
+            if not rows:
+                continue
+            answer = f"{rows[0]['address']} sent the most emails ({rows[0]['emails']})."
+            return HeaderAnswer(route, answer, [f"- {r['address']}: {r['emails']}" for r in rows], complete)
+
+        if route == "senders_to":
+            rows = store.find_emails(recipients=b, thread=thread, **span)
+            if not rows:
+                continue
+            senders = {p["address"] for p in store.participants_of([r["id"] for r in rows], roles=("from",))}
+            answer = f"{groups['b']} received email from: {_names(senders)}."
+            return HeaderAnswer(route, answer, [_format_email(r) for r in rows[:20]], complete)
+
+        if route == "participants":
+            words = [w for w in re.findall(r"[\w'-]+", groups["topic"].lower()) if w not in _STOPWORDS]
+            if not words:
+                continue
+            rows = store.find_emails(thread=thread, subject_words=words, **span)
+            if not rows:
+                continue
+            best = rows[0]["score"]
+            rows = [r for r in rows if r["score"] == best]
+            people = store.participants_of([r["id"] for r in rows])
+            roles = ("cc",) if groups["role"].lower().startswith(("cc", "copied")) else ("from", "to", "cc")
+            addresses = {p["address"] for p in people if p["role"] in roles}
+            subjects = sorted({r["subject"] for r in rows if r["subject"]})
+            answer = f"Participants on {', '.join(repr(s) for s in subjects)}: {_names(addresses)}."
+            facts = [_format_email(r) for r in rows[:20]]
+            facts += [f"  {p['role']}: {p['address']}" for p in people if p["role"] in roles]
+            # A loose subject match or an invite list needs the emails themselves
+            complete = complete and best == len(words) and groups["role"].lower() not in _BODY_ROLES
+            return HeaderAnswer(route, answer, facts, complete)
+    return None
+
+
+def try_route_header_query(question, email_dir=None, start=None, end=None):
+    """``route_header_query`` that returns None instead of raising, so RAG still answers."""
+    try:
+        return route_header_query(question, email_dir, start=start, end=end)
+    except Exception as e:  # the store is an accelerator, never a hard dependency
+        print(f"⚠️ Header lookup failed, falling back to RAG: {e}")
+        return None
+
+
+def format_header_answer(routed):
+    """Text of a complete header lookup, as returned to the user."""
+    return routed.answer + "\n\n" + "\n".join(routed.facts)
+
+
+def header_context_doc(routed):
+    """Wraps a partial header lookup as a CONTEXT document for the LLM."""
+    from langchain.schema import Document
+
+    return Document(page_content=routed.as_context(), metadata={
+        "subject": "Header lookup", "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    })
+
+
+def answer_email_query(query, email_dir, top_k=10, start=None, end=None):
+    """
+    Query router in front of ``ask_email_agent3``.
+
+    Header questions that the lookup fully covers are answered directly from
+    the header store. Partially covered ones give the LLM the compact lookup
+    result ahead of the retrieved emails. Everything else goes through full RAG.
+
+    Returns:
+        tuple: (response, docs), same as ``ask_email_agent3``.
+    """
+    routed = try_route_header_query(query, email_dir, start=start, end=end)
+    if routed is not None and routed.complete:
+        return format_header_answer(routed), []
+
+    from helpers.query_by_thread import ask_email_agent3, generate_email_answer, retrieve_email_docs
+
+    if routed is not None:
+        # The lookup answers the header part; retrieved emails cover the rest
+        docs = [header_context_doc(routed)] + retrieve_email_docs(query, email_dir, top_k=top_k, start=start, end=end)
+        return generate_email_answer(query, docs), docs
+    return ask_email_agent3(query, email_dir, top_k=top_k, start=start, end=end)
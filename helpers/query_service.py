@@ -0,0 +1,384 @@
+import asyncio
+import os
+import statistics
+import time
+from collections import deque
+from typing import Optional
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from langchain.schema import Document
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from pydantic import BaseModel
+
+from helpers import query_by_thread
+from helpers.config import QUANTIZED_SHORTLIST_FACTOR, RECENCY_WEIGHT
+from helpers.query_router import format_header_answer, header_context_doc, try_route_header_query
+from helpers.time_partitions import date_filter, parse_date_bounds, parse_iso_bounds, rerank_by_recency
+
+# Micro-batching knobs: requests arriving within BATCH_WAIT_MS of each other
+# share one embedding forward pass and one vector search per thread / date filter.
+BATCH_WAIT_MS = float(os.environ.get("EMAIL_RAG_BATCH_WAIT_MS", 5))
+MAX_BATCH_SIZE = int(os.environ.get("EMAIL_RAG_MAX_BATCH_SIZE", 64))
+MMR_FETCH_K = 20       # same defaults as langchain's MMR retriever
+MMR_LAMBDA = 0.5
+# Set by serve() for its workers: chat sessions live in one process, so /chat needs a single worker
+WORKERS_ENV = "EMAIL_RAG_QUERY_SERVICE_WORKERS"
+
+
+class QueryRequest(BaseModel):
+    query: str
+    thread: str = "All Threads"
+    top_k: int = 10
+    since: Optional[str] = None  # ISO dates; otherwise a time scope in the query is used
+    until: Optional[str] = None
+
+
+class ChatSessionRequest(BaseModel):
+    thread: str = "All Threads"
+    top_k: int = 5
+
+
+class ChatTurnRequest(BaseModel):
+    query: str
+    since: Optional[str] = None
+    until: Optional[str] = None
+
+
+def _doc_to_dict(doc):
+    return {"page_content": doc.page_content, "metadata": doc.metadata}
+
+
+# 1. Batched retrieval
+def _fetch_documents(vectorstore, hits_per_item):
+    """Loads the Chroma documents for lists of (id, score) hits in one ``get``."""
+    wanted = list({doc_id for hits in hits_per_item for doc_id, _ in hits})
+    found = vectorstore._collection.get(ids=wanted, include=["documents", "metadatas"]) if wanted else None
+    by_id = {} if found is None else {
+        doc_id: (text, meta) for doc_id, text, meta in zip(found["ids"], found["documents"], found["metadatas"])
+    }
+    return [
+        [Document(page_content=by_id[doc_id][0], metadata=by_id[doc_id][1] or {}) for doc_id, _ in hits
+         if doc_id in by_id]
+        for hits in hits_per_item
+    ]
+
+
+def _search_batch(items):
+    """
+    Embeds every query in one forward pass and runs one vector search per
+    distinct (thread, since, until, recency) combination. Mirrors
+    ``retrieve_email_docs``: the monthly time partitions when they are built,
+    else the quantized index for undated queries, else Chroma with a date
+    filter (MMR, or a top_k * 3 pool re-ranked by recency when a recency
+    weight is set).
+
+    Args:
+        items (list[tuple]): (query, thread, top_k, start, end, recency_weight)
+            per request; start / end are datetimes or None.
+
+    Returns:
+        list[list[Document]]: Documents per request, in input order.
+    """
+    vectorstore = query_by_thread.get_query_vectorstore()
+    quantized_index = query_by_thread.get_quantized_index()
+    time_partitions = query_by_thread.get_time_partitions()
+    query_vectors = np.asarray(
+        vectorstore.embeddings.embed_documents([item[0] for item in items]), dtype=np.float32
+    )
+
+    if time_partitions is not None:
+        # Segments are searched per query (each has its own months), documents fetched once
+        hits = [
+            time_partitions.search(
+                query_vectors[i], k=top_k, start=start, end=end, thread=query_by_thread.thread_filter(thread),
+                shortlist_factor=QUANTIZED_SHORTLIST_FACTOR, recency_weight=recency_weight
+            )
+            for i, (_, thread, top_k, start, end, recency_weight) in enumerate(items)
+        ]
+        return _fetch_documents(vectorstore, hits)
+
+    groups = {}
+    for i, (_, thread, _, start, end, recency_weight) in enumerate(items):
+        groups.setdefault((query_by_thread.thread_filter(thread), start, end, recency_weight), []).append(i)
+
+    results = [None] * len(items)
+    for (thread, start, end, recency_weight), positions in groups.items():
+        max_k = max(items[i][2] for i in positions)
+        dated = start is not None or end is not None
+
+        # The quantized index has no dates, so dated and recency-ranked queries go to Chroma
+        if quantized_index is not None and not dated and not recency_weight:
+            hits = quantized_index.search(
+                query_vectors[positions], k=max_k, thread=thread, shortlist_factor=QUANTIZED_SHORTLIST_FACTOR
+            )
+            docs = _fetch_documents(vectorstore, [row[:items[i][2]] for i, row in zip(positions, hits)])
+            for i, found in zip(positions, docs):
+                results[i] = found
+            continue
+
+        response = vectorstore._collection.query(
+            query_embeddings=query_vectors[positions],
+            n_results=max_k * 3 if recency_weight else max(MMR_FETCH_K, max_k),
+            where=date_filter(thread, start, end),
+            include=["documents", "metadatas", "embeddings", "distances"],
+        )
+        for row, i in enumerate(positions):
+            embeddings = response["embeddings"][row]
+            if embeddings is None or len(embeddings) == 0:
+                results[i] = []
+                continue
+            docs = [
+                Document(page_content=text, metadata=meta or {})
+                for text, meta in zip(response["documents"][row], response["metadatas"][row])
+            ]
+            if recency_weight:
+                # Same relevance score as langchain's Chroma (L2 distance of normalised vectors)
+                scored = [(doc, 1.0 - distance / np.sqrt(2))
+                          for doc, distance in zip(docs, response["distances"][row])]
+                results[i] = rerank_by_recency(scored[:items[i][2] * 3], items[i][2], weight=recency_weight)
+                continue
+            fetched = min(MMR_FETCH_K, len(embeddings))
+            selected = maximal_marginal_relevance(
+                query_vectors[i], list(embeddings[:fetched]), k=min(items[i][2], fetched), lambda_mult=MMR_LAMBDA
+            )
+            results[i] = [docs[j] for j in selected]
+    return results
+
+
+class MicroBatcher:
+    """
+    Collects retrieval requests for up to ``wait_ms`` (or ``max_batch``
+    requests) and resolves them with a single ``_search_batch`` call. Each
+    request carries its own date bounds and recency weight, so dated and
+    undated questions share the embedding pass.
+    """
+
+    def __init__(self, wait_ms=BATCH_WAIT_MS, max_batch=MAX_BATCH_SIZE):
+        self.wait_ms = wait_ms
+        self.max_batch = max_batch
+        self._pending = []
+        self._flush_handle = None
+        self._lock = asyncio.Lock()
+        self.batches = 0
+        self.batched_queries = 0
+
+    async def submit(self, query, thread, top_k, start=None, end=None, recency_weight=RECENCY_WEIGHT):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(((query, thread, top_k, start, end, recency_weight), future))
+        if len(self._pending) >= self.max_batch:
+            self._schedule(0)
+        elif self._flush_handle is None:
+            self._schedule(self.wait_ms / 1000)
+        return await future
+
+    def _schedule(self, delay):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        loop = asyncio.get_running_loop()
+        self._flush_handle = loop.call_later(delay, lambda: asyncio.ensure_future(self._flush()))
+
+    async def _flush(self):
+        self._flush_handle = None
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        if not batch:
+            return
+        if self._pending:
+            # The rest has waited long enough; it runs as soon as this batch is done
+            self._schedule(0)
+        # One batch in flight at a time keeps the embedding model single-threaded
+        async with self._lock:
+            self.batches += 1
+            self.batched_queries += len(batch)
+            try:
+                results = await asyncio.get_running_loop().run_in_executor(
+                    None, _search_batch, [item for item, _ in batch]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+        for (_, future), docs in zip(batch, results):
+            if not future.done():
+                future.set_result(docs)
+
+
+# 2. HTTP app
+def create_app():
+    """
+    Builds the FastAPI query service.
+
+    Endpoints:
+        POST /retrieve  retrieval only -> {"documents": [...]}
+        POST /ask       header lookup or full RAG -> {"answer": str, "documents": [...]}
+        POST /chat/sessions       start a chat -> {"session_id": str}
+        POST /chat/{session_id}   follow-up question -> {"answer", "documents", "new_documents", "prompt_tokens"}
+                                  (both refuse with 409 when the service runs more than one worker)
+        GET  /threads   indexed thread names
+        GET  /health    liveness and index size
+        GET  /metrics   request, batching and latency counters for this worker
+    """
+    app = FastAPI(title="Email RAG query service")
+    # Load the model and indexes before accepting traffic
+    query_by_thread.get_query_vectorstore()
+    query_by_thread.get_quantized_index()
+    batcher = MicroBatcher()
+    latencies = {"retrieve": deque(maxlen=1000), "ask": deque(maxlen=1000)}
+    counters = {"retrieve": 0, "ask": 0, "errors": 0}
+    started_at = time.time()
+
+    def _bounds(request):
+        try:
+            return parse_iso_bounds(request.since, request.until)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid since/until date: {e}")
+
+    async def _retrieve(request):
+        if request.top_k < 1:
+            raise HTTPException(status_code=400, detail="top_k must be at least 1")
+        start, end = _bounds(request)
+        explicit = start is not None or end is not None
+        if not explicit:
+            start, end = parse_date_bounds(request.query)
+        docs = await batcher.submit(request.query, request.thread, request.top_k, start=start, end=end)
+        if not docs and not explicit and (start is not None or end is not None):
+            # A misread time scope should not hide everything else
+            docs = await batcher.submit(request.query, request.thread, request.top_k)
+        return docs
+
+    @app.post("/retrieve")
+    async def retrieve(request: QueryRequest):
+        started = time.perf_counter()
+        counters["retrieve"] += 1
+        try:
+            docs = await _retrieve(request)
+        except HTTPException:
+            raise
+        except Exception as e:
+            counters["errors"] += 1
+            raise HTTPException(status_code=500, detail=str(e))
+        latencies["retrieve"].append(time.perf_counter() - started)
+        return {"documents": [_doc_to_dict(doc) for doc in docs]}
+
+    @app.post("/ask")
+    async def ask(request: QueryRequest):
+        started = time.perf_counter()
+        counters["ask"] += 1
+        try:
+            loop = asyncio.get_running_loop()
+            routed = await loop.run_in_executor(None, try_route_header_query, request.query, request.thread,
+                                                *_bounds(request))
+            if routed is not None and routed.complete:
+                # Participant / date question answered straight from the header store
+                answer = format_header_answer(routed)
+                docs = []
+            else:
+                docs = await _retrieve(request)
+                if routed is not None:
+                    docs = [header_context_doc(routed)] + docs
+                if not docs:
+                    answer = "⚠️ No relevant documents found for the query."
+                else:
+                    answer = await loop.run_in_executor(
+                        None, query_by_thread.generate_email_answer, request.query, docs
+                    )
+        except HTTPException:
+            raise
+        except Exception as e:
+            counters["errors"] += 1
+            raise HTTPException(status_code=500, detail=str(e))
+        latencies["ask"].append(time.perf_counter() - started)
+        return {"answer": answer, "documents": [_doc_to_dict(doc) for doc in docs]}
+
+    # Chat sessions (and their Ollama prompt state) live in the worker that created
+    # them. With several workers a follow-up would land elsewhere, so chat is refused.
+    workers = int(os.environ.get(WORKERS_ENV, 1))
+
+    def _require_single_worker():
+        if workers > 1:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Chat sessions need a single worker, this service runs {workers}; "
+                       f"start a separate `serve.py --workers 1` for chat",
+            )
+
+    @app.post("/chat/sessions")
+    async def create_chat_session(request: ChatSessionRequest):
+        from helpers.chat_session import get_chat_session_store
+
+        _require_single_worker()
+        session = get_chat_session_store().create(thread=request.thread, top_k=request.top_k)
+        return {"session_id": session.id}
+
+    @app.post("/chat/{session_id}")
+    async def chat(session_id: str, request: ChatTurnRequest):
+        from helpers.chat_session import get_chat_session_store
+
+        _require_single_worker()
+        session = get_chat_session_store().get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired chat session")
+        start, end = _bounds(request)
+        answer, docs, new_docs = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: session.ask(request.query, start=start, end=end)
+        )
+        return {
+            "answer": answer,
+            "documents": [_doc_to_dict(doc) for doc in docs],
+            "new_documents": new_docs,
+            "prompt_tokens": session.turns[-1]["prompt_tokens"],
+        }
+
+    @app.get("/threads")
+    async def threads():
+        metadatas = query_by_thread.get_query_vectorstore()._collection.get(include=["metadatas"])["metadatas"]
+        return {"threads": sorted({(m or {}).get("thread", "Unknown") for m in metadatas})}
+
+    @app.get("/health")
+    async def health():
+        return {
+            "status": "ok",
+            "pid": os.getpid(),
+            "documents": query_by_thread.get_query_vectorstore()._collection.count(),
+            "quantized_index": query_by_thread.get_quantized_index() is not None,
+        }
+
+    @app.get("/metrics")
+    async def metrics():
+        def summary(values):
+            if not values:
+                return {"count": 0}
+            ordered = sorted(values)
+            return {
+                "count": len(ordered),
+                "p50_ms": statistics.median(ordered) * 1000,
+                "p95_ms": ordered[int(0.95 * (len(ordered) - 1))] * 1000,
+            }
+
+        return {
+            "pid": os.getpid(),
+            "uptime_s": time.time() - started_at,
+            "requests": dict(counters),
+            "batches": batcher.batches,
+            "batched_queries": batcher.batched_queries,
+            "avg_batch_size": batcher.batched_queries / batcher.batches if batcher.batches else 0.0,
+            "latency": {name: summary(values) for name, values in latencies.items()},
+        }
+
+    return app
+
+
+def serve(host="127.0.0.1", port=8800, workers=1):
+    """
+    Runs the service. Each worker process loads its own embedding model, while
+    the Chroma files and the memory-mapped quantized index are shared through
+    the OS page cache. Chat sessions are per process, so ``/chat`` is only
+    served with ``workers=1``.
+    """
+    os.environ[WORKERS_ENV] = str(workers)
+    if workers > 1:
+        print(f"⚠️ {workers} workers: /chat is disabled, run a separate single-worker service for chat")
+    uvicorn.run("helpers.query_service:create_app", factory=True, host=host, port=port, workers=workers)
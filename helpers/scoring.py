@@ -1,6 +1,5 @@
-from sklearn.metrics import f1_score
+import os
 import re
-from query import ask_email_agent2
 import json
 from datetime import datetime
 from pathlib import Path
@@ -27,9 +26,13 @@ def compute_f1(pred, true):
 def evaluate_rag(test_cases):
     scores = []
 
+    # Imported here: helpers.query_by_thread loads the model on first query only
+    from helpers.query_by_thread import ask_email_agent3
+
     for case in test_cases:
         print(f"\n🧪 Question: {case['question']}")
-        pred = ask_email_agent2(case["question"])
+        result = ask_email_agent3(case["question"], case.get("thread", "All Threads"), top_k=case.get("top_k", 10))
+        pred = result[0] if result else ""
         
         em = compute_exact_match(pred, case["expected_answer"])
         f1 = compute_f1(pred, case["expected_answer"])
@@ -79,4 +82,383 @@ def log_results_to_csv(results, output_path="rag_eval_results.csv"):
                 "f1_score": round(r["f1"], 2)
             })
 
-    print(f"✅ Logged {len(results)} results to {output_path}")
\ No newline at end of file
+    print(f"✅ Logged {len(results)} results to {output_path}")
+
+# -----------------------------
+# Retrieval-only evaluation
+# -----------------------------
+# Test cases may carry gold labels instead of (or besides) "expected_answer":
+#   "gold_sources":  email file names that answer the question
+#   "gold_segments": passages that must appear in a retrieved email
+# Each label is one gold unit; a retrieved email covers a source label when
+# the label is its source or one of its collapsed near-duplicates.
+# Like /ask, retrieval is scoped to "since"/"until" (ISO dates) when a case
+# has them, otherwise to the time scope of its question ("last week", ...).
+
+DEFAULT_RETRIEVAL_CONFIG = {
+    "top_k": 10,
+    "search": "mmr",          # "similarity", "mmr", "quantized" or "partitioned" (monthly segments)
+    "fetch_k": 20,            # MMR candidate pool (LangChain's default)
+    "lambda_mult": 0.5,       # MMR relevance/diversity trade-off
+    "shortlist_factor": 10,   # quantized / partitioned search only
+}
+
+
+def retrieval_config_grid(**options):
+    """
+    Expands lists of values into every combination of retrieval configs, e.g.
+    ``retrieval_config_grid(search=["similarity", "mmr"], top_k=[3, 5, 10])``.
+    """
+    from itertools import product
+
+    names = list(options)
+    values = [v if isinstance(v, (list, tuple)) else [v] for v in options.values()]
+    return [dict(zip(names, combo)) for combo in product(*values)]
+
+
+def _normalize_segment(text):
+    return " ".join((text or "").lower().split())
+
+
+def _fingerprint(payload):
+    from hashlib import sha256
+
+    return sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def _load_index(db_directory, batch_size=1000):
+    """Returns (ids, texts, metadatas, unit vectors) of every indexed email."""
+    import numpy as np
+    from helpers.collection import get_collection
+
+    collection = get_collection(db_directory)
+    ids, texts, metadatas, vectors = [], [], [], []
+    for offset in range(0, collection.count(), batch_size):
+        page = collection.get(limit=batch_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+        ids.extend(page["ids"])
+        texts.extend(page["documents"])
+        metadatas.extend(m or {} for m in page["metadatas"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+    vectors = np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return ids, texts, metadatas, vectors / norms
+
+
+def _index_version(db_directory, batch_size=5000):
+    """Fingerprint of the indexed ids and metadata (threads change on merges)."""
+    from helpers.config import EMBEDDING_MODEL_NAME
+    from helpers.collection import get_collection
+
+    collection = get_collection(db_directory)
+    entries = []
+    for offset in range(0, collection.count(), batch_size):
+        page = collection.get(limit=batch_size, offset=offset, include=["metadatas"])
+        entries.extend(zip(page["ids"], page["metadatas"]))
+    return _fingerprint([EMBEDDING_MODEL_NAME, sorted(entries, key=lambda e: e[0])])
+
+
+def _file_version(path):
+    """Content hash and mtime of a manifest file (None when it does not exist)."""
+    from hashlib import sha256
+
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return [path, os.stat(path).st_mtime_ns, sha256(f.read()).hexdigest()[:16]]
+
+
+def _search_version(config, dated):
+    """
+    Fingerprint of the secondary indexes a config reads: the quantized index
+    for search="quantized", the monthly segments for search="partitioned"
+    or for dated questions while time partitions are enabled.
+    """
+    from helpers.config import QUANTIZED_INDEX_DIR, TIME_PARTITION_DIR
+
+    version = {}
+    if config["search"] == "quantized":
+        version["quantized"] = _file_version(QUANTIZED_INDEX_DIR and os.path.join(QUANTIZED_INDEX_DIR, "manifest.json"))
+    if TIME_PARTITION_DIR and (config["search"] == "partitioned" or dated):
+        from helpers.time_partitions import MANIFEST_NAME
+
+        version["partitions"] = _file_version(os.path.join(TIME_PARTITION_DIR, MANIFEST_NAME))
+    return version
+
+
+def _case_bounds(case, now=None):
+    """(start, end) a case is scoped to: its since/until, else the question's time scope."""
+    from helpers.time_partitions import parse_date_bounds, parse_iso_bounds
+
+    if case.get("since") or case.get("until"):
+        return parse_iso_bounds(case.get("since"), case.get("until"))
+    return parse_date_bounds(case["question"], now=now)
+
+
+def _timestamps(metadatas):
+    """Sent time of every email (NaN when undated), from "timestamp" or the Date header."""
+    import numpy as np
+    from helpers.header_store import parse_email_date
+
+    values = []
+    for meta in metadatas:
+        ts = meta.get("timestamp")
+        if ts is None:
+            parsed = parse_email_date(meta.get("date"))
+            ts = parsed.timestamp() if parsed else None
+        values.append(np.nan if ts is None else float(ts))
+    return np.array(values, dtype=np.float64)
+
+
+def _date_mask(timestamps, start, end):
+    """Boolean row filter for [start, end]; None when unbounded."""
+    import numpy as np
+
+    if start is None and end is None:
+        return None
+    mask = ~np.isnan(timestamps)
+    if start is not None:
+        mask &= timestamps >= start.timestamp()
+    if end is not None:
+        mask &= timestamps <= end.timestamp()
+    return mask
+
+
+def _relevance(case, texts, metadatas):
+    """
+    Returns a (docs, units) boolean matrix: which gold unit each email covers.
+    """
+    import numpy as np
+
+    sources = [str(s) for s in case.get("gold_sources", [])]
+    segments = [_normalize_segment(s) for s in case.get("gold_segments", [])]
+    covers = np.zeros((len(texts), len(sources) + len(segments)), dtype=bool)
+    for i, (text, meta) in enumerate(zip(texts, metadatas)):
+        names = {meta.get("source")} | {s.strip() for s in (meta.get("duplicate_sources") or "").split(",")}
+        for j, source in enumerate(sources):
+            covers[i, j] = source in names
+        if segments:
+            body = _normalize_segment(text)
+            for j, segment in enumerate(segments, start=len(sources)):
+                covers[i, j] = segment in body
+    return covers
+
+
+def _rank(config, scores, vectors, query_vectors, ids, threads, bounds=None, timestamps=None):
+    """Ranks the index for every question; returns a list of row-index arrays."""
+    import numpy as np
+
+    k = min(config["top_k"], scores.shape[1])
+    bounds = bounds or [(None, None)] * len(threads)
+    if config["search"] in ("quantized", "partitioned"):
+        row_of = {doc_id: i for i, doc_id in enumerate(ids)}
+        rankings = [None] * len(threads)
+        if config["search"] == "partitioned":
+            from helpers.query_by_thread import get_time_partitions
+
+            index = get_time_partitions()
+            if index is None:
+                raise ValueError("search='partitioned' needs EMAIL_RAG_TIME_PARTITION_DIR to point at built partitions")
+            for i, (thread, (start, end)) in enumerate(zip(threads, bounds)):
+                hits = index.search(query_vectors[i], k=k, start=start, end=end, thread=thread,
+                                    shortlist_factor=config["shortlist_factor"], recency_weight=0.0)
+                rankings[i] = np.array([row_of[doc_id] for doc_id, _ in hits if doc_id in row_of], dtype=int)
+            return rankings
+
+        from helpers.query_by_thread import get_quantized_index
+
+        index = get_quantized_index()
+        if index is None:
+            raise ValueError("search='quantized' needs EMAIL_RAG_QUANTIZED_INDEX_DIR to point at a built index")
+        index.refresh()
+        index_rows = np.array([row_of.get(doc_id, -1) for doc_id in index.ids], dtype=int)
+        # One batched search per (thread, date range)
+        for group in set(zip(threads, bounds)):
+            rows = [i for i, key in enumerate(zip(threads, bounds)) if key == group]
+            thread, (start, end) = group
+            mask = None
+            if start is not None or end is not None:
+                mask = (index_rows >= 0) & _date_mask(timestamps[np.maximum(index_rows, 0)], start, end)
+            results = index.search(query_vectors[rows], k=k, thread=thread, shortlist_factor=config["shortlist_factor"],
+                                   mask=mask)
+            for i, hits in zip(rows, results):
+                rankings[i] = np.array([row_of[doc_id] for doc_id, _ in hits if doc_id in row_of], dtype=int)
+        return rankings
+    if config["search"] not in ("similarity", "mmr"):
+        raise ValueError(f"Unknown retrieval search type: {config['search']}")
+
+    pool = k if config["search"] == "similarity" else min(max(config["fetch_k"], k), scores.shape[1])
+    # One partial sort over the whole (questions, emails) score matrix
+    top = np.argpartition(-scores, pool - 1, axis=1)[:, :pool]
+    top = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+    if config["search"] == "mmr":
+        # Same MMR as the LangChain retriever used by ask_email_agent3
+        from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+    rankings = []
+    for query_vector, row, candidates in zip(query_vectors, scores, top):
+        candidates = candidates[np.isfinite(row[candidates])]
+        if config["search"] == "similarity" or not len(candidates):
+            rankings.append(candidates[:k])
+            continue
+        picked = maximal_marginal_relevance(
+            query_vector, vectors[candidates], lambda_mult=config["lambda_mult"], k=k
+        )
+        rankings.append(candidates[picked])
+    return rankings
+
+
+def _score_ranking(ranking, covers, k):
+    """recall@k, MRR and nDCG@k (binary relevance) of one ranked list."""
+    import numpy as np
+
+    n_units = covers.shape[1]
+    relevant = covers[ranking].any(axis=1) if len(ranking) else np.zeros(0, dtype=bool)
+    covered = covers[ranking].any(axis=0).sum() if len(ranking) else 0
+    first = np.flatnonzero(relevant)
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = float((relevant * discounts[:len(relevant)]).sum())
+    ideal = float(discounts[:min(k, int(covers.any(axis=1).sum()))].sum())
+    return {
+        "recall": float(covered / n_units) if n_units else 0.0,
+        "mrr": float(1.0 / (first[0] + 1)) if len(first) else 0.0,
+        "ndcg": dcg / ideal if ideal else 0.0,
+    }
+
+
+def evaluate_retrieval(test_cases, configs=None, db_directory=None, cache_path=None, use_cache=True):
+    """
+    Scores retrieval alone against gold-labelled test cases; the LLM is never called.
+
+    All questions are embedded in one batch and scored against every indexed
+    vector with a single matrix product; each config then only re-ranks
+    those scores. Results are cached per (index version, config, cases and
+    their date bounds, version of the quantized index or time partitions
+    searched), so re-running a sweep after changing one knob only computes
+    the new configs.
+
+    Args:
+        test_cases (list[dict]): Cases with "question", optional "thread",
+            "since" / "until", and "gold_sources" and/or "gold_segments".
+        configs (dict | list[dict]): Retrieval configs (see
+            ``DEFAULT_RETRIEVAL_CONFIG``); missing keys use the defaults.
+        db_directory (str): ChromaDB directory (defaults to DB_DIRECTORY).
+        cache_path (str): JSON results cache (defaults to RETRIEVAL_EVAL_CACHE_PATH).
+        use_cache (bool): Read cached results; results are always written.
+
+    Returns:
+        list[dict]: One summary per config with mean recall@k, MRR, nDCG@k
+        and the per-case scores.
+    """
+    import time
+
+    import numpy as np
+    from helpers.config import DB_DIRECTORY, RETRIEVAL_EVAL_CACHE_PATH
+
+    db_directory = db_directory or DB_DIRECTORY
+    cache_path = Path(cache_path or RETRIEVAL_EVAL_CACHE_PATH)
+    if configs is None or isinstance(configs, dict):
+        configs = [configs or {}]
+    configs = [{**DEFAULT_RETRIEVAL_CONFIG, **config} for config in configs]
+
+    cases = [c for c in test_cases if c.get("gold_sources") or c.get("gold_segments")]
+    if len(cases) < len(test_cases):
+        print(f"⚠️ Skipping {len(test_cases) - len(cases)} case(s) without gold_sources/gold_segments")
+    if not cases:
+        return []
+
+    cache = json.loads(cache_path.read_text()) if cache_path.exists() else {}
+    index_version = _index_version(db_directory)
+    # Relative scopes ("last week") resolve against today, so the bounds are part of the key
+    bounds = [_case_bounds(c) for c in cases]
+    dated = any(start is not None or end is not None for start, end in bounds)
+    cases_key = _fingerprint([[c["question"], c.get("thread"), c.get("gold_sources"), c.get("gold_segments"), b]
+                              for c, b in zip(cases, bounds)])
+    keys = [_fingerprint([index_version, cases_key, config, _search_version(config, dated)]) for config in configs]
+
+    summaries = [dict(cache[key], cached=True) if use_cache and key in cache else None for key in keys]
+    pending = [i for i, summary in enumerate(summaries) if summary is None]
+    if pending:
+        from helpers.indexer_by_thread import get_embedding_model
+        from helpers.quantized_index import thread_mask
+        from helpers.query_by_thread import thread_filter
+
+        started = time.perf_counter()
+        ids, texts, metadatas, vectors = _load_index(db_directory)
+        if not ids:
+            print("⚠️ The index is empty, nothing to evaluate")
+            return []
+        query_vectors = np.asarray(get_embedding_model().embed_queries([c["question"] for c in cases]),
+                                   dtype=np.float32)
+        query_vectors /= np.maximum(np.linalg.norm(query_vectors, axis=1, keepdims=True), 1e-12)
+
+        threads = [thread_filter(c.get("thread", "All Threads")) for c in cases]
+        index_threads = np.array([m.get("thread") for m in metadatas], dtype=object)
+        scores = query_vectors @ vectors.T
+        timestamps = _timestamps(metadatas)
+        for row, (thread, (start, end)) in enumerate(zip(threads, bounds)):
+            if thread is not None:
+                scores[row, ~thread_mask(index_threads, thread)] = -np.inf
+            in_range = _date_mask(timestamps, start, end)
+            if in_range is not None:
+                scores[row, ~in_range] = -np.inf
+        covers = [_relevance(c, texts, metadatas) for c in cases]
+        print(f"📐 Scored {len(cases)} question(s) against {len(ids)} email(s) "
+              f"in {time.perf_counter() - started:.2f}s")
+
+        for i in pending:
+            config = configs[i]
+            started = time.perf_counter()
+            rankings = _rank(config, scores, vectors, query_vectors, ids, threads, bounds, timestamps)
+            per_case = []
+            for case, ranking, cover in zip(cases, rankings, covers):
+                metrics = _score_ranking(ranking, cover, config["top_k"])
+                per_case.append({
+                    "question": case["question"],
+                    **metrics,
+                    "retrieved": [metadatas[r].get("source") for r in ranking],
+                })
+            summary = {
+                "index_version": index_version,
+                "config": config,
+                "recall": float(np.mean([c["recall"] for c in per_case])),
+                "mrr": float(np.mean([c["mrr"] for c in per_case])),
+                "ndcg": float(np.mean([c["ndcg"] for c in per_case])),
+                "seconds": time.perf_counter() - started,
+                "cases": per_case,
+            }
+            cache[keys[i]] = summary
+            summaries[i] = dict(summary, cached=False)
+
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.write_text(json.dumps(cache, indent=2))
+
+    for summary in summaries:
+        config = summary["config"]
+        print(f"📊 {config['search']:<10} top_k={config['top_k']:<3} "
+              f"recall@k={summary['recall']:.3f} MRR={summary['mrr']:.3f} nDCG@k={summary['ndcg']:.3f}"
+              f"{' (cached)' if summary['cached'] else ''}")
+    return summaries
+
+
+def log_retrieval_results_to_csv(summaries, output_path="retrieval_eval_results.csv"):
+    fieldnames = ["timestamp", "index_version", *DEFAULT_RETRIEVAL_CONFIG, "recall", "mrr", "ndcg"]
+
+    with open(output_path, "a", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+
+        if csvfile.tell() == 0:
+            writer.writeheader()
+
+        timestamp = datetime.now().isoformat(timespec="seconds")
+        for s in summaries:
+            writer.writerow({
+                "timestamp": timestamp,
+                "index_version": s["index_version"],
+                **{name: s["config"].get(name) for name in DEFAULT_RETRIEVAL_CONFIG},
+                "recall": round(s["recall"], 3),
+                "mrr": round(s["mrr"], 3),
+                "ndcg": round(s["ndcg"], 3),
+            })
+
+    print(f"✅ Logged {len(summaries)} retrieval results to {output_path}")
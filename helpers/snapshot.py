@@ -0,0 +1,400 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import closing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import zstandard
+from helpers.collection import get_collection
+from helpers.config import DB_DIRECTORY, EMBEDDING_MODEL_NAME
+
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+CATALOG_FILE = "catalog.json"
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"
+SIDECAR_DIR = "sidecars"
+
+
+def _sha256_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _quantize(vectors, vector_dtype):
+    """Returns (stored_vectors, per-row scales or None)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vector_dtype == "float16":
+        return vectors.astype(np.float16), None
+    if vector_dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    raise ValueError(f"Unsupported snapshot vector dtype: {vector_dtype}")
+
+
+def _write_shard(path, records, level):
+    payload = "\n".join(json.dumps(r, ensure_ascii=False) for r in records).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(zstandard.ZstdCompressor(level=level).compress(payload))
+    return path
+
+
+def _read_shard(path):
+    with open(path, "rb") as f:
+        payload = zstandard.ZstdDecompressor().decompress(f.read())
+    return [json.loads(line) for line in payload.decode("utf-8").splitlines() if line]
+
+
+def sidecar_paths(db_directory=DB_DIRECTORY):
+    """
+    Stores kept next to a Chroma directory that the vectors alone cannot
+    rebuild: {snapshot file name: path}. The configured paths are used for
+    DB_DIRECTORY; other directories use the same suffixes as the defaults.
+    """
+    from helpers.config import HEADER_STORE_PATH, NEAR_DUPLICATE_INDEX_PATH, THREAD_INDEX_PATH
+
+    if os.path.abspath(db_directory) == os.path.abspath(DB_DIRECTORY):
+        return {
+            "headers.sqlite3": HEADER_STORE_PATH,
+            "threads.json": THREAD_INDEX_PATH,
+            "duplicates.sqlite3": NEAR_DUPLICATE_INDEX_PATH,
+        }
+    return {
+        "headers.sqlite3": db_directory + "_headers.sqlite3",
+        "threads.json": db_directory + "_threads.json",
+        "duplicates.sqlite3": db_directory + "_duplicates.sqlite3",
+    }
+
+
+def _copy_sidecar(source, target):
+    """Copies one store; SQLite files go through the backup API so a live writer cannot tear them."""
+    tmp_path = target + ".tmp"
+    if source.endswith(".sqlite3"):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with closing(sqlite3.connect(source)) as src, closing(sqlite3.connect(tmp_path)) as dst:
+            src.backup(dst)
+    else:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, target)
+
+
+def _export_sidecars(snapshot_dir, db_directory):
+    """Copies the header store, thread index and duplicate index into the snapshot."""
+    os.makedirs(os.path.join(snapshot_dir, SIDECAR_DIR), exist_ok=True)
+    names = []
+    for name, path in sidecar_paths(db_directory).items():
+        if os.path.exists(path):
+            _copy_sidecar(path, os.path.join(snapshot_dir, SIDECAR_DIR, name))
+            names.append(name)
+    return names
+
+
+def _restore_sidecars(snapshot_dir, manifest, db_directory):
+    """Puts the snapshot's stores next to the imported collection, replacing any there."""
+    restored = []
+    for name, path in sidecar_paths(db_directory).items():
+        if name not in manifest.get("sidecars", []):
+            continue
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        for stale in (path + "-wal", path + "-shm", path + "-journal"):
+            if os.path.exists(stale):
+                os.remove(stale)
+        _copy_sidecar(os.path.join(snapshot_dir, SIDECAR_DIR, name), path)
+        restored.append(name)
+    return restored
+
+
+def _rebuild_derived_indexes(db_directory):
+    """Rebuilds the configured quantized index and time partitions from the imported vectors."""
+    from helpers.config import QUANTIZED_INDEX_DIR, TIME_PARTITION_DIR
+
+    if os.path.abspath(db_directory) != os.path.abspath(DB_DIRECTORY):
+        return
+    if QUANTIZED_INDEX_DIR:
+        from helpers.quantized_index import build_quantized_index
+
+        build_quantized_index(QUANTIZED_INDEX_DIR, db_directory)
+    if TIME_PARTITION_DIR:
+        from helpers.time_partitions import build_time_partitions
+
+        build_time_partitions(db_directory=db_directory)
+
+
+# 1. Export
+def export_snapshot(snapshot_dir, db_directory=DB_DIRECTORY, vector_dtype="float16",
+                    batch_size=1000, workers=4, zstd_level=9):
+    """
+    Streams a Chroma collection into a compact snapshot directory.
+
+    The snapshot holds a single ``vectors.npy`` (float16, or int8 with per-row
+    scales in ``scales.npy``), zstd-compressed JSONL shards with ids, texts and
+    metadata, a thread catalog, copies of the sidecar stores (header store,
+    thread index, duplicate index; see ``sidecar_paths``) and a manifest
+    with SHA-256 checksums. Pages are read one at a time and shards are compressed in parallel, so
+    memory stays bounded by ``batch_size``.
+
+    Args:
+        snapshot_dir (str): Output directory (created if missing).
+        db_directory (str): ChromaDB persistence directory to export.
+        vector_dtype (str): "float16" or "int8".
+        batch_size (int): Records per page / shard.
+        workers (int): Parallel compression threads.
+        zstd_level (int): zstd compression level.
+
+    Returns:
+        dict: The written manifest.
+    """
+    started = time.time()
+    os.makedirs(snapshot_dir, exist_ok=True)
+    collection = get_collection(db_directory)
+    total = collection.count()
+
+    vectors_out = None
+    scales_out = None
+    catalog = {}
+    shard_files = []
+    futures = deque()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for shard_no, offset in enumerate(range(0, total, batch_size)):
+            page = collection.get(
+                limit=batch_size,
+                offset=offset,
+                include=["embeddings", "documents", "metadatas"]
+            )
+            embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+
+            if vectors_out is None:
+                dim = embeddings.shape[1]
+                stored_dtype = np.float16 if vector_dtype == "float16" else np.int8
+                vectors_out = np.lib.format.open_memmap(
+                    os.path.join(snapshot_dir, VECTORS_FILE), mode="w+", dtype=stored_dtype, shape=(total, dim)
+                )
+                if vector_dtype == "int8":
+                    scales_out = np.lib.format.open_memmap(
+                        os.path.join(snapshot_dir, SCALES_FILE), mode="w+", dtype=np.float32, shape=(total,)
+                    )
+
+            stored, scales = _quantize(embeddings, vector_dtype)
+            vectors_out[offset:offset + len(stored)] = stored
+            if scales_out is not None:
+                scales_out[offset:offset + len(stored)] = scales
+
+            records = []
+            for doc_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                metadata = metadata or {}
+                records.append({"id": doc_id, "document": text, "metadata": metadata})
+                thread = metadata.get("thread", "Unknown")
+                entry = catalog.setdefault(thread, {"count": 0, "sources": []})
+                entry["count"] += 1
+                if metadata.get("source") and metadata["source"] not in entry["sources"]:
+                    entry["sources"].append(metadata["source"])
+
+            shard_name = f"records-{shard_no:05d}.jsonl.zst"
+            shard_files.append(shard_name)
+            futures.append(pool.submit(_write_shard, os.path.join(snapshot_dir, shard_name), records, zstd_level))
+            # Same bounded window as the import: pages wait for the oldest writes
+            while len(futures) > 2 * workers:
+                futures.popleft().result()
+
+        for future in futures:
+            future.result()
+
+    if vectors_out is not None:
+        vectors_out.flush()
+        del vectors_out
+    if scales_out is not None:
+        scales_out.flush()
+        del scales_out
+
+    with open(os.path.join(snapshot_dir, CATALOG_FILE), "w") as f:
+        json.dump(catalog, f, indent=2)
+
+    sidecars = _export_sidecars(snapshot_dir, db_directory)
+    files = shard_files + [CATALOG_FILE] + [f"{SIDECAR_DIR}/{name}" for name in sidecars]
+    if total:
+        files.append(VECTORS_FILE)
+        if vector_dtype == "int8":
+            files.append(SCALES_FILE)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        checksums = dict(zip(files, pool.map(lambda name: _sha256_file(os.path.join(snapshot_dir, name)), files)))
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "collection_metadata": collection.metadata,
+        "count": total,
+        "vector_dtype": vector_dtype,
+        "shards": shard_files,
+        "sidecars": sidecars,
+        "files": {
+            name: {"sha256": checksums[name], "bytes": os.path.getsize(os.path.join(snapshot_dir, name))}
+            for name in files
+        },
+    }
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    size = sum(entry["bytes"] for entry in manifest["files"].values())
+    print(f"✅ Exported {total} record(s) to {snapshot_dir} ({size / 1024 / 1024:.1f} MB) in {time.time() - started:.1f}s")
+    return manifest
+
+
+# 2. Read / verify
+def read_manifest(snapshot_dir):
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format: {manifest.get('format_version')}")
+    return manifest
+
+
+def verify_snapshot(snapshot_dir, workers=4):
+    """
+    Checks every file in the snapshot against the manifest checksums.
+
+    Raises:
+        ValueError: If a file is missing or its checksum does not match.
+    """
+    manifest = read_manifest(snapshot_dir)
+    names = list(manifest["files"])
+
+    def check(name):
+        path = os.path.join(snapshot_dir, name)
+        if not os.path.exists(path):
+            return f"missing {name}"
+        if _sha256_file(path) != manifest["files"][name]["sha256"]:
+            return f"checksum mismatch for {name}"
+        return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        errors = [e for e in pool.map(check, names) if e]
+    if errors:
+        raise ValueError("Corrupt snapshot: " + "; ".join(errors))
+    return manifest
+
+
+def load_snapshot_vectors(snapshot_dir, dequantize=False):
+    """
+    Memory-maps the snapshot vectors without copying them into RAM.
+
+    Args:
+        snapshot_dir (str): Snapshot directory.
+        dequantize (bool): Return float32 vectors instead of the stored dtype
+            (this materialises the array).
+
+    Returns:
+        tuple: (vectors, scales) where scales is None unless the snapshot is int8.
+    """
+    manifest = read_manifest(snapshot_dir)
+    if not manifest["count"]:
+        return np.zeros((0, 0), dtype=np.float32), None
+    vectors = np.load(os.path.join(snapshot_dir, VECTORS_FILE), mmap_mode="r")
+    scales = None
+    if manifest["vector_dtype"] == "int8":
+        scales = np.load(os.path.join(snapshot_dir, SCALES_FILE), mmap_mode="r")
+    if dequantize:
+        vectors = _dequantize(vectors, scales)
+    return vectors, scales
+
+
+def _dequantize(vectors, scales):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if scales is not None:
+        vectors = vectors * np.asarray(scales, dtype=np.float32)[:, None]
+    return vectors
+
+
+def load_snapshot_catalog(snapshot_dir):
+    with open(os.path.join(snapshot_dir, CATALOG_FILE)) as f:
+        return json.load(f)
+
+
+# 3. Import
+def _iter_shards(shard_paths, workers):
+    """
+    Yields decompressed shards in order. At most ``2 * workers`` shards are
+    submitted ahead of the consumer, so memory stays bounded however many
+    shards the snapshot has.
+    """
+    window = max(1, 2 * workers)
+    paths = iter(shard_paths)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque(pool.submit(_read_shard, path) for _, path in zip(range(window), paths))
+        while in_flight:
+            records = in_flight.popleft().result()
+            next_path = next(paths, None)
+            if next_path is not None:
+                in_flight.append(pool.submit(_read_shard, next_path))
+            yield records
+
+
+def import_snapshot(snapshot_dir, db_directory=DB_DIRECTORY, batch_size=1000, workers=4, verify=True):
+    """
+    Loads a snapshot into a ChromaDB directory without re-embedding anything.
+
+    Shards are decompressed in parallel, a bounded window ahead of the
+    writes, while vectors are streamed from the memory-mapped array in batches.
+    Into an empty collection, the snapshot's sidecar stores are restored too,
+    so header lookups, thread grouping and dedupe agree with the vectors; the
+    configured quantized index and time partitions are then rebuilt.
+
+    Args:
+        snapshot_dir (str): Snapshot directory written by ``export_snapshot``.
+        db_directory (str): Target ChromaDB persistence directory.
+        batch_size (int): Records added to Chroma per call.
+        workers (int): Parallel decompression / checksum threads.
+        verify (bool): Check manifest checksums before importing.
+
+    Returns:
+        int: Number of imported records.
+    """
+    started = time.time()
+    manifest = verify_snapshot(snapshot_dir, workers) if verify else read_manifest(snapshot_dir)
+    if manifest["embedding_model"] != EMBEDDING_MODEL_NAME:
+        print(f"⚠️ Snapshot was built with {manifest['embedding_model']}, current model is {EMBEDDING_MODEL_NAME}")
+
+    collection = get_collection(db_directory, create=True, metadata=manifest.get("collection_metadata"))
+    fresh = collection.count() == 0
+    vectors, scales = load_snapshot_vectors(snapshot_dir)
+
+    imported = 0
+    shard_paths = [os.path.join(snapshot_dir, name) for name in manifest["shards"]]
+    # Shards come back in order, which matches the row order of vectors.npy
+    for records in _iter_shards(shard_paths, workers):
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            rows = slice(imported, imported + len(batch))
+            embeddings = _dequantize(vectors[rows], None if scales is None else scales[rows])
+            collection.upsert(
+                ids=[r["id"] for r in batch],
+                embeddings=embeddings,
+                documents=[r["document"] for r in batch],
+                metadatas=[r["metadata"] or None for r in batch]
+            )
+            imported += len(batch)
+
+    if fresh:
+        restored = _restore_sidecars(snapshot_dir, manifest, db_directory)
+        if restored:
+            print(f"🗂️ Restored {', '.join(restored)}")
+    elif manifest.get("sidecars"):
+        # Merging two header / thread / duplicate stores is not supported
+        print(f"⚠️ {db_directory} already had records; its sidecar stores were left as they are")
+    if imported:
+        _rebuild_derived_indexes(db_directory)
+
+    print(f"✅ Imported {imported} record(s) into {db_directory} in {time.time() - started:.1f}s")
+    return imported
@@ -0,0 +1,320 @@
+import hashlib
+import json
+import os
+import re
+from contextlib import contextmanager
+from email.utils import getaddresses
+
+# RE:, Fwd:, AW: (German), SV: (Nordic), optionally with a counter like "Re[2]:"
+_REPLY_PREFIX = re.compile(r"^\s*((re|fw|fwd|aw|sv|wg)\s*(\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+_MESSAGE_ID = re.compile(r"<[^<>\s]+>")
+
+
+def normalize_subject(subject):
+    """Lower-cases a subject and strips reply/forward prefixes and extra spaces."""
+    subject = _REPLY_PREFIX.sub("", subject or "")
+    return re.sub(r"\s+", " ", subject).strip().lower()
+
+
+def parse_addresses(*values):
+    """Returns the set of lower-cased email addresses found in header values."""
+    return {addr.lower() for _, addr in getaddresses([v for v in values if v]) if "@" in addr}
+
+
+def parse_message_ids(value):
+    """Extracts Message-IDs from a header value (``<id@host>`` form or bare tokens)."""
+    if not value:
+        return []
+    ids = _MESSAGE_ID.findall(value)
+    if not ids:
+        ids = value.split()
+    return [i.strip("<>").lower() for i in ids]
+
+
+def email_key(headers, body=""):
+    """Stable identity of an email: its Message-ID, else a hash of headers + body."""
+    ids = parse_message_ids(headers.get("message-id"))
+    if ids:
+        return "msg:" + ids[0]
+    raw = "|".join([headers.get("from") or "", headers.get("to") or "", headers.get("date") or "",
+                    headers.get("subject") or "", body[:500]])
+    return "hash:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ThreadGrouper:
+    """
+    Incrementally groups emails into conversations with a persistent union-find.
+
+    Emails are linked through ``Message-ID`` / ``In-Reply-To`` / ``References``.
+    Emails without usable references fall back to their normalised subject, and
+    are only joined to an existing conversation with the same subject if they
+    share at least one participant. Every conversation gets its own label, so
+    a label identifies exactly one union-find root. New mail can merge two
+    existing conversations; the absorbed roots are collected in ``merges`` so
+    callers can relabel already indexed documents.
+
+    Several processes (the upload page, ``cli.py watch``, the daemon) may
+    ingest at once, so writers go through ``ThreadGrouper.locked``.
+
+    Args:
+        path (str): JSON file the state is loaded from and saved to.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.parent = {}
+        self.size = {}
+        self.labels = {}        # root node -> thread label
+        self.subjects = {}      # normalised subject -> [[email node, participants], ...]
+        self.merges = {}        # absorbed root -> (its label, absorbing root), since the last pop_merges()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.parent = state["parent"]
+            self.size = state["size"]
+            self.labels = state["labels"]
+            self.subjects = state["subjects"]
+        self._used_labels = set(self.labels.values())
+        # Reverse indexes, so removing an email does not scan every node and subject
+        self._children = {}     # node -> nodes whose parent it is
+        for node, parent in self.parent.items():
+            if parent != node:
+                self._children.setdefault(parent, set()).add(node)
+        self._subjects_of = {}  # email node -> normalised subjects it is a candidate for
+        for subject, candidates in self.subjects.items():
+            for node, _ in candidates:
+                self._subjects_of.setdefault(node, set()).add(subject)
+
+    @classmethod
+    @contextmanager
+    def locked(cls, path):
+        """
+        Loads the grouper under an exclusive lock and saves it when the block
+        succeeds, so concurrent ingests never overwrite each other's nodes
+        and labels.
+        """
+        import fcntl
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".lock", "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                grouper = cls(path)
+                yield grouper
+                grouper.save()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "parent": self.parent,
+                "size": self.size,
+                "labels": self.labels,
+                "subjects": self.subjects,
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    # -- union-find ------------------------------------------------------------
+    def _set_parent(self, node, parent):
+        old = self.parent.get(node)
+        if old is not None and old != node:
+            children = self._children.get(old)
+            if children is not None:
+                children.discard(node)
+                if not children:
+                    del self._children[old]
+        self.parent[node] = parent
+        if parent != node:
+            self._children.setdefault(parent, set()).add(node)
+
+    def _find(self, node):
+        if node not in self.parent:
+            self.parent[node] = node
+            self.size[node] = 0
+            return node
+        root = node
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[node] != root:  # path compression
+            next_node = self.parent[node]
+            self._set_parent(node, root)
+            node = next_node
+        return root
+
+    def _union(self, a, b):
+        root_a, root_b = self._find(a), self._find(b)
+        if root_a == root_b:
+            return root_a
+        # The bigger conversation keeps its root and its label
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self._set_parent(root_b, root_a)
+        self.size[root_a] += self.size[root_b]
+
+        label_a, label_b = self.labels.get(root_a), self.labels.pop(root_b, None)
+        if label_a is None and label_b is not None:
+            self.labels[root_a] = label_b
+        elif label_a is not None and label_b is not None and label_a != label_b:
+            self.merges[root_b] = (label_b, root_a)
+        return root_a
+
+    def _new_label(self, root, headers, key, preferred_label):
+        """A label no other conversation uses: the preferred one if free, else with a hash of the root."""
+        if preferred_label and preferred_label not in self._used_labels:
+            label = preferred_label
+        elif preferred_label:
+            label = f"{preferred_label} [{hashlib.sha1(root.encode('utf-8')).hexdigest()[:6]}]"
+        else:
+            label = self._make_label(headers.get("subject"), key)
+        self._used_labels.add(label)
+        return label
+
+    # -- public API --------------------------------------------------------------
+    def add_email(self, key, headers, preferred_label=None):
+        """
+        Adds one email and returns the thread label it belongs to.
+
+        Args:
+            key (str): Email identity, see ``email_key``.
+            headers (dict): Lower-cased header names -> values.
+            preferred_label (str): Label to use if this email starts a new
+                conversation (e.g. a thread name typed in the UI). Further
+                conversations starting under the same name get a short hash
+                of their root appended, so unrelated mail never shares a label.
+
+        Returns:
+            str: Thread label.
+        """
+        node = "email:" + key
+        known = node in self.parent
+        root = self._find(node)
+        if not known:
+            self.size[root] += 1
+
+        references = (
+            parse_message_ids(headers.get("message-id"))
+            + parse_message_ids(headers.get("in-reply-to"))
+            + parse_message_ids(headers.get("references"))
+        )
+        for message_id in references:
+            root = self._union(node, "msg:" + message_id)
+
+        subject = normalize_subject(headers.get("subject"))
+        participants = sorted(parse_addresses(
+            headers.get("from"), headers.get("to"), headers.get("cc")
+        ))
+        if subject and not known:
+            candidates = self.subjects.setdefault(subject, [])
+            # Subject fallback only for mail that headers did not link to another email
+            if self.size[self._find(node)] == 1:
+                for other, other_participants in candidates:
+                    if set(participants) & set(other_participants):
+                        root = self._union(node, other)
+            candidates.append([node, participants])
+            self._subjects_of.setdefault(node, set()).add(subject)
+
+        root = self._find(node)
+        if root not in self.labels:
+            self.labels[root] = self._new_label(root, headers, key, preferred_label)
+        return self.labels[root]
+
+    def remove_email(self, key):
+        """
+        Forgets a deleted email: it no longer counts towards its conversation
+        or serves as a subject-fallback candidate. Nodes that pointed at it
+        are re-attached, so the rest of the conversation stays linked (its
+        Message-ID node stays too, so late replies still find the thread).
+
+        Returns:
+            bool: False if the email was unknown.
+        """
+        node = "email:" + key
+        if node not in self.parent:
+            return False
+        root = self._find(node)
+        children = sorted(self._children.get(node, ()))
+        if root == node:
+            if children:
+                heir = children[0]
+                for child in children[1:]:
+                    self._set_parent(child, heir)
+                self._set_parent(heir, heir)
+                self.size[heir] = self.size[node] - 1
+                if node in self.labels:
+                    self.labels[heir] = self.labels.pop(node)
+                self.merges = {
+                    (heir if absorbed == node else absorbed): (label, heir if by == node else by)
+                    for absorbed, (label, by) in self.merges.items()
+                }
+            else:
+                self._used_labels.discard(self.labels.pop(node, None))
+        else:
+            for child in children:
+                self._set_parent(child, self.parent[node])
+            self.size[root] -= 1
+        self._set_parent(node, node)  # detaches it from its own parent's children
+        del self.parent[node]
+        self.size.pop(node, None)
+
+        for subject in self._subjects_of.pop(node, ()):
+            remaining = [c for c in self.subjects.get(subject, []) if c[0] != node]
+            if remaining:
+                self.subjects[subject] = remaining
+            else:
+                self.subjects.pop(subject, None)
+        return True
+
+    def thread_of(self, key):
+        node = "email:" + key
+        if node not in self.parent:
+            return None
+        return self.labels.get(self._find(node))
+
+    def pop_merges(self):
+        """
+        Returns and clears the merges seen so far as {old label: new label}.
+
+        Merges are tracked per absorbed root and resolved to the label of the
+        conversation that finally holds it. A label that another live root
+        still carries (state saved before labels were unique) is left alone
+        rather than relabelling the other conversation's mail too.
+        """
+        live_labels = {}
+        for root, label in self.labels.items():
+            live_labels.setdefault(label, []).append(root)
+        merges = {}
+        for _, (old_label, absorbed_by) in self.merges.items():
+            new_label = self.labels.get(self._find(absorbed_by))
+            if new_label is None or new_label == old_label:
+                continue
+            if old_label in live_labels:
+                print(f"⚠️ Thread label '{old_label}' is shared by several conversations; not relabelling it")
+                continue
+            merges[old_label] = new_label
+        self.merges = {}
+        return merges
+
+    @staticmethod
+    def _make_label(subject, key):
+        base = _REPLY_PREFIX.sub("", subject or "").strip() or "No Subject"
+        return f"{base} [{hashlib.sha1(key.encode('utf-8')).hexdigest()[:6]}]"
+
+
+def apply_thread_merges(vectorstore, merges):
+    """
+    Relabels already indexed documents after conversations were merged.
+
+    Args:
+        vectorstore (Chroma): Store to update.
+        merges (dict): {old label: new label}.
+    """
+    collection = vectorstore._collection
+    for old, new in merges.items():
+        found = collection.get(where={"thread": old}, include=["metadatas"])
+        if not found["ids"]:
+            continue
+        metadatas = [dict(m or {}, thread=new) for m in found["metadatas"]]
+        collection.update(ids=found["ids"], metadatas=metadatas)
+        print(f"🧵 Merged thread '{old}' into '{new}' ({len(found['ids'])} document(s))")
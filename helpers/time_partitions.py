@@ -0,0 +1,574 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from helpers.config import (
+    RECENCY_HALF_LIFE_DAYS,
+    RECENCY_WEIGHT,
+    TIME_PARTITION_DIR,
+    TIME_PARTITIONS_MAX_LOADED
+)
+from helpers.header_store import parse_email_date
+
+UNDATED = "undated"
+MANIFEST_NAME = "manifest.json"
+TIMESTAMPS_FILE = "timestamps.f64"
+
+_MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+# Capitalised only, so the verb "may" or "march on" are not read as months
+_MONTH = (r"(?P<month>Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?|Aug(?:ust)?"
+          r"|Sep(?:t(?:ember)?)?|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)\b(?:,? (?P<year>(?:19|20)\d\d))?")
+_ISO_DATE = r"(?P<iso>\d{4}-\d{2}-\d{2})"
+_MAIL_WORDS = r"e-?mails?|mails?|messages?|replies|inbox"
+_PAST_CUES = (r"sent|received|arrived|came in|emailed|mailed|wrote|written|replied|forwarded|happened"
+              r"|discussed|decided|agreed|said|asked|announced|shared|escalated")
+_UNITS = {"day": 1, "days": 1, "week": 7, "weeks": 7, "month": 30, "months": 30, "year": 365, "years": 365}
+
+
+# 1. Date bounds
+def month_key(value):
+    """"YYYY-MM" partition name of a datetime or epoch timestamp."""
+    if value is None:
+        return UNDATED
+    if not isinstance(value, datetime):
+        value = datetime.fromtimestamp(value)
+    return value.strftime("%Y-%m")
+
+
+def time_metadata(date_header):
+    """Chroma metadata for the Date header: {"timestamp", "month"}, or {} when unparseable."""
+    parsed = parse_email_date(date_header)
+    if parsed is None:
+        return {}
+    return {"timestamp": parsed.timestamp(), "month": month_key(parsed)}
+
+
+def _month_start(year, month):
+    return datetime(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+
+def _named_month(match, now):
+    """Start of the month named in a match; without a year, its latest occurrence up to now."""
+    month = _MONTHS[match.group("month")[:3].lower()]
+    if match.group("year"):
+        return _month_start(int(match.group("year")), month)
+    year = now.year if month <= now.month else now.year - 1
+    return _month_start(year, month)
+
+
+def parse_date_bounds(question, now=None):
+    """
+    Reads a time scope from a question: "emails sent today", "last week",
+    "past week", "past 3 months", "this year", "in July", "since the July
+    escalation", "Before March 2024", "after 2024-09-01", "in 2023", ...
+
+    Args:
+        question (str): The user question.
+        now (datetime): Reference time (defaults to now).
+
+    Returns:
+        tuple: (start, end) naive datetimes, either of which may be None.
+    """
+    now = now or datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    monday = today - timedelta(days=today.weekday())
+    second = timedelta(seconds=1)
+    text = question.strip()
+
+    relative = [
+        # "today" alone is often about the present ("what may happen today?"), so it only
+        # scopes questions about mail or past events
+        (rf"\btoday'?s (?:{_MAIL_WORDS})\b|\b(?:{_MAIL_WORDS}|{_PAST_CUES})\b[^?.!]*\btoday\b", lambda m: (today, now)),
+        (r"\byesterday\b", lambda m: (today - timedelta(days=1), today - second)),
+        (r"\bthis week\b", lambda m: (monday, now)),
+        (r"\blast week\b", lambda m: (monday - timedelta(days=7), monday - second)),
+        (r"\bthis month\b", lambda m: (_month_start(now.year, now.month), now)),
+        (r"\blast month\b", lambda m: (_month_start(now.year, now.month - 1), _month_start(now.year, now.month) - second)),
+        (r"\bthis year\b", lambda m: (datetime(now.year, 1, 1), now)),
+        (r"\blast year\b", lambda m: (datetime(now.year - 1, 1, 1), datetime(now.year, 1, 1) - second)),
+        (r"\b(?:past|last|previous) (?P<n>\d+) (?P<unit>days?|weeks?|months?|years?)\b",
+         lambda m: (now - timedelta(days=int(m.group("n")) * _UNITS[m.group("unit").lower()]), now)),
+        # Rolling windows: "past week" is the last 7 days, "last week" the previous calendar week
+        (r"\b(?:the )?past (?P<unit>day|week|month|year)\b",
+         lambda m: (now - timedelta(days=_UNITS[m.group("unit").lower()]), now)),
+    ]
+    for pattern, bounds in relative:
+        match = re.search(pattern, text, re.I)
+        if match:
+            return bounds(match)
+
+    # Keywords are case-insensitive; month names stay capitalised (see _MONTH)
+    for word, side in (("since|after", "start"), ("before|until|till|prior to", "end")):
+        match = re.search(rf"\b(?i:{word}) (?i:the |early |mid |late )?(?:{_MONTH}|{_ISO_DATE})", text)
+        if not match:
+            continue
+        if match.group("iso"):
+            day = datetime.fromisoformat(match.group("iso"))
+            start, end = day, day + timedelta(days=1) - second
+        else:
+            start = _named_month(match, now)
+            end = _month_start(start.year, start.month + 1) - second
+        if side == "start":
+            return (end + second if match.group(0).lower().startswith("after") else start), None
+        # "until July" includes July, "before July" does not
+        return None, (end if match.group(0).lower().startswith(("until", "till")) else start - second)
+
+    match = re.search(rf"\b(?i:in|during|on|of) (?i:early |mid |late )?(?:{_MONTH}|{_ISO_DATE})", text)
+    if match:
+        if match.group("iso"):
+            day = datetime.fromisoformat(match.group("iso"))
+            return day, day + timedelta(days=1) - second
+        start = _named_month(match, now)
+        return start, _month_start(start.year, start.month + 1) - second
+
+    match = re.search(r"\b(?:in|during) (?P<year>(?:19|20)\d\d)\b", text, re.I)
+    if match:
+        year = int(match.group("year"))
+        return datetime(year, 1, 1), datetime(year + 1, 1, 1) - second
+    return None, None
+
+
+def parse_iso_bounds(since=None, until=None):
+    """(start, end) from ISO strings; a bare date as ``until`` covers that whole day."""
+    start = datetime.fromisoformat(since) if since else None
+    end = datetime.fromisoformat(until) if until else None
+    if end is not None and len(until) == 10:
+        end += timedelta(days=1) - timedelta(seconds=1)
+    return start, end
+
+
+def date_filter(thread=None, start=None, end=None):
+    """
+    Chroma ``where`` clause for a thread (a label or a tuple of labels, see
+    ``thread_filter``) and/or a date range (None if unfiltered).
+    """
+    clauses = []
+    labels = [thread] if isinstance(thread, str) else list(thread or ())
+    if len(labels) == 1:
+        clauses.append({"thread": labels[0]})
+    elif labels:
+        clauses.append({"thread": {"$in": labels}})
+    if start is not None:
+        clauses.append({"timestamp": {"$gte": start.timestamp()}})
+    if end is not None:
+        clauses.append({"timestamp": {"$lte": end.timestamp()}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def recency_boost(timestamp, now_ts=None, weight=RECENCY_WEIGHT, half_life_days=RECENCY_HALF_LIFE_DAYS):
+    """Score bonus that halves every ``half_life_days``; 0 for undated mail."""
+    if not weight or timestamp is None or np.isnan(timestamp):
+        return 0.0
+    age_days = max(0.0, ((now_ts or time.time()) - timestamp) / 86400)
+    return weight * 0.5 ** (age_days / half_life_days)
+
+
+def rerank_by_recency(scored_docs, k, weight=RECENCY_WEIGHT, half_life_days=RECENCY_HALF_LIFE_DAYS):
+    """Re-sorts (Document, similarity) pairs by similarity plus recency boost."""
+    now_ts = time.time()
+    boosted = sorted(
+        scored_docs,
+        key=lambda pair: pair[1] + recency_boost(pair[0].metadata.get("timestamp"), now_ts, weight, half_life_days),
+        reverse=True,
+    )
+    return [doc for doc, _ in boosted[:k]]
+
+
+# 2. Partitioned index
+def _read_timestamps(directory, count):
+    """Per-row timestamps of a segment (raw appendable file, or the .npy of older builds)."""
+    from helpers.quantized_index import _map_rows
+
+    if not os.path.exists(os.path.join(directory, TIMESTAMPS_FILE)) and os.path.exists(
+            os.path.join(directory, "timestamps.npy")):
+        return np.load(os.path.join(directory, "timestamps.npy"), mmap_mode="r")[:count]
+    return _map_rows(os.path.join(directory, TIMESTAMPS_FILE), np.float64, (count,))
+
+
+def _sync_columns(partition):
+    """Re-maps timestamps and the id -> row map when rows were appended to the segment."""
+    index = partition["index"]
+    index.refresh()
+    if partition["count"] != len(index):
+        partition["timestamps"] = _read_timestamps(index.index_dir, len(index))
+        partition["row_of"] = {doc_id: i for i, doc_id in enumerate(index.ids)}
+        partition["count"] = len(index)
+    return partition
+
+
+class TimePartitionedIndex:
+    """
+    Monthly segments of the email vectors, so date-bounded questions only
+    scan the months they overlap.
+
+    Each month is a ``QuantizedIndex`` (int8 codes in RAM, full-precision
+    vectors memory-mapped for rescoring) plus a timestamp per vector. Segments
+    are loaded on first use and at most ``max_loaded`` stay in memory (LRU),
+    so old months cost nothing until a question reaches back to them.
+    Rebuilt segments are picked up from the manifest without a restart.
+
+    Args:
+        root_dir (str): Directory written by ``build_time_partitions``.
+        max_loaded (int): Segments kept loaded.
+    """
+
+    def __init__(self, root_dir, max_loaded=TIME_PARTITIONS_MAX_LOADED):
+        self.root_dir = root_dir
+        self.max_loaded = max_loaded
+        self.last_stats = {}
+        self._manifest = None
+        self._manifest_mtime = None
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def manifest(self):
+        path = os.path.join(self.root_dir, MANIFEST_NAME)
+        mtime = os.path.getmtime(path)
+        if mtime != self._manifest_mtime:
+            with open(path) as f:
+                self._manifest = json.load(f)
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def overlapping(self, start=None, end=None):
+        """Segments whose date span intersects [start, end]; undated mail only when unbounded."""
+        start_ts = start.timestamp() if start is not None else None
+        end_ts = end.timestamp() if end is not None else None
+        names = []
+        for name, info in self.manifest["partitions"].items():
+            if name == UNDATED:
+                if start_ts is None and end_ts is None:
+                    names.append(name)
+                continue
+            if (start_ts is None or info["max_ts"] >= start_ts) and (end_ts is None or info["min_ts"] <= end_ts):
+                names.append(name)
+        return sorted(names)
+
+    def _partition(self, name):
+        from helpers.quantized_index import QuantizedIndex
+
+        built_at = self.manifest["partitions"][name]["built_at"]
+        with self._lock:
+            cached = self._loaded.get(name)
+            if cached is not None and cached["built_at"] == built_at:
+                self._loaded.move_to_end(name)
+                return _sync_columns(cached)
+        directory = os.path.join(self.root_dir, name)
+        partition = _sync_columns({"index": QuantizedIndex.load(directory), "built_at": built_at, "count": None})
+        with self._lock:
+            self._loaded[name] = partition
+            self._loaded.move_to_end(name)
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        return partition
+
+    def search(self, query_vector, k=10, start=None, end=None, thread=None, shortlist_factor=10,
+               recency_weight=RECENCY_WEIGHT, half_life_days=RECENCY_HALF_LIFE_DAYS):
+        """
+        Searches the segments overlapping [start, end].
+
+        Returns:
+            list[tuple]: (id, score) pairs, best first; scores include the recency boost.
+        """
+        start_ts = start.timestamp() if start is not None else -np.inf
+        end_ts = end.timestamp() if end is not None else np.inf
+        names = self.overlapping(start, end)
+        pool = k * 3 if recency_weight else k
+        now_ts = time.time()
+        hits, scanned = [], 0
+        for name in names:
+            partition = self._partition(name)
+            index, timestamps, row_of = partition["index"], partition["timestamps"], partition["row_of"]
+            mask = None
+            if name != UNDATED and (start is not None or end is not None):
+                mask = (timestamps >= start_ts) & (timestamps <= end_ts)
+            found = index.search(query_vector, k=pool, thread=thread, shortlist_factor=shortlist_factor, mask=mask)[0]
+            scanned += len(index)
+            for doc_id, score in found:
+                if doc_id not in row_of:
+                    continue  # appended after this search started
+                ts = timestamps[row_of[doc_id]]
+                hits.append((doc_id, float(score + recency_boost(ts, now_ts, recency_weight, half_life_days))))
+
+        partitions = self.manifest["partitions"]
+        self.last_stats = {
+            "partitions_searched": len(names),
+            "partitions_total": len(partitions),
+            "vectors_scanned": scanned,
+            "vectors_total": sum(info["count"] for info in partitions.values()),
+        }
+        hits.sort(key=lambda hit: hit[1], reverse=True)
+        return hits[:k]
+
+
+def time_partitioned_search(index, vectorstore, query, k=10, thread=None, start=None, end=None, shortlist_factor=10):
+    """
+    Searches the monthly segments and returns LangChain documents from Chroma.
+
+    Returns:
+        list[Document]: Best-first documents.
+    """
+    from langchain.schema import Document
+
+    query_vector = vectorstore.embeddings.embed_query(query)
+    hits = index.search(query_vector, k=k, start=start, end=end, thread=thread, shortlist_factor=shortlist_factor)
+    stats = index.last_stats
+    print(f"🗓️ Searched {stats['partitions_searched']}/{stats['partitions_total']} month(s), "
+          f"{stats['vectors_scanned']}/{stats['vectors_total']} vector(s)")
+    if not hits:
+        return []
+    found = vectorstore._collection.get(ids=[doc_id for doc_id, _ in hits], include=["documents", "metadatas"])
+    by_id = {doc_id: (text, meta) for doc_id, text, meta in zip(found["ids"], found["documents"], found["metadatas"])}
+    return [
+        Document(page_content=by_id[doc_id][0], metadata=by_id[doc_id][1] or {})
+        for doc_id, _ in hits if doc_id in by_id
+    ]
+
+
+# 3. Build / maintain
+def _read_manifest(root_dir):
+    path = os.path.join(root_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"partitions": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(root_dir, manifest):
+    path = os.path.join(root_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _write_partition(root_dir, name, ids, threads, vectors, timestamps):
+    """Builds a segment next to the live one and swaps it in."""
+    from helpers.quantized_index import QuantizedIndex
+
+    final_dir = os.path.join(root_dir, name)
+    build_dir = f"{final_dir}.build-{os.getpid()}"
+    shutil.rmtree(build_dir, ignore_errors=True)
+    QuantizedIndex.build(build_dir, ids, np.asarray(vectors, dtype=np.float32), threads, mode="int8")
+    np.asarray(timestamps, dtype=np.float64).tofile(os.path.join(build_dir, TIMESTAMPS_FILE))
+    old_dir = f"{final_dir}.old-{os.getpid()}"
+    if os.path.exists(final_dir):
+        os.replace(final_dir, old_dir)
+    os.replace(build_dir, final_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def build_time_partitions(root_dir=None, db_directory=None, months=None, batch_size=1000):
+    """
+    Builds (or refreshes) the monthly segments from the vectors in Chroma.
+
+    Emails indexed before dates were stored get their "timestamp" / "month"
+    metadata backfilled, which also enables date filters on plain Chroma.
+
+    Args:
+        root_dir (str): Output directory (defaults to TIME_PARTITION_DIR).
+        db_directory (str): ChromaDB persistence directory.
+        months (set[str]): Only rebuild these "YYYY-MM" / "undated" segments
+            (None rebuilds everything).
+        batch_size (int): Records read from Chroma per page.
+
+    Returns:
+        dict: The partition manifest.
+    """
+    from helpers.config import DB_DIRECTORY
+    from helpers.quantized_index import _write_lock
+    from helpers.collection import get_collection
+
+    root_dir = root_dir or TIME_PARTITION_DIR
+    if not root_dir:
+        raise ValueError("No partition directory: set EMAIL_RAG_TIME_PARTITION_DIR")
+    started = time.time()
+    os.makedirs(root_dir, exist_ok=True)
+    collection = get_collection(db_directory or DB_DIRECTORY)
+
+    # Undated emails have no "month" to filter on, so refreshing them reads everything
+    where = None
+    if months and UNDATED not in months:
+        where = {"month": {"$in": sorted(months)}}
+
+    groups, backfill = {}, {}
+    for offset in range(0, collection.count(), batch_size):
+        page = collection.get(where=where, limit=batch_size, offset=offset, include=["embeddings", "metadatas"])
+        if not page["ids"]:
+            break
+        for doc_id, meta, vector in zip(page["ids"], page["metadatas"], page["embeddings"]):
+            meta = meta or {}
+            if "timestamp" not in meta:
+                extra = time_metadata(meta.get("date"))
+                if extra:
+                    backfill[doc_id] = dict(meta, **extra)
+                    meta = backfill[doc_id]
+            name = month_key(meta.get("timestamp"))
+            if months and name not in months:
+                continue
+            group = groups.setdefault(name, {"ids": [], "threads": [], "vectors": [], "timestamps": []})
+            group["ids"].append(doc_id)
+            group["threads"].append(meta.get("thread"))
+            group["vectors"].append(vector)
+            group["timestamps"].append(meta.get("timestamp", np.nan))
+
+    if backfill:
+        ids = list(backfill)
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+            collection.update(ids=chunk, metadatas=[backfill[doc_id] for doc_id in chunk])
+        print(f"🗓️ Backfilled timestamp/month metadata of {len(backfill)} email(s)")
+
+    with _write_lock(root_dir):
+        manifest = _read_manifest(root_dir)
+        for name, group in groups.items():
+            _write_partition(root_dir, name, group["ids"], group["threads"], group["vectors"], group["timestamps"])
+            dated = [ts for ts in group["timestamps"] if not np.isnan(ts)]
+            manifest["partitions"][name] = {
+                "count": len(group["ids"]),
+                "min_ts": min(dated) if dated else None,
+                "max_ts": max(dated) if dated else None,
+                "built_at": time.time(),
+            }
+        # Segments that no longer have any email
+        stale = set(manifest["partitions"]) - set(groups) if months is None else set(months) - set(groups)
+        for name in stale:
+            manifest["partitions"].pop(name, None)
+            shutil.rmtree(os.path.join(root_dir, name), ignore_errors=True)
+        _write_manifest(root_dir, manifest)
+
+    total = sum(info["count"] for info in manifest["partitions"].values())
+    print(f"✅ Built {len(groups)} monthly segment(s) ({total} vector(s) in {len(manifest['partitions'])} "
+          f"segment(s)) in {time.time() - started:.1f}s")
+    return manifest
+
+
+def _partition_info(index, timestamps):
+    """Manifest entry of a segment: live row count and date span."""
+    live = np.asarray(timestamps)[:len(index)][index.live]
+    dated = live[~np.isnan(live)]
+    return {
+        "count": int(index.live.sum()),
+        "min_ts": float(dated.min()) if len(dated) else None,
+        "max_ts": float(dated.max()) if len(dated) else None,
+        "built_at": time.time(),
+    }
+
+
+def _appendable(index):
+    from helpers.quantized_index import QUANTIZED_FORMAT_VERSION
+
+    return index.manifest["format_version"] == QUANTIZED_FORMAT_VERSION
+
+
+def refresh_time_partitions(collection, added_ids=(), removed_ids=(), months=None, root_dir=None):
+    """
+    Upserts newly indexed emails into their monthly segments and masks out
+    deleted ones, instead of rebuilding whole months.
+
+    A no-op unless ``build_time_partitions`` has written a manifest: without
+    a full build, a partial manifest would hide every other month.
+
+    Args:
+        collection: Chroma collection holding the added vectors.
+        added_ids (list[str]): Ids of newly indexed emails.
+        removed_ids (list[str]): Ids of deleted emails.
+        months (set[str]): Segments that may hold ``removed_ids`` (None checks all).
+        root_dir (str): Partition directory (defaults to TIME_PARTITION_DIR).
+    """
+    from helpers.quantized_index import QuantizedIndex, _write_lock
+
+    root_dir = root_dir or TIME_PARTITION_DIR
+    added_ids, removed_ids = list(added_ids), list(removed_ids)
+    if not root_dir or not os.path.exists(os.path.join(root_dir, MANIFEST_NAME)) or not (added_ids or removed_ids):
+        return None
+
+    groups = {}
+    if added_ids:
+        found = collection.get(ids=added_ids, include=["embeddings", "metadatas"])
+        for doc_id, meta, vector in zip(found["ids"], found["metadatas"], found["embeddings"]):
+            meta = meta or {}
+            group = groups.setdefault(month_key(meta.get("timestamp")),
+                                      {"ids": [], "threads": [], "vectors": [], "timestamps": []})
+            group["ids"].append(doc_id)
+            group["threads"].append(meta.get("thread"))
+            group["vectors"].append(vector)
+            group["timestamps"].append(meta.get("timestamp", np.nan))
+
+    rebuild = set()
+    with _write_lock(root_dir):
+        manifest = _read_manifest(root_dir)
+        partitions = manifest["partitions"]
+        candidates = sorted(partitions) if months is None else sorted(set(months) & set(partitions))
+        for name in candidates if removed_ids else []:
+            index = QuantizedIndex.load(os.path.join(root_dir, name))
+            if not _appendable(index):
+                rebuild.add(name)
+            elif index.remove(removed_ids):
+                partitions[name] = _partition_info(index, _read_timestamps(index.index_dir, len(index)))
+
+        for name, group in groups.items():
+            directory = os.path.join(root_dir, name)
+            if name in rebuild or (name in partitions and not _appendable(QuantizedIndex.load(directory))):
+                rebuild.add(name)
+                continue
+            if name not in partitions or not os.path.exists(directory):
+                _write_partition(root_dir, name, group["ids"], group["threads"], group["vectors"], group["timestamps"])
+                index = QuantizedIndex.load(directory)
+            else:
+                index = QuantizedIndex.load(directory)
+                stamps_path = os.path.join(directory, TIMESTAMPS_FILE)
+                if not os.path.exists(stamps_path):
+                    # Segment built before appends: move its timestamps to the raw file once
+                    np.asarray(_read_timestamps(directory, len(index)), dtype=np.float64).tofile(stamps_path)
+                index.append(group["ids"], np.asarray(group["vectors"], dtype=np.float32), group["threads"],
+                             columns={TIMESTAMPS_FILE: np.asarray(group["timestamps"], dtype=np.float64)})
+            partitions[name] = _partition_info(index, _read_timestamps(directory, len(index)))
+
+        for name in [n for n, info in partitions.items() if not info["count"]]:
+            partitions.pop(name)
+            shutil.rmtree(os.path.join(root_dir, name), ignore_errors=True)
+        _write_manifest(root_dir, manifest)
+
+    if rebuild:
+        # Segments written before they could be appended to are rebuilt once
+        manifest = build_time_partitions(root_dir, months=rebuild)
+    added = sum(len(group["ids"]) for group in groups.values())
+    print(f"🗓️ Updated time partitions: +{added} / -{len(removed_ids)} vector(s) in {len(groups)} month(s)")
+    return manifest
+
+
+def rename_partition_threads(merges, root_dir=None):
+    """Applies {old label: new label} thread merges to the stored segments."""
+    from helpers.quantized_index import QuantizedIndex, _write_lock
+
+    root_dir = root_dir or TIME_PARTITION_DIR
+    if not root_dir or not merges or not os.path.exists(os.path.join(root_dir, MANIFEST_NAME)):
+        return
+    with _write_lock(root_dir):
+        manifest = _read_manifest(root_dir)
+        rebuild = set()
+        for name, info in manifest["partitions"].items():
+            index = QuantizedIndex.load(os.path.join(root_dir, name))
+            if not any(thread in merges for thread in index.threads):
+                continue
+            if not _appendable(index):
+                rebuild.add(name)
+                continue
+            index.rename_threads(merges)
+            info["built_at"] = time.time()
+        _write_manifest(root_dir, manifest)
+    if rebuild:
+        build_time_partitions(root_dir, months=rebuild)
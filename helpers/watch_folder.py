@@ -0,0 +1,359 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from helpers.config import (
+    DB_DIRECTORY,
+    NEAR_DUPLICATE_THRESHOLD,
+    WATCH_BATCH_SIZE,
+    WATCH_CHECKPOINT_PATH,
+    WATCH_DEBOUNCE_S,
+    WATCH_MAX_ATTEMPTS,
+    WATCH_MAX_BACKOFF_S,
+    WATCH_POLL_INTERVAL_S,
+    WATCH_RETRY_BACKOFF_S
+)
+
+EMAIL_EXTENSIONS = (".txt", ".mbox")
+
+
+def is_email_file(path):
+    name = os.path.basename(path)
+    return name.endswith(EMAIL_EXTENSIONS) and not name.endswith("-parsed.txt") and not name.startswith(".")
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_folder_specs(specs):
+    """
+    Maps "folder" or "folder=Thread name" arguments to {absolute folder: thread or None}.
+    A thread name labels conversations that start in that folder; without one,
+    threads come from the headers only.
+    """
+    folders = {}
+    for spec in specs:
+        folder, _, thread = spec.partition("=")
+        folders[os.path.abspath(folder)] = thread or None
+    return folders
+
+
+class Checkpoint:
+    """
+    Durable record of the files already indexed: path -> mtime, size and
+    content hash. Written atomically after every batch, so a restart only
+    re-indexes files that changed while the watcher was down.
+
+    Files that kept failing are recorded with ``"failed": <attempts>`` and no
+    hash: they count as current, so they are skipped until they change.
+    """
+
+    def __init__(self, path=WATCH_CHECKPOINT_PATH):
+        self.path = path
+        self.files = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.files = json.load(f).get("files", {})
+
+    def is_current(self, path, stat):
+        entry = self.files.get(path)
+        return entry is not None and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size
+
+    def failed(self):
+        return sorted(path for path, entry in self.files.items() if entry.get("failed"))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"files": self.files}, f)
+        os.replace(tmp_path, self.path)
+
+
+class FolderWatcher:
+    """
+    Watches folders for new, changed and deleted ``.txt`` / mbox emails and
+    indexes them incrementally.
+
+    File events come from watchdog (inotify on Linux) when it is installed,
+    otherwise from polling the folders' file stats. Events are debounced:
+    a file is processed once it has been quiet for ``debounce_s``, so a
+    burst of writes to the same file is indexed once. Pending files are then
+    parsed and embedded in batches of ``batch_size``.
+
+    When a batch fails, its files are retried one by one so a single bad file
+    does not hold back the others. A failing file is retried with exponential
+    backoff and, after ``max_attempts``, quarantined in the checkpoint: it is
+    skipped until it is modified (or touched) again.
+
+    Args:
+        folders (dict): {folder: thread label or None}, see ``parse_folder_specs``.
+        checkpoint_path (str): JSON checkpoint file.
+        debounce_s (float): Quiet time before a changed file is indexed.
+        poll_interval_s (float): Scan interval when polling.
+        batch_size (int): Files indexed per batch.
+        max_attempts (int): Failed attempts before a file is quarantined.
+        retry_backoff_s (float): Delay before the first retry, doubled per attempt.
+        use_watchdog (bool): Set to False to force polling.
+        dedupe_threshold (float): Near-duplicate threshold, 0 disables it.
+        index_lock (threading.Lock): Held around each batch, so indexing never
+            runs concurrently with other users of the same stores (e.g. the
+            daemon's commands).
+    """
+
+    def __init__(self, folders, checkpoint_path=WATCH_CHECKPOINT_PATH, debounce_s=WATCH_DEBOUNCE_S,
+                 poll_interval_s=WATCH_POLL_INTERVAL_S, batch_size=WATCH_BATCH_SIZE, use_watchdog=True,
+                 dedupe_threshold=NEAR_DUPLICATE_THRESHOLD, index_lock=None, max_attempts=WATCH_MAX_ATTEMPTS,
+                 retry_backoff_s=WATCH_RETRY_BACKOFF_S):
+        self.folders = folders
+        self.index_lock = index_lock or threading.Lock()
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.debounce_s = debounce_s
+        self.poll_interval_s = poll_interval_s
+        self.batch_size = batch_size
+        self.use_watchdog = use_watchdog
+        self.dedupe_threshold = dedupe_threshold
+        self.max_attempts = max_attempts
+        self.retry_backoff_s = retry_backoff_s
+        self._attempts = {}
+        self._pending = {}
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._observer = None
+        self._vectorstore = None
+
+    # -- events ------------------------------------------------------------------
+    def notify(self, path, delay=0.0):
+        """Marks a file as changed (or deleted); it is indexed after the debounce (plus ``delay``)."""
+        path = os.path.abspath(path)
+        if is_email_file(path) and self._folder_of(path) is not None:
+            with self._lock:
+                self._pending[path] = time.monotonic() + delay
+
+    def _folder_of(self, path):
+        for folder in self.folders:
+            if os.path.dirname(path) == folder:
+                return folder
+        return None
+
+    def scan(self):
+        """
+        Queues files that changed since the previous scan and differ from the
+        checkpoint, plus checkpointed files that are gone.
+        """
+        current = {}
+        for folder in self.folders:
+            if not os.path.isdir(folder):
+                continue
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and is_email_file(entry.path):
+                        current[entry.path] = entry.stat()
+        for path, stat in current.items():
+            # Only a new stat restarts the debounce, so a settled file is not re-queued every scan
+            if self._seen.get(path) != (stat.st_mtime, stat.st_size):
+                self._seen[path] = (stat.st_mtime, stat.st_size)
+                if not self.checkpoint.is_current(path, stat):
+                    self.notify(path)
+        for path in set(self._seen) - set(current):
+            del self._seen[path]
+            self.notify(path)
+        with self._lock:
+            gone = [p for p in self.checkpoint.files
+                    if p not in current and p not in self._pending and self._folder_of(p) is not None]
+        for path in gone:
+            self.notify(path)
+
+    def _start_watchdog(self):
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            print("⚠️ watchdog is not installed, polling for changes instead")
+            return False
+
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                watcher.notify(event.src_path)
+                if getattr(event, "dest_path", None):
+                    watcher.notify(event.dest_path)
+
+        self._observer = Observer()
+        for folder in self.folders:
+            os.makedirs(folder, exist_ok=True)
+            self._observer.schedule(_Handler(), folder, recursive=False)
+        self._observer.start()
+        return True
+
+    # -- indexing ----------------------------------------------------------------
+    def _due(self):
+        cutoff = time.monotonic() - self.debounce_s
+        with self._lock:
+            due = sorted(path for path, last_event in self._pending.items() if last_event <= cutoff)
+            due = due[:self.batch_size]
+            for path in due:
+                del self._pending[path]
+        return due
+
+    def _parse(self, path, label):
+        from helpers.indexer_by_thread import parse_email_r, parse_mbox
+
+        docs = parse_mbox(path, label) if path.endswith(".mbox") else [parse_email_r(path, label)]
+        for doc in docs:
+            doc.metadata["path"] = path
+        return docs
+
+    def process(self, paths):
+        """
+        Indexes one batch of changed paths: old vectors of each path are
+        dropped, current contents are parsed and embedded, and the checkpoint
+        is saved. A grown mbox is re-parsed as a whole; its unchanged messages
+        are embedding cache hits.
+
+        Returns:
+            int: Number of emails indexed.
+        """
+        with self.index_lock:
+            return self._process(paths)
+
+    def _process(self, paths):
+        from helpers.indexer_by_thread import delete_indexed_paths, get_vectorstore, index_documents
+
+        if self._vectorstore is None:
+            self._vectorstore = get_vectorstore(DB_DIRECTORY)
+
+        changed, removed = [], []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                if path in self.checkpoint.files:
+                    removed.append(path)
+                continue
+            if self.checkpoint.is_current(path, stat):
+                continue
+            digest = file_sha256(path)
+            entry = self.checkpoint.files.get(path)
+            if entry is not None and entry["sha256"] == digest:
+                # Touched but unchanged: remember the new stat, skip re-indexing
+                entry.update(mtime=stat.st_mtime, size=stat.st_size)
+                continue
+            changed.append((path, stat, digest))
+
+        if removed or any(path in self.checkpoint.files for path, _, _ in changed):
+            stale = removed + [path for path, _, _ in changed if path in self.checkpoint.files]
+            deleted = delete_indexed_paths(self._vectorstore, stale)
+            print(f"🗑️ Removed {deleted} vector(s) of {len(stale)} changed or deleted file(s)")
+        for path in removed:
+            del self.checkpoint.files[path]
+
+        indexed = 0
+        by_folder = {}
+        for path, stat, digest in changed:
+            by_folder.setdefault(self._folder_of(path), []).append((path, stat, digest))
+        for folder, files in by_folder.items():
+            docs = []
+            for path, _, _ in files:
+                try:
+                    docs.extend(self._parse(path, self.folders[folder] or os.path.basename(folder)))
+                except (OSError, UnicodeDecodeError) as e:
+                    print(f"⚠️ Skipping {path}: {e}")
+            index_documents(docs, preferred_label=self.folders[folder], vectorstore=self._vectorstore,
+                            dedupe_threshold=self.dedupe_threshold)
+            indexed += len(docs)
+            for path, stat, digest in files:
+                self.checkpoint.files[path] = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": digest}
+        self.checkpoint.save()
+        return indexed
+
+    def _index_batch(self, paths):
+        """
+        Indexes a batch. If it fails, its files are indexed one at a time, and
+        each file that still fails is scheduled for a retry or quarantined.
+
+        Returns:
+            int: Number of emails indexed.
+        """
+        try:
+            indexed = self.process(paths)
+        except Exception as e:
+            if len(paths) == 1:
+                self._retry_later(paths[0], e)
+                return 0
+            print(f"❌ Indexing batch failed, retrying its {len(paths)} file(s) one by one: {e}")
+            return sum(self._index_batch([path]) for path in paths)
+        for path in paths:
+            self._attempts.pop(path, None)
+        return indexed
+
+    def _retry_later(self, path, error):
+        attempts = self._attempts.pop(path, 0) + 1
+        if attempts >= self.max_attempts:
+            self._quarantine(path, attempts)
+            print(f"🚫 Giving up on {path} after {attempts} failed attempts, skipped until it changes: {error}")
+            return
+        self._attempts[path] = attempts
+        delay = min(self.retry_backoff_s * 2 ** (attempts - 1), WATCH_MAX_BACKOFF_S)
+        print(f"❌ Indexing {path} failed (attempt {attempts}/{self.max_attempts}), retrying in {delay:.0f}s: {error}")
+        self.notify(path, delay=delay)
+
+    def _quarantine(self, path, attempts):
+        """Checkpoints a failing file without a hash, so it is skipped until its stat changes."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        with self.index_lock:
+            self.checkpoint.files[path] = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": None,
+                                           "failed": attempts}
+            self.checkpoint.save()
+
+    # -- main loop -----------------------------------------------------------------
+    def run(self):
+        """Scans for changes since the checkpoint, then watches until ``stop()``."""
+        watching = self.use_watchdog and self._start_watchdog()
+        mode = "inotify/watchdog" if watching else f"polling every {self.poll_interval_s}s"
+        print(f"👀 Watching {', '.join(self.folders)} ({mode})")
+        failed = self.checkpoint.failed()
+        if failed:
+            print(f"⚠️ {len(failed)} file(s) quarantined after repeated failures, touch them to retry: "
+                  f"{', '.join(failed[:5])}{' …' if len(failed) > 5 else ''}")
+        self.scan()
+        last_scan = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                if not watching and time.monotonic() - last_scan >= self.poll_interval_s:
+                    self.scan()
+                    last_scan = time.monotonic()
+                due = self._due()
+                if due:
+                    started = time.time()
+                    indexed = self._index_batch(due)
+                    print(f"📥 Indexed {indexed} email(s) from {len(due)} file(s) in {time.time() - started:.1f}s")
+                else:
+                    self._stop.wait(min(0.25, self.debounce_s))
+        finally:
+            if self._observer is not None:
+                self._observer.stop()
+                self._observer.join()
+
+    def start(self):
+        """Runs the watcher in a daemon thread (e.g. next to the query daemon)."""
+        thread = threading.Thread(target=self.run, name="folder-watcher", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
@@ -1,3 +1,5 @@
+import sys
+
 from helpers.indexer_by_thread import (
     index_email_directory
 )
@@ -5,5 +7,4 @@ from helpers.indexer_by_thread import (
 # Run: Index and Query Example
 # -----------------------------
 if __name__ == "__main__":
-    index_email_directory("emails4")  # put your .txt emails in ./emails/
-   
+    index_email_directory(sys.argv[1] if len(sys.argv) > 1 else "emails4")  # put your .txt emails in ./emails/
@@ -1,6 +1,8 @@
-from helpers.query_by_thread import (
-    ask_email_agent,
-    ask_email_agent2
-)
-result = ask_email_agent2("who was invited to the kickoff meeting?", "emails4")
-print(result)
\ No newline at end of file
+import sys
+
+from cli import main
+
+# Same as `python cli.py query ...` (uses the warm daemon when one is running);
+# kept so existing `python query.py "question"` habits keep working.
+if __name__ == "__main__":
+    sys.exit(main(["query", *(sys.argv[1:] or ["who was invited to the kickoff meeting?"])]))
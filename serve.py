@@ -0,0 +1,11 @@
+import argparse
+
+from helpers.query_service import serve
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the email RAG query service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
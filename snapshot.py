@@ -0,0 +1,29 @@
+import argparse
+
+from helpers.config import DB_DIRECTORY
+from helpers.snapshot import (
+    export_snapshot,
+    import_snapshot
+)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import a compact index snapshot.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    exp = sub.add_parser("export", help="Write a snapshot of the Chroma DB")
+    exp.add_argument("snapshot_dir")
+    exp.add_argument("--db", default=DB_DIRECTORY)
+    exp.add_argument("--dtype", choices=["float16", "int8"], default="float16")
+    exp.add_argument("--workers", type=int, default=4)
+
+    imp = sub.add_parser("import", help="Load a snapshot into a Chroma DB")
+    imp.add_argument("snapshot_dir")
+    imp.add_argument("--db", default=DB_DIRECTORY)
+    imp.add_argument("--workers", type=int, default=4)
+    imp.add_argument("--no-verify", action="store_true")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_snapshot(args.snapshot_dir, args.db, vector_dtype=args.dtype, workers=args.workers)
+    else:
+        import_snapshot(args.snapshot_dir, args.db, workers=args.workers, verify=not args.no_verify)
@@ -0,0 +1,118 @@
+import time
+
+import pytest
+
+from helpers import chat_session
+from helpers.chat_session import CHAT_PREFIX, ChatSession, ChatSessionStore
+
+
+class Doc:
+    """Minimal stand-in for a LangChain Document (only these attributes are used)."""
+
+    def __init__(self, page_content, **metadata):
+        self.page_content = page_content
+        self.metadata = metadata
+
+
+class FakeOllama:
+    """Records /api/generate payloads and answers with a growing token context."""
+
+    def __init__(self, context_tokens=4):
+        self.payloads = []
+        self.context_tokens = context_tokens
+
+    def post(self, url, json, timeout):
+        self.payloads.append(json)
+        previous = json.get("context", [])
+        ollama = self
+
+        class Response:
+            def raise_for_status(self):
+                pass
+
+            def json(self):
+                return {"response": f"answer {len(ollama.payloads)}", "prompt_eval_count": 7,
+                        "context": previous + [0] * ollama.context_tokens}
+
+        return Response()
+
+
+@pytest.fixture
+def ollama(monkeypatch):
+    fake = FakeOllama()
+    docs = {"kickoff": [Doc("Agenda", source="1.txt"), Doc("Invitees", source="2.txt")],
+            "budget": [Doc("Agenda", source="1.txt"), Doc("Numbers", source="3.txt")]}
+    monkeypatch.setattr(chat_session.requests, "post", fake.post)
+    monkeypatch.setattr(chat_session, "try_route_header_query", lambda *args, **kwargs: None)
+    monkeypatch.setattr(chat_session, "retrieve_email_docs",
+                        lambda question, thread, top_k, start=None, end=None: docs[question.split()[0]])
+    return fake
+
+
+def test_follow_ups_reuse_the_context_and_send_only_new_emails(ollama):
+    session = ChatSession(max_context_tokens=100)
+
+    session.ask("kickoff agenda?")
+    answer, docs, new_docs = session.ask("budget numbers?")
+
+    first, second = ollama.payloads
+    assert first["keep_alive"] == chat_session.CHAT_KEEP_ALIVE and "context" not in first
+    assert first["prompt"].startswith(CHAT_PREFIX)
+    assert second["context"] == [0] * 4 and second["keep_alive"] == chat_session.CHAT_KEEP_ALIVE
+    assert CHAT_PREFIX not in second["prompt"]
+    assert new_docs == 1 and "Numbers" in second["prompt"] and "Agenda" not in second["prompt"]
+    assert answer == "answer 2" and len(docs) == 2
+
+
+def test_context_is_reset_past_max_context_tokens(ollama):
+    session = ChatSession(max_context_tokens=6)
+
+    session.ask("kickoff agenda?")   # context: 4 tokens
+    session.ask("budget numbers?")   # within the limit, context grows to 8
+    _, _, new_docs = session.ask("kickoff invitees?")
+
+    third = ollama.payloads[2]
+    assert "context" not in third
+    assert third["prompt"].startswith(CHAT_PREFIX)
+    assert new_docs == 2  # emails sent under the old prefix are sent again
+
+
+def test_store_evicts_least_recently_used_sessions():
+    store = ChatSessionStore(max_sessions=2, ttl_s=60)
+    first, second = store.create(), store.create()
+    assert store.get(first.id) is first  # now most recently used
+
+    third = store.create()
+
+    assert store.get(second.id) is None
+    assert store.get(first.id) is first and store.get(third.id) is third
+
+
+def test_store_expires_idle_sessions():
+    store = ChatSessionStore(max_sessions=10, ttl_s=60)
+    idle, active = store.create(), store.create()
+    idle.last_used = time.time() - 120
+
+    assert store.get(idle.id) is None
+    assert store.get(active.id) is active
+
+
+def test_remote_session_surfaces_an_expired_session():
+    pytest.importorskip("langchain")
+    import requests
+
+    from helpers.query_client import ChatSessionExpired, QueryServiceClient
+
+    class Gone:
+        status_code = 404
+
+    class Client(QueryServiceClient):
+        def _post_json(self, path, payload):
+            if path == "/chat/sessions":
+                return {"session_id": "s1"}
+            raise requests.HTTPError(response=Gone())
+
+    session = Client("http://service").chat_session()
+    with pytest.raises(ChatSessionExpired):
+        session.ask("kickoff agenda?")
+    assert session.id == "s1" and session.turns == []
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from helpers import daemon
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+HEAVY_MODULES = ("numpy", "langchain", "langchain_community", "chromadb", "torch", "sentence_transformers")
+
+
+def test_cli_starts_without_heavy_imports():
+    code = (
+        "import sys, cli, query; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    loaded = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert loaded.stdout.strip() == ""
+
+
+@pytest.fixture
+def server(tmp_path):
+    socket_path = str(tmp_path / "d.sock")
+    server = daemon._Server(socket_path, daemon._Handler)
+    server.lock = threading.Lock()
+    server.started_at = 0.0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield socket_path
+    server.shutdown()
+    server.server_close()
+
+
+def test_socket_round_trip(server, monkeypatch):
+    monkeypatch.setitem(daemon.COMMANDS, "echo", lambda text: {"echo": text})
+
+    assert daemon.call_daemon("ping", socket_path=server, timeout=5)["pid"] == os.getpid()
+    assert daemon.call_daemon("echo", socket_path=server, timeout=5, text="héllo") == {"echo": "héllo"}
+
+
+def test_unknown_command_is_reported(server):
+    with pytest.raises(RuntimeError, match="ValueError: Unknown command: nope"):
+        daemon.call_daemon("nope", socket_path=server, timeout=5)
+    # The daemon keeps serving after a failed command
+    assert "uptime_s" in daemon.call_daemon("ping", socket_path=server, timeout=5)
+
+
+def test_missing_daemon_is_unavailable(tmp_path):
+    with pytest.raises(daemon.DaemonUnavailable):
+        daemon.call_daemon("ping", socket_path=str(tmp_path / "none.sock"))
@@ -0,0 +1,105 @@
+import numpy as np
+
+from helpers.embedding_cache import CachedEmbeddings, EmbeddingCache, text_key
+
+DIM = 4
+
+
+def _vector(i):
+    return [float(i)] * DIM
+
+
+def test_put_and_get_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model/a", max_bytes=1 << 20)
+    cache.put_many(["a", "b"], [_vector(1), _vector(2)])
+
+    found = cache.get_many(["a", "b", "missing"])
+
+    assert found == {"a": _vector(1), "b": _vector(2)}
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_duplicate_keys_are_stored_once(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", max_bytes=1 << 20)
+    cache.put_many(["a", "a"], [_vector(1), _vector(1)])
+    cache.put_many(["a"], [_vector(1)])
+
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["bytes"] == 4 * DIM
+
+
+def test_dimension_mismatch_is_rejected(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", max_bytes=1 << 20)
+    cache.put_many(["a"], [_vector(1)])
+
+    try:
+        cache.put_many(["b"], [[1.0, 2.0]])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected a ValueError")
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    # Room for 10 rows; eviction keeps 8
+    cache = EmbeddingCache(str(tmp_path), "model", max_bytes=10 * 4 * DIM)
+    keys = [f"k{i}" for i in range(10)]
+    cache.put_many(keys, [_vector(i) for i in range(10)])
+    cache.get_many(["k0", "k1"])  # recently used, must survive
+
+    cache.put_many(["k10"], [_vector(10)])
+
+    found = cache.get_many(keys + ["k10"])
+    assert cache.evictions == 3
+    assert len(found) == 8
+    assert {"k0", "k1", "k10"} <= set(found)
+    for key, vector in found.items():
+        assert vector == _vector(int(key[1:]))
+    assert cache.generation == 1
+    assert not (tmp_path / "model" / "vectors.f32").exists()
+
+
+def test_other_process_reopens_after_eviction(tmp_path):
+    writer = EmbeddingCache(str(tmp_path), "model", max_bytes=10 * 4 * DIM)
+    reader = EmbeddingCache(str(tmp_path), "model", max_bytes=10 * 4 * DIM)
+    keys = [f"k{i}" for i in range(10)]
+    writer.put_many(keys, [_vector(i) for i in range(10)])
+    assert reader.get_many(["k9"]) == {"k9": _vector(9)}  # reader now maps generation 0
+
+    writer.get_many(["k9"])
+    writer.evict(target_fraction=0.5)
+    # Same row count as before in a fresh generation: rows were renumbered
+    writer.put_many([f"n{i}" for i in range(5)], [_vector(100 + i) for i in range(5)])
+
+    found = reader.get_many(keys + [f"n{i}" for i in range(5)])
+    for key, vector in found.items():
+        expected = 100 + int(key[1:]) if key.startswith("n") else int(key[1:])
+        assert vector == _vector(expected)
+    assert "k9" in found
+
+
+class _CountingModel:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t))] * DIM for t in texts]
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return [float(len(text))] * DIM
+
+
+def test_cached_embeddings_only_embed_new_texts(tmp_path):
+    model = _CountingModel()
+    embeddings = CachedEmbeddings(model, EmbeddingCache(str(tmp_path), "model", max_bytes=1 << 20))
+
+    first = embeddings.embed_documents(["one", "three"])
+    second = embeddings.embed_documents(["three", "seven!", "one"])
+
+    assert first == [[3.0] * DIM, [5.0] * DIM]
+    assert second == [[5.0] * DIM, [6.0] * DIM, [3.0] * DIM]
+    assert model.calls == [["one", "three"], ["seven!"]]
+    assert np.isclose(embeddings.embed_query("one"), 3.0).all()
+    assert embeddings.cache.get_many(["query:" + text_key("one")])
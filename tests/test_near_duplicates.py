@@ -0,0 +1,159 @@
+import glob
+import os
+import random
+
+import pytest
+
+from helpers.near_duplicates import (
+    DuplicateIndex,
+    collapse_near_duplicates,
+    find_near_duplicate_clusters,
+    lsh_params,
+)
+
+
+class Doc:
+    """Minimal stand-in for a LangChain Document (only these attributes are used)."""
+
+    def __init__(self, page_content, **metadata):
+        self.page_content = page_content
+        self.metadata = metadata
+
+
+def _words(n, seed):
+    rng = random.Random(seed)
+    return [f"w{rng.randrange(5000)}" for _ in range(n)]
+
+
+def _variant(words, changes, seed):
+    """Copy of ``words`` with ``changes`` positions replaced."""
+    rng = random.Random(seed)
+    words = list(words)
+    for i in rng.sample(range(len(words)), changes):
+        words[i] = f"x{rng.randrange(5000)}"
+    return " ".join(words)
+
+
+BASE = _words(300, seed=1)
+
+
+def test_lsh_params_midpoint_near_threshold():
+    for threshold in (0.5, 0.8, 0.9):
+        bands, rows = lsh_params(128, threshold)
+        assert bands * rows == 128
+        assert abs((1 / bands) ** (1 / rows) - threshold) < 0.1
+
+
+def test_threshold_separates_near_and_far_duplicates():
+    texts = [" ".join(BASE), _variant(BASE, 2, seed=2), _variant(BASE, 10, seed=3), " ".join(_words(300, seed=4))]
+    clusters = find_near_duplicate_clusters(texts, threshold=0.9)
+    assert [sorted(c) for c in clusters] == [[0, 1]]
+    # A looser threshold also admits the heavily edited copy, never the unrelated text
+    loose = find_near_duplicate_clusters(texts, threshold=0.5)
+    assert [sorted(c) for c in loose] == [[0, 1, 2]]
+
+
+def test_groups_are_never_mixed():
+    texts = [" ".join(BASE), " ".join(BASE)]
+    assert find_near_duplicate_clusters(texts, threshold=0.9, groups=["a", "b"]) == []
+    assert len(find_near_duplicate_clusters(texts, threshold=0.9, groups=["a", "a"])) == 1
+
+
+def test_collapse_keeps_earliest_by_parsed_date():
+    docs = [
+        Doc(" ".join(BASE), subject="Update", thread="T", source="late.txt", date="Tue, 02 Jul 2024 10:00:00 +0000"),
+        Doc(_variant(BASE, 1, seed=5), subject="Update", thread="T", source="early.txt", date="2024-06-30 09:00:00"),
+    ]
+    kept, report = collapse_near_duplicates(docs, threshold=0.9)
+    assert [d.metadata["source"] for d in kept] == ["early.txt"]
+    assert kept[0].metadata["duplicate_sources"] == "late.txt"
+    assert report[0]["members"] == ["late.txt"]
+
+
+@pytest.fixture
+def index(tmp_path):
+    return DuplicateIndex(str(tmp_path / "duplicates.sqlite3"))
+
+
+def test_new_mail_is_checked_against_indexed_signatures(index):
+    first = Doc(" ".join(BASE), subject="Update", thread="T", source="a.txt", path="/in/a.txt", date="2024-07-01")
+    kept, _ = collapse_near_duplicates([first], threshold=0.9, index=index)
+    assert kept == [first]
+
+    later = Doc(_variant(BASE, 2, seed=6), subject="Update", thread="T", source="b.txt", path="/in/b.txt",
+                date="2024-07-02")
+    other_thread = Doc(" ".join(BASE), subject="Update", thread="U", source="c.txt", path="/in/c.txt",
+                       date="2024-07-02")
+    kept, report = collapse_near_duplicates([later, other_thread], threshold=0.9, index=index, same_thread=True)
+    assert kept == [other_thread]
+    assert report[0]["existing"] and report[0]["representative"] == "a.txt"
+    assert index.duplicate_metadata(first.metadata["email_key"]) == {"duplicate_sources": "b.txt",
+                                                                     "duplicate_count": 1}
+
+    # By default a forwarded copy in another thread joins the indexed representative too
+    forwarded = Doc(" ".join(BASE), subject="FW: Update", thread="V", source="d.txt", path="/in/d.txt",
+                    date="2024-07-03")
+    kept, report = collapse_near_duplicates([forwarded], threshold=0.9, index=index)
+    assert kept == [] and report[0]["representative"] == "a.txt"
+
+
+def test_deleting_representative_promotes_earliest_survivor(index):
+    docs = [
+        Doc(_variant(BASE, i, seed=10 + i), subject="Weekly report", thread="T", source=f"{i}.txt",
+            path=f"/in/{i}.txt", date=f"2024-07-0{i + 1}")
+        for i in range(3)
+    ]
+    kept, _ = collapse_near_duplicates(docs, threshold=0.8, index=index)
+    assert [d.metadata["source"] for d in kept] == ["0.txt"]
+
+    promoted, touched = index.remove_paths(["/in/0.txt"])
+    assert touched == set()
+    assert len(promoted) == 1
+    text, metadata = promoted[0]
+    assert text == docs[1].page_content
+    assert metadata["source"] == "1.txt" and metadata["thread"] == "T"
+    assert metadata["duplicate_sources"] == "2.txt" and metadata["duplicate_count"] == 1
+
+    # Deleting a duplicate only touches its representative
+    promoted, touched = index.remove_paths(["/in/2.txt"])
+    assert promoted == [] and touched == {metadata["email_key"]}
+    assert index.duplicate_metadata(metadata["email_key"])["duplicate_count"] == 0
+
+
+def test_thread_merges_keep_signatures_comparable(index):
+    first = Doc(" ".join(BASE), subject="Update", thread="old", source="a.txt", date="2024-07-01")
+    collapse_near_duplicates([first], threshold=0.9, index=index)
+    index.rename_threads({"old": "new"})
+    again = Doc(_variant(BASE, 1, seed=7), subject="Update", thread="new", source="b.txt", date="2024-07-02")
+    kept, _ = collapse_near_duplicates([again], threshold=0.9, index=index)
+    assert kept == []
+
+
+def _dummy_mail_corpus():
+    """test_emails2 (generate_dummy_mail output), one thread per email as the thread grouper leaves them."""
+    from helpers.indexer_by_thread import _split_headers_and_trail
+
+    docs = []
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(__file__), "..", "test_emails2", "*.txt"))):
+        with open(path, encoding="utf-8") as f:
+            headers, body = _split_headers_and_trail(f.read())
+        name = os.path.basename(path)
+        docs.append(Doc(body, subject=headers.get("subject"), date=headers.get("date"), source=name,
+                        thread=f"thread of {name}"))
+    return docs
+
+
+def test_re_sent_dummy_mail_collapses_across_threads():
+    docs = _dummy_mail_corpus()
+    assert len(docs) == 20
+
+    kept, report = collapse_near_duplicates(docs, threshold=0.9)
+
+    clusters = {r["representative"]: sorted(r["members"]) for r in report}
+    # Same body under different subjects ("FW: ...", "Follow-up: ...") and threads
+    assert clusters["mail_13.txt"] == ["mail_02.txt", "mail_11.txt", "mail_16.txt"]
+    assert clusters["mail_03.txt"] == ["mail_15.txt"]
+    assert len(kept) == len(docs) - sum(len(members) for members in clusters.values())
+
+    # Limited to one thread, none of these copies are found
+    assert collapse_near_duplicates(docs, threshold=0.9, same_thread=True)[1] == []
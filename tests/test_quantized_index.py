@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from helpers.quantized_index import QuantizedIndex, _normalize
+
+
+def _data(n=300, dim=32, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return [f"id{i}" for i in range(n)], vectors, [f"T{i % 3}" for i in range(n)]
+
+
+def _exact_top(vectors, query, k):
+    return list(np.argsort(-(_normalize(vectors) @ _normalize(query)))[:k])
+
+
+@pytest.mark.parametrize("mode,pca_dim", [("int8", None), ("int8", 16), ("binary", None)])
+def test_rescored_search_matches_exact_top_k(tmp_path, mode, pca_dim):
+    ids, vectors, threads = _data()
+    index = QuantizedIndex.build(str(tmp_path), ids, vectors, threads, mode=mode, pca_dim=pca_dim)
+    query = vectors[7] + 0.1
+
+    hits = index.search(query, k=5, shortlist_factor=20)[0]
+
+    exact = [ids[i] for i in _exact_top(vectors, query, 5)]
+    assert hits[0][0] == exact[0]
+    assert len({doc_id for doc_id, _ in hits} & set(exact)) >= 4
+    assert hits[0][1] == pytest.approx(float(_normalize(vectors[7]) @ _normalize(query)), abs=1e-5)
+
+
+def test_codes_and_vectors_are_memory_mapped(tmp_path):
+    ids, vectors, threads = _data()
+    QuantizedIndex.build(str(tmp_path), ids, vectors, threads)
+
+    index = QuantizedIndex.load(str(tmp_path))
+
+    assert isinstance(index.codes, np.memmap) and isinstance(index.full, np.memmap)
+    assert index.code_bytes == len(ids) * (vectors.shape[1] + 4)
+    assert index.full_bytes == vectors.nbytes  # rescoring vectors are reported separately
+
+
+def test_thread_and_mask_filters(tmp_path):
+    ids, vectors, threads = _data()
+    index = QuantizedIndex.build(str(tmp_path), ids, vectors, threads)
+
+    hits = index.search(vectors[0], k=10, thread="T1")[0]
+    assert hits and all(int(doc_id[2:]) % 3 == 1 for doc_id, _ in hits)
+    hits = index.search(vectors[0], k=10, thread=("T1", "T2"))[0]
+    assert len(hits) == 10 and all(int(doc_id[2:]) % 3 in (1, 2) for doc_id, _ in hits)
+
+    mask = np.zeros(len(ids), dtype=bool)
+    mask[[3, 4]] = True
+    assert {doc_id for doc_id, _ in index.search(vectors[0], k=10, mask=mask)[0]} == {"id3", "id4"}
+
+
+def test_append_remove_and_replace(tmp_path):
+    ids, vectors, threads = _data()
+    index = QuantizedIndex.build(str(tmp_path), ids[:200], vectors[:200], threads[:200])
+    reader = QuantizedIndex.load(str(tmp_path))  # e.g. a query service worker
+
+    index.append(ids[200:], vectors[200:], threads[200:])
+    assert reader.search(vectors[250], k=1)[0][0][0] == "id250"
+    assert len(reader) == 300
+
+    index.remove(["id250"])
+    assert "id250" not in {doc_id for doc_id, _ in reader.search(vectors[250], k=5)[0]}
+
+    # Re-indexing an id replaces its row
+    index.append(["id10"], vectors[20:21], ["T9"])
+    assert reader.search(vectors[20], k=2)[0][0][0] in {"id10", "id20"}
+    assert [doc_id for doc_id, _ in reader.search(vectors[10], k=300, thread="T1")[0]].count("id10") == 0
+    assert reader.search(vectors[20], k=1, thread="T9")[0][0][0] == "id10"
+
+
+def test_interrupted_append_is_ignored(tmp_path):
+    ids, vectors, threads = _data(n=50)
+    index = QuantizedIndex.build(str(tmp_path), ids, vectors, threads)
+    with open(tmp_path / "full.f32", "ab") as f:
+        f.write(b"\0" * 100)  # partial rows of an append that never committed
+
+    index.append(["new"], vectors[:1] * -1, ["T0"])
+
+    reloaded = QuantizedIndex.load(str(tmp_path))
+    assert len(reloaded) == 51
+    assert reloaded.search(-vectors[0], k=1)[0][0] == ("new", pytest.approx(1.0, abs=1e-5))
+
+
+def test_rename_threads(tmp_path):
+    ids, vectors, threads = _data(n=30)
+    index = QuantizedIndex.build(str(tmp_path), ids, vectors, threads)
+
+    index.rename_threads({"T1": "T0"})
+
+    assert set(QuantizedIndex.load(str(tmp_path)).threads) == {"T0", "T2"}
@@ -0,0 +1,162 @@
+from datetime import datetime
+
+import pytest
+
+from helpers import query_router
+from helpers.header_store import HeaderStore
+from helpers.query_router import _ROUTES, route_header_query
+
+
+class Doc:
+    """Minimal stand-in for a LangChain Document (only these attributes are used)."""
+
+    def __init__(self, page_content, **metadata):
+        self.page_content = page_content
+        self.metadata = metadata
+
+
+def _route(question):
+    for name, pattern in _ROUTES:
+        match = pattern.search(question)
+        if match:
+            return name, match.groupdict()
+    return None, None
+
+
+@pytest.mark.parametrize("question, route, a, b", [
+    ("when did bob last email alice about the budget?", "last_contact", "bob", "alice"),
+    ("When did Bob Smith last email Alice Jones?", "last_contact", "Bob Smith", "Alice Jones"),
+    ("WHEN DID bob FIRST EMAIL alice", "last_contact", "bob", "alice"),
+    ("how many emails did carol send to dave about hiring?", "count_sent", "carol", "dave"),
+    ("when did bob last reply", "last_from", "bob", None),
+])
+def test_person_patterns_stop_at_lowercase_words(question, route, a, b):
+    name, groups = _route(question)
+    assert name == route
+    assert groups["a"] == a
+    assert groups.get("b") == b
+
+
+def test_non_header_questions_are_not_routed():
+    assert _route("summarise the escalation about the outage")[0] is None
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = HeaderStore(str(tmp_path / "headers.sqlite3"))
+    store.record_emails([
+        Doc("Agenda attached, invitees: erin, frank", **{
+            "from": "Alice Smith <alice@acme.com>", "to": "bob@acme.com", "cc": "carol@acme.com",
+            "subject": "Kickoff meeting", "date": "2024-07-01 09:00:00", "source": "1.txt", "thread": "Kickoff",
+        }),
+        Doc("Budget numbers", **{
+            "from": "bob@acme.com", "to": "alice@acme.com", "subject": "Budget",
+            "date": "2024-07-03 10:00:00", "source": "2.txt", "thread": "Budget",
+        }),
+        Doc("Budget follow-up", **{
+            "from": "bob@acme.com", "to": "alice@acme.com", "subject": "Re: Budget",
+            "date": "2024-07-05 10:00:00", "source": "3.txt", "thread": "Budget",
+        }),
+    ])
+    monkeypatch.setattr(query_router, "get_header_store", lambda: store)
+    return store
+
+
+def test_header_store_lookups(store):
+    assert store.resolve_person("alice") == ["alice@acme.com"]
+    assert store.resolve_person("Alice Smith") == ["alice@acme.com"]
+    rows = store.find_emails(sender=["bob@acme.com"], recipients=["alice@acme.com"])
+    assert [r["source"] for r in rows] == ["3.txt", "2.txt"]
+    assert store.top_senders()[0] == {"address": "bob@acme.com", "emails": 2}
+
+
+def test_last_contact_with_topic_is_partial(store):
+    routed = route_header_query("when did bob last email alice about the budget?")
+    assert routed.route == "last_contact"
+    assert "2024-07-05" in routed.answer
+    assert not routed.complete  # "about the budget" is left for the LLM
+
+    assert route_header_query("when did bob last email alice?").complete
+
+
+def test_invite_questions_are_never_complete(store):
+    routed = route_header_query("who was invited to the kickoff meeting?")
+    assert routed.route == "participants"
+    assert "carol@acme.com" in routed.answer
+    assert not routed.complete  # the invite list is in the body
+
+    assert route_header_query("who was cc'd on the kickoff email?").complete
+
+
+def test_loose_subject_match_is_partial(store):
+    routed = route_header_query("who was copied on the kickoff budget review?")
+    assert routed is not None
+    assert not routed.complete
+
+
+def test_unknown_person_falls_back_to_rag(store):
+    assert route_header_query("when did zed last email alice?") is None
+
+
+def test_deleted_emails_leave_the_header_store(store):
+    from helpers.header_store import metadata_email_key
+
+    budget = Doc("Budget numbers", **{"from": "bob@acme.com", "to": "alice@acme.com", "subject": "Budget",
+                                      "date": "2024-07-03 10:00:00"})
+    assert store.delete_emails([metadata_email_key(budget.metadata, budget.page_content), "unknown"]) == 1
+    assert [r["source"] for r in store.find_emails(sender=["bob@acme.com"])] == ["3.txt"]
+    assert store.participants_of([r["id"] for r in store.find_emails()]) != []
+    assert store.count() == 2
+
+
+def test_top_senders_respects_the_date_span(store):
+    store.record_emails([
+        Doc("Hiring plan", **{"from": "carol@acme.com", "to": "alice@acme.com", "subject": "Hiring",
+                              "date": "2025-07-02 10:00:00", "source": "4.txt", "thread": "Hiring"}),
+    ])
+    assert "bob@acme.com" in route_header_query("who sent the most emails?").answer
+
+    routed = route_header_query("who sent the most emails?", start=datetime(2025, 7, 1),
+                                end=datetime(2025, 7, 31, 23, 59, 59))
+    assert routed.answer == "carol@acme.com sent the most emails (1)."
+    assert routed.facts == ["- carol@acme.com: 1"]
+    # The span can also come from the question itself
+    assert "carol@acme.com" in route_header_query("who sent the most emails in July 2025?").answer
+
+
+def test_thread_name_covers_its_suffixed_conversations(store):
+    store.record_emails([
+        Doc("Room booked", **{"from": "dave@acme.com", "to": "alice@acme.com", "subject": "Venue",
+                              "date": "2024-07-02 09:00:00", "source": "5.txt", "thread": "Kickoff [0a1b2c]"}),
+        Doc("Slides", **{"from": "dave@acme.com", "to": "alice@acme.com", "subject": "Slides",
+                         "date": "2024-07-02 10:00:00", "source": "6.txt", "thread": "Kickoff notes"}),
+        Doc("Q*3", **{"from": "erin@acme.com", "to": "alice@acme.com", "subject": "Q*3",
+                      "date": "2024-07-02 11:00:00", "source": "7.txt", "thread": "Q*3 [abcdef]"}),
+    ])
+
+    assert store.thread_family("Kickoff") == ("Kickoff", "Kickoff [0a1b2c]")
+    assert store.thread_family("Kickoff [0a1b2c]") == ("Kickoff [0a1b2c]",)
+    assert store.thread_family("Q*3") == ("Q*3", "Q*3 [abcdef]")
+    assert store.thread_family("Q?3") == ("Q?3",)  # wildcards in the label are literal
+    senders = {row["address"] for row in store.top_senders(thread="Kickoff")}
+    assert senders == {"alice@acme.com", "dave@acme.com"}
+    assert [row["source"] for row in store.find_emails(thread="Kickoff", order="ts ASC")] == ["1.txt", "5.txt"]
+
+
+def test_browse_facets_and_older_stores(store, tmp_path):
+    import sqlite3
+
+    assert store.threads() == ["Budget", "Kickoff"]
+    assert store.senders() == ["Alice Smith <alice@acme.com>", "bob@acme.com"]
+    assert store.time_span() == (datetime(2024, 7, 1, 9).timestamp(), datetime(2024, 7, 5, 10).timestamp())
+
+    # A store written before the From header was kept gains the column on open
+    path = str(tmp_path / "old.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE emails (id INTEGER PRIMARY KEY, email_key TEXT UNIQUE NOT NULL, source TEXT, "
+                     "thread TEXT, subject TEXT, date TEXT, ts REAL)")
+        conn.execute("INSERT INTO emails (email_key, thread) VALUES ('k', 'Old')")
+    old = HeaderStore(path)
+    assert old.threads() == ["Old"] and old.senders() == [] and old.time_span() == (None, None)
+    old.record_emails([Doc("Hi", **{"from": "bob@acme.com", "subject": "Hi", "date": "2024-07-03", "thread": "Old"})])
+    assert old.senders() == ["bob@acme.com"]
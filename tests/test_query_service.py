@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("langchain_community")
+
+from helpers import query_by_thread, query_service  # noqa: E402
+from helpers.quantized_index import QuantizedIndex  # noqa: E402
+from helpers.query_service import MicroBatcher, _search_batch  # noqa: E402
+
+
+def test_batches_never_exceed_max_batch_and_keep_order(monkeypatch):
+    sizes = []
+
+    def fake_search_batch(items):
+        sizes.append(len(items))
+        return [[f"{query}:{top_k}"] for query, _, top_k, *_ in items]
+
+    monkeypatch.setattr(query_service, "_search_batch", fake_search_batch)
+
+    async def run():
+        batcher = MicroBatcher(wait_ms=1, max_batch=3)
+        return await asyncio.gather(*(batcher.submit(f"q{i}", "All Threads", i + 1) for i in range(7))), batcher
+
+    results, batcher = asyncio.run(run())
+
+    assert sizes == [3, 3, 1]
+    assert results == [[f"q{i}:{i + 1}"] for i in range(7)]
+    assert batcher.batches == 3 and batcher.batched_queries == 7
+
+
+class FakeEmbeddings:
+    """Embeds "q<n>" as the n-th unit vector."""
+
+    def __init__(self, dim):
+        self.dim = dim
+
+    def embed_documents(self, texts):
+        return [np.eye(self.dim)[int(text[1:])] for text in texts]
+
+
+class FakeCollection:
+    """Chroma ``get`` / ``query`` over in-memory records: id -> (text, metadata, vector)."""
+
+    def __init__(self, records):
+        self.records = records
+        self.queries = []
+
+    def get(self, ids, include):
+        ids = [doc_id for doc_id in ids if doc_id in self.records]
+        return {"ids": ids, "documents": [self.records[i][0] for i in ids],
+                "metadatas": [self.records[i][1] for i in ids]}
+
+    def query(self, query_embeddings, n_results, where, include):
+        self.queries.append(where)
+        thread = (where or {}).get("thread")
+        rows = {"documents": [], "metadatas": [], "embeddings": [], "distances": []}
+        for query in query_embeddings:
+            ranked = sorted(
+                (np.linalg.norm(np.asarray(vector) - query), doc_id)
+                for doc_id, (_, meta, vector) in self.records.items()
+                if thread is None or meta["thread"] == thread
+            )[:n_results]
+            rows["documents"].append([self.records[doc_id][0] for _, doc_id in ranked])
+            rows["metadatas"].append([self.records[doc_id][1] for _, doc_id in ranked])
+            rows["embeddings"].append([self.records[doc_id][2] for _, doc_id in ranked])
+            rows["distances"].append([distance for distance, _ in ranked])
+        return rows
+
+
+class FakeVectorstore:
+    def __init__(self, records, dim):
+        self.embeddings = FakeEmbeddings(dim)
+        self._collection = FakeCollection(records)
+
+
+def _records(dim=4):
+    return {
+        f"d{i}": (f"email {i}", {"thread": "A" if i % 2 == 0 else "B"}, np.eye(dim)[i].tolist())
+        for i in range(dim)
+    }
+
+
+def _use(monkeypatch, vectorstore, quantized_index=None):
+    monkeypatch.setattr(query_by_thread, "get_query_vectorstore", lambda: vectorstore)
+    monkeypatch.setattr(query_by_thread, "get_quantized_index", lambda: quantized_index)
+    monkeypatch.setattr(query_by_thread, "get_time_partitions", lambda: None)
+
+
+def test_search_batch_splits_results_per_request(monkeypatch):
+    vectorstore = FakeVectorstore(_records(), dim=4)
+    _use(monkeypatch, vectorstore)
+
+    results = _search_batch([
+        ("q0", "A", 1, None, None, 0.0),
+        ("q1", "B", 1, None, None, 0.0),
+        ("q2", "All Threads", 2, None, None, 0.0),
+        ("q3", "B", 1, datetime(2025, 1, 1), None, 0.0),
+    ])
+
+    assert [doc.page_content for doc in results[0]] == ["email 0"]
+    assert [doc.page_content for doc in results[1]] == ["email 1"]
+    assert results[2][0].page_content == "email 2" and len(results[2]) == 2
+    assert [doc.page_content for doc in results[3]] == ["email 3"]
+    # One Chroma query per (thread, since, until) group
+    assert len(vectorstore._collection.queries) == 4
+    assert {"thread": "B"} in vectorstore._collection.queries
+
+
+def test_search_batch_splits_quantized_results_per_request(monkeypatch, tmp_path):
+    records = _records()
+    index = QuantizedIndex.build(str(tmp_path), list(records), np.asarray([r[2] for r in records.values()]),
+                                 [r[1]["thread"] for r in records.values()])
+    _use(monkeypatch, FakeVectorstore(records, dim=4), quantized_index=index)
+
+    results = _search_batch([("q3", "All Threads", 1, None, None, 0.0), ("q1", "All Threads", 3, None, None, 0.0)])
+
+    assert [doc.page_content for doc in results[0]] == ["email 3"]
+    assert results[1][0].page_content == "email 1" and len(results[1]) == 3
@@ -0,0 +1,84 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from helpers import config
+from helpers.scoring import _case_bounds, _date_mask, _score_ranking, _search_version, _timestamps
+
+
+def _covers(rows):
+    """(docs, units) relevance matrix from a list of per-doc unit lists."""
+    n_units = max((u for units in rows for u in units), default=-1) + 1
+    covers = np.zeros((len(rows), n_units), dtype=bool)
+    for i, units in enumerate(rows):
+        covers[i, units] = True
+    return covers
+
+
+def test_perfect_ranking():
+    covers = _covers([[0], [1], [], []])
+    scores = _score_ranking(np.array([0, 1, 2]), covers, k=3)
+    assert scores == {"recall": 1.0, "mrr": 1.0, "ndcg": pytest.approx(1.0)}
+
+
+def test_relevant_doc_at_rank_two():
+    covers = _covers([[0], [], []])
+    scores = _score_ranking(np.array([1, 0, 2]), covers, k=3)
+    assert scores["recall"] == 1.0
+    assert scores["mrr"] == 0.5
+    assert scores["ndcg"] == pytest.approx(1 / np.log2(3))
+
+
+def test_partial_recall_and_ndcg():
+    # Two gold units in two docs, only one of them retrieved (at rank 3)
+    covers = _covers([[0], [1], [], [], []])
+    scores = _score_ranking(np.array([2, 3, 0]), covers, k=3)
+    assert scores["recall"] == 0.5
+    assert scores["mrr"] == pytest.approx(1 / 3)
+    assert scores["ndcg"] == pytest.approx((1 / np.log2(4)) / (1 + 1 / np.log2(3)))
+
+
+def test_empty_ranking_scores_zero():
+    assert _score_ranking(np.array([], dtype=int), _covers([[0]]), k=5) == {"recall": 0.0, "mrr": 0.0, "ndcg": 0.0}
+
+
+def test_case_bounds_prefer_explicit_dates():
+    now = datetime(2025, 7, 16, 12)
+    assert _case_bounds({"question": "anything", "since": "2025-07-01", "until": "2025-07-02"}, now) == (
+        datetime(2025, 7, 1), datetime(2025, 7, 2, 23, 59, 59))
+    assert _case_bounds({"question": "what happened last week?"}, now) == (
+        datetime(2025, 7, 7), datetime(2025, 7, 13, 23, 59, 59))
+    assert _case_bounds({"question": "who owns the budget?"}, now) == (None, None)
+
+
+def test_date_mask_falls_back_to_date_header():
+    timestamps = _timestamps([
+        {"timestamp": datetime(2025, 7, 1).timestamp()},
+        {"date": "2025-06-01 10:00:00"},
+        {"date": "not a date"},
+    ])
+    assert np.isnan(timestamps[2])
+    mask = _date_mask(timestamps, datetime(2025, 6, 15), None)
+    assert mask.tolist() == [True, False, False]
+    assert _date_mask(timestamps, None, None) is None
+
+
+def test_search_version_tracks_quantized_and_partition_manifests(tmp_path, monkeypatch):
+    quantized, partitions = tmp_path / "quantized", tmp_path / "partitions"
+    quantized.mkdir()
+    partitions.mkdir()
+    (quantized / "manifest.json").write_text('{"count": 1}')
+    (partitions / "manifest.json").write_text('{"partitions": {}}')
+    monkeypatch.setattr(config, "QUANTIZED_INDEX_DIR", str(quantized))
+    monkeypatch.setattr(config, "TIME_PARTITION_DIR", str(partitions))
+
+    mmr, q = {"search": "mmr"}, {"search": "quantized"}
+    assert _search_version(mmr, dated=False) == {}
+    assert set(_search_version(mmr, dated=True)) == {"partitions"}
+
+    before = _search_version(q, dated=False)
+    (quantized / "manifest.json").write_text('{"count": 2}')
+    os.utime(quantized / "manifest.json", ns=(1, 1))
+    assert _search_version(q, dated=False) != before
@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from helpers import snapshot
+from helpers.collection import get_collection
+
+
+def _write_snapshot(directory, shards, vectors):
+    """Hand-built snapshot (float16) with a manifest, as export_snapshot writes it."""
+    names = []
+    for i, records in enumerate(shards):
+        name = f"records-{i:05d}.jsonl.zst"
+        snapshot._write_shard(os.path.join(directory, name), records, level=3)
+        names.append(name)
+    np.save(os.path.join(directory, snapshot.VECTORS_FILE), np.asarray(vectors, dtype=np.float16))
+    with open(os.path.join(directory, snapshot.CATALOG_FILE), "w") as f:
+        json.dump({}, f)
+    files = names + [snapshot.CATALOG_FILE, snapshot.VECTORS_FILE]
+    manifest = {
+        "format_version": snapshot.SNAPSHOT_FORMAT_VERSION,
+        "embedding_model": "test-model",
+        "collection_metadata": None,
+        "count": len(vectors),
+        "vector_dtype": "float16",
+        "shards": names,
+        "files": {name: {"sha256": snapshot._sha256_file(os.path.join(directory, name))} for name in files},
+    }
+    with open(os.path.join(directory, snapshot.MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def test_shard_round_trip(tmp_path):
+    records = [{"id": "1", "document": "héllo", "metadata": {"thread": "A"}}, {"id": "2", "document": "", "metadata": {}}]
+    path = str(tmp_path / "shard.jsonl.zst")
+
+    snapshot._write_shard(path, records, level=3)
+
+    assert snapshot._read_shard(path) == records
+
+
+def test_quantize_round_trip():
+    vectors = np.random.default_rng(0).normal(size=(5, 8)).astype(np.float32)
+
+    stored, scales = snapshot._quantize(vectors, "int8")
+
+    assert stored.dtype == np.int8
+    assert np.allclose(snapshot._dequantize(stored, scales), vectors, atol=np.abs(vectors).max() / 127)
+    half, no_scales = snapshot._quantize(vectors, "float16")
+    assert no_scales is None and np.allclose(half, vectors, atol=1e-2)
+
+
+def test_verify_snapshot_checks_every_file(tmp_path):
+    _write_snapshot(str(tmp_path), [[{"id": "1", "document": "a", "metadata": {}}]], [[0.1, 0.2]])
+    assert snapshot.verify_snapshot(str(tmp_path))["count"] == 1
+
+    with open(tmp_path / "records-00000.jsonl.zst", "ab") as f:
+        f.write(b"corrupt")
+    with pytest.raises(ValueError, match="checksum mismatch for records-00000"):
+        snapshot.verify_snapshot(str(tmp_path))
+
+    os.remove(tmp_path / snapshot.VECTORS_FILE)
+    with pytest.raises(ValueError, match="missing vectors.npy"):
+        snapshot.verify_snapshot(str(tmp_path))
+
+
+def test_load_snapshot_vectors_is_memory_mapped(tmp_path):
+    _write_snapshot(str(tmp_path), [[{"id": "1", "document": "a", "metadata": {}}]], [[0.5, -0.25]])
+
+    vectors, scales = snapshot.load_snapshot_vectors(str(tmp_path))
+
+    assert isinstance(vectors, np.memmap) and scales is None
+    assert np.allclose(snapshot.load_snapshot_vectors(str(tmp_path), dequantize=True)[0], [[0.5, -0.25]])
+
+
+def test_iter_shards_keeps_order_and_bounds_in_flight(tmp_path, monkeypatch):
+    lock = threading.Lock()
+    state = {"started": 0, "consumed": 0, "max_ahead": 0}
+
+    def slow_read(path):
+        with lock:
+            state["started"] += 1
+            state["max_ahead"] = max(state["max_ahead"], state["started"] - state["consumed"])
+        time.sleep(0.001)
+        return [int(os.path.basename(path))]
+
+    monkeypatch.setattr(snapshot, "_read_shard", slow_read)
+    paths = [str(tmp_path / str(i)) for i in range(40)]
+
+    shards = []
+    for records in snapshot._iter_shards(paths, workers=2):
+        time.sleep(0.002)  # slow consumer, like the Chroma upserts
+        with lock:
+            state["consumed"] += 1
+        shards.extend(records)
+
+    assert shards == list(range(40))
+    # The window of 2 * workers plus the shard being consumed
+    assert state["max_ahead"] <= 5
+
+
+def test_export_import_round_trip(tmp_path):
+    pytest.importorskip("chromadb")
+    source, target, out = str(tmp_path / "src"), str(tmp_path / "dst"), str(tmp_path / "snap")
+    collection = get_collection(source, create=True)
+    vectors = np.random.default_rng(1).normal(size=(25, 8)).astype(np.float32)
+    collection.add(
+        ids=[f"id{i}" for i in range(25)],
+        embeddings=vectors,
+        documents=[f"email {i}" for i in range(25)],
+        metadatas=[{"thread": f"T{i % 3}", "source": f"{i}.txt"} for i in range(25)],
+    )
+
+    manifest = snapshot.export_snapshot(out, source, batch_size=4, workers=2)
+    assert manifest["count"] == 25 and len(manifest["shards"]) == 7
+    assert snapshot.import_snapshot(out, target, batch_size=3, workers=2) == 25
+
+    imported = get_collection(target).get(ids=["id0", "id24"], include=["embeddings", "documents", "metadatas"])
+    by_id = dict(zip(imported["ids"], zip(imported["documents"], imported["embeddings"], imported["metadatas"])))
+    assert by_id["id24"][0] == "email 24" and by_id["id24"][2]["thread"] == "T0"
+    assert np.allclose(by_id["id24"][1], vectors[24], atol=1e-2)
+
+
+def test_sidecar_stores_travel_with_the_snapshot(tmp_path):
+    import sqlite3
+
+    source, target, out = str(tmp_path / "src"), str(tmp_path / "dst"), str(tmp_path / "snap")
+    with sqlite3.connect(source + "_headers.sqlite3") as conn:
+        conn.execute("CREATE TABLE emails (id TEXT)")
+        conn.execute("INSERT INTO emails VALUES ('a')")
+    with open(source + "_threads.json", "w") as f:
+        json.dump({"labels": {"email:a": "Kickoff"}}, f)
+
+    names = snapshot._export_sidecars(out, source)
+    assert sorted(names) == ["headers.sqlite3", "threads.json"]  # no duplicate index yet
+
+    restored = snapshot._restore_sidecars(out, {"sidecars": names}, target)
+    assert sorted(restored) == sorted(names)
+    with sqlite3.connect(target + "_headers.sqlite3") as conn:
+        assert conn.execute("SELECT id FROM emails").fetchall() == [("a",)]
+    with open(target + "_threads.json") as f:
+        assert json.load(f)["labels"] == {"email:a": "Kickoff"}
@@ -0,0 +1,163 @@
+from helpers.thread_reconstruction import (
+    ThreadGrouper,
+    email_key,
+    normalize_subject,
+    parse_addresses,
+    parse_message_ids
+)
+
+
+def _headers(message_id=None, in_reply_to=None, subject="Budget", sender="alice@acme.com", to="bob@acme.com"):
+    return {"message-id": message_id, "in-reply-to": in_reply_to, "subject": subject, "from": sender, "to": to}
+
+
+def _add(grouper, headers, preferred_label=None):
+    return grouper.add_email(email_key(headers), headers, preferred_label)
+
+
+def test_header_parsing():
+    assert normalize_subject("RE: Fwd:  AW: Q3   Budget") == "q3 budget"
+    assert normalize_subject("Re[2]: Kickoff") == "kickoff"
+    assert parse_message_ids("<A@x> <b@Y>") == ["a@x", "b@y"]
+    assert parse_addresses("Alice <Alice@Acme.com>, bob@acme.com", None) == {"alice@acme.com", "bob@acme.com"}
+    assert email_key({"message-id": "<M1@x>"}) == "msg:m1@x"
+
+
+def test_replies_join_the_conversation_of_their_parent(tmp_path):
+    grouper = ThreadGrouper(str(tmp_path / "threads.json"))
+    first = _add(grouper, _headers("<1@x>"))
+    reply = _add(grouper, _headers("<2@x>", "<1@x>", subject="Re: something else entirely"))
+
+    assert reply == first
+    # A reply that arrives before its parent is joined once the parent shows up
+    orphan = _add(grouper, _headers("<4@x>", "<3@x>", subject="Plan"))
+    parent = _add(grouper, _headers("<3@x>", subject="Plan", sender="carol@acme.com", to="dan@acme.com"))
+    assert parent == orphan
+    assert grouper.thread_of(email_key(_headers("<4@x>"))) == parent
+
+
+def test_subject_fallback_needs_a_shared_participant(tmp_path):
+    grouper = ThreadGrouper(str(tmp_path / "threads.json"))
+    first = _add(grouper, _headers(subject="Offsite"))
+    same_people = _add(grouper, _headers(subject="RE: Offsite", sender="bob@acme.com", to="alice@acme.com"))
+    strangers = _add(grouper, _headers(subject="Offsite", sender="x@other.com", to="y@other.com"))
+
+    assert same_people == first
+    assert strangers != first
+
+
+def test_preferred_label_is_unique_per_conversation(tmp_path):
+    grouper = ThreadGrouper(str(tmp_path / "threads.json"))
+    first = _add(grouper, _headers("<1@x>", subject="Kickoff"), "Project Phoenix")
+    second = _add(grouper, _headers("<2@x>", subject="Invoices", sender="x@o.com", to="y@o.com"), "Project Phoenix")
+    third = _add(grouper, _headers("<3@x>", subject="Lunch", sender="p@o.com", to="q@o.com"), "Project Phoenix")
+
+    assert first == "Project Phoenix"
+    assert second.startswith("Project Phoenix [") and third.startswith("Project Phoenix [")
+    assert len({first, second, third}) == 3
+
+
+def test_merges_only_relabel_the_merged_conversation(tmp_path):
+    grouper = ThreadGrouper(str(tmp_path / "threads.json"))
+    a = _add(grouper, _headers("<a1@x>", subject="Kickoff"), "Phoenix")
+    _add(grouper, _headers("<a2@x>", "<a1@x>", subject="Re: Kickoff"), "Phoenix")
+    b = _add(grouper, _headers("<b1@x>", subject="Budget", sender="x@o.com", to="y@o.com"), "Phoenix")
+    unrelated = _add(grouper, _headers("<c1@x>", subject="Lunch", sender="p@o.com", to="q@o.com"), "Phoenix")
+    assert grouper.pop_merges() == {}
+
+    # One email referencing both conversations joins them; the bigger one keeps its label
+    joined = _add(grouper, {**_headers("<d1@x>", "<a2@x>", subject="Re: both"), "references": "<b1@x>"})
+
+    assert joined == a
+    assert grouper.pop_merges() == {b: a}
+    assert grouper.thread_of(email_key(_headers("<b1@x>"))) == a
+    assert grouper.thread_of(email_key(_headers("<c1@x>"))) == unrelated != a
+
+
+def test_merge_chains_resolve_to_the_final_label(tmp_path):
+    grouper = ThreadGrouper(str(tmp_path / "threads.json"))
+    big = [_add(grouper, _headers(f"<a{i}@x>", "<a0@x>" if i else None, subject="A")) for i in range(3)][0]
+    mid = [_add(grouper, _headers(f"<b{i}@x>", "<b0@x>" if i else None, subject="B", sender="x@o.com"))
+           for i in range(2)][0]
+    small = _add(grouper, _headers("<c0@x>", subject="C", sender="p@o.com", to="q@o.com"))
+
+    _add(grouper, {**_headers("<m1@x>", "<b1@x>", subject="m1"), "references": "<c0@x>"})
+    _add(grouper, {**_headers("<m2@x>", "<a1@x>", subject="m2"), "references": "<b0@x>"})
+
+    assert grouper.pop_merges() == {mid: big, small: big}
+
+
+def test_state_round_trips(tmp_path):
+    path = str(tmp_path / "threads.json")
+    grouper = ThreadGrouper(path)
+    label = _add(grouper, _headers("<1@x>"), "Phoenix")
+    grouper.save()
+
+    reloaded = ThreadGrouper(path)
+    assert _add(reloaded, _headers("<2@x>", "<1@x>")) == label
+    # Labels in use survive a restart, so a new conversation cannot reuse them
+    assert _add(reloaded, _headers("<9@x>", subject="Other", sender="z@o.com", to="w@o.com"), "Phoenix") != label
+
+
+def test_removed_email_leaves_the_rest_of_its_conversation_linked(tmp_path):
+    grouper = ThreadGrouper(str(tmp_path / "threads.json"))
+    first = _add(grouper, _headers("<1@x>"))
+    _add(grouper, _headers("<2@x>", "<1@x>"))
+    _add(grouper, _headers("<3@x>", "<2@x>"))
+
+    for message_id in ("<1@x>", "<2@x>"):
+        assert grouper.remove_email(email_key(_headers(message_id)))
+        assert grouper.thread_of(email_key(_headers(message_id))) is None
+    assert grouper.thread_of(email_key(_headers("<3@x>"))) == first
+    # A late reply to a deleted email still finds the conversation
+    assert _add(grouper, _headers("<5@x>", "<1@x>", subject="Other")) == first
+    assert not grouper.remove_email(email_key(_headers("<9@x>")))
+
+
+def test_removed_email_is_no_subject_fallback_candidate(tmp_path):
+    grouper = ThreadGrouper(str(tmp_path / "threads.json"))
+    _add(grouper, _headers(subject="Offsite", to="team@acme.com"), preferred_label="Offsite")
+    assert grouper.remove_email(email_key(_headers(subject="Offsite", to="team@acme.com")))
+    assert "offsite" not in grouper.subjects
+    # The emptied conversation frees its label for the next one
+    later = _headers(subject="Offsite", sender="bob@acme.com", to="team@acme.com")
+    assert _add(grouper, later, preferred_label="Offsite") == "Offsite"
+    assert grouper.subjects["offsite"] == [["email:" + email_key(later), ["bob@acme.com", "team@acme.com"]]]
+
+
+def test_concurrent_locked_writers_keep_each_others_emails(tmp_path):
+    import threading
+    import time
+
+    path = str(tmp_path / "threads.json")
+
+    def ingest(n):
+        with ThreadGrouper.locked(path) as grouper:
+            _add(grouper, _headers(f"<{n}@x>", subject=f"Topic {n}", sender=f"user{n}@acme.com"))
+            time.sleep(0.005)  # a slow batch: other writers must wait rather than overwrite
+
+    threads = [threading.Thread(target=ingest, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    grouper = ThreadGrouper(path)
+    assert all(grouper.thread_of(f"msg:{n}@x") is not None for n in range(8))
+
+
+def test_remove_email_after_reload_uses_the_rebuilt_indexes(tmp_path):
+    path = str(tmp_path / "threads.json")
+    with ThreadGrouper.locked(path) as grouper:
+        first = _add(grouper, _headers("<1@x>"))
+        _add(grouper, _headers("<2@x>", "<1@x>"))
+        _add(grouper, _headers(None, subject="Budget", sender="bob@acme.com", to="alice@acme.com"))
+
+    with ThreadGrouper.locked(path) as grouper:
+        assert grouper.remove_email("msg:1@x")
+        assert grouper.thread_of("msg:2@x") == first
+        assert all(node != "email:msg:1@x" for node, _ in grouper.subjects["budget"])
+
+    grouper = ThreadGrouper(path)
+    assert "email:msg:1@x" not in grouper.parent
+    assert grouper.thread_of("msg:2@x") == first
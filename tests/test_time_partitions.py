@@ -0,0 +1,106 @@
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from helpers.time_partitions import (
+    MANIFEST_NAME,
+    TimePartitionedIndex,
+    _write_manifest,
+    _write_partition,
+    parse_date_bounds,
+    refresh_time_partitions,
+)
+
+NOW = datetime(2025, 6, 18, 15, 30)  # a Wednesday
+SECOND = timedelta(seconds=1)
+
+
+@pytest.mark.parametrize("question, bounds", [
+    ("what did we decide since March?", (datetime(2025, 3, 1), None)),
+    ("Since March, what changed?", (datetime(2025, 3, 1), None)),
+    ("AFTER 2024-09-01 who replied?", (datetime(2024, 9, 2), None)),
+    ("Before March 2024 who owned the budget?", (None, datetime(2024, 3, 1) - SECOND)),
+    ("Until May what was the plan?", (None, datetime(2025, 6, 1) - SECOND)),
+    ("what happened in May 2025?", (datetime(2025, 5, 1), datetime(2025, 6, 1) - SECOND)),
+    ("emails from last week", (datetime(2025, 6, 9), datetime(2025, 6, 16) - SECOND)),
+    ("anything urgent in the past week?", (NOW - timedelta(days=7), NOW)),
+    ("Past month updates on hiring", (NOW - timedelta(days=30), NOW)),
+    ("what happened today?", (datetime(2025, 6, 18), NOW)),
+    ("show me today's emails", (datetime(2025, 6, 18), NOW)),
+])
+def test_time_scopes(question, bounds):
+    assert parse_date_bounds(question, now=NOW) == bounds
+
+
+@pytest.mark.parametrize("question", [
+    "what may happen today?",
+    "who should march on the budget?",
+    "what is the plan?",
+])
+def test_questions_without_a_time_scope(question):
+    assert parse_date_bounds(question, now=NOW) == (None, None)
+
+
+class FakeCollection:
+    """Answers ``get(ids=...)`` like a Chroma collection."""
+
+    def __init__(self, records):
+        self.records = records
+
+    def get(self, ids, include):
+        ids = [doc_id for doc_id in ids if doc_id in self.records]
+        return {
+            "ids": ids,
+            "embeddings": [self.records[doc_id][0] for doc_id in ids],
+            "metadatas": [self.records[doc_id][1] for doc_id in ids],
+        }
+
+
+def _ts(*args):
+    return datetime(*args).timestamp()
+
+
+def test_refresh_is_a_noop_before_the_first_build(tmp_path):
+    collection = FakeCollection({"a": (np.ones(8), {"timestamp": _ts(2025, 6, 1), "thread": "T"})})
+    assert refresh_time_partitions(collection, added_ids=["a"], root_dir=str(tmp_path)) is None
+    assert not os.path.exists(tmp_path / MANIFEST_NAME)
+
+
+def test_refresh_appends_to_months_and_removes_deleted_rows(tmp_path):
+    root = str(tmp_path)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(4, 8)).astype(np.float32)
+    may = [_ts(2025, 5, d) for d in (1, 2, 3, 4)]
+    _write_partition(root, "2025-05", ["m0", "m1", "m2", "m3"], ["T"] * 4, vectors, may)
+    _write_manifest(root, {"partitions": {"2025-05": {"count": 4, "min_ts": may[0], "max_ts": may[-1],
+                                                      "built_at": 1.0}}})
+    index = TimePartitionedIndex(root)
+    assert index.search(vectors[0], k=1)[0][0] == "m0"  # loads the segment before the refresh
+
+    new = rng.normal(size=(2, 8)).astype(np.float32)
+    collection = FakeCollection({
+        "m4": (new[0], {"timestamp": _ts(2025, 5, 20), "thread": "T"}),
+        "j0": (new[1], {"timestamp": _ts(2025, 6, 2), "thread": "T"}),
+    })
+    manifest = refresh_time_partitions(collection, added_ids=["m4", "j0"], removed_ids=["m1"], root_dir=root)
+
+    assert manifest["partitions"]["2025-05"]["count"] == 4
+    assert manifest["partitions"]["2025-05"]["max_ts"] == _ts(2025, 5, 20)
+    assert manifest["partitions"]["2025-06"]["count"] == 1
+    # The already loaded May segment sees the appended row, and the deleted one is gone
+    hits = index.search(new[0], k=2, start=datetime(2025, 5, 10), end=datetime(2025, 5, 31))
+    assert [doc_id for doc_id, _ in hits] == ["m4"]
+    assert "m1" not in {doc_id for doc_id, _ in index.search(vectors[1], k=10)}
+    assert index.search(new[1], k=1, start=datetime(2025, 6, 1))[0][0] == "j0"
+
+
+def test_date_filter_matches_a_thread_family():
+    from helpers.time_partitions import date_filter
+
+    assert date_filter(("Kickoff",)) == {"thread": "Kickoff"}
+    assert date_filter(("Kickoff", "Kickoff [0a1b2c]"), start=datetime(2025, 1, 1)) == {"$and": [
+        {"thread": {"$in": ["Kickoff", "Kickoff [0a1b2c]"]}}, {"timestamp": {"$gte": datetime(2025, 1, 1).timestamp()}}
+    ]}
+    assert date_filter(None) is None
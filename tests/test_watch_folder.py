@@ -0,0 +1,84 @@
+import os
+import threading
+
+from helpers.watch_folder import Checkpoint, FolderWatcher, is_email_file, parse_folder_specs
+
+
+def test_email_file_filter():
+    assert is_email_file("/in/a.txt") and is_email_file("/in/box.mbox")
+    assert not is_email_file("/in/a-parsed.txt")
+    assert not is_email_file("/in/.a.txt.swp") and not is_email_file("/in/notes.md")
+
+
+def test_folder_specs(tmp_path):
+    folders = parse_folder_specs([str(tmp_path / "inbox"), f"{tmp_path / 'exports'}=Project Phoenix"])
+    assert folders == {str(tmp_path / "inbox"): None, str(tmp_path / "exports"): "Project Phoenix"}
+
+
+def test_scan_queues_new_and_deleted_files_only(tmp_path):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    (inbox / "new.txt").write_text("From: a@x\n\nhi")
+    (inbox / "indexed.txt").write_text("From: a@x\n\nold")
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    checkpoint = Checkpoint(checkpoint_path)
+    stat = os.stat(inbox / "indexed.txt")
+    checkpoint.files[str(inbox / "indexed.txt")] = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": ""}
+    checkpoint.files[str(inbox / "gone.txt")] = {"mtime": 0, "size": 0, "sha256": ""}
+    checkpoint.save()
+
+    watcher = FolderWatcher({str(inbox): None}, checkpoint_path=checkpoint_path, use_watchdog=False, debounce_s=0)
+    watcher.scan()
+    assert sorted(watcher._due()) == [str(inbox / "gone.txt"), str(inbox / "new.txt")]
+
+
+def test_batches_hold_the_shared_index_lock(tmp_path, monkeypatch):
+    lock = threading.Lock()
+    watcher = FolderWatcher({str(tmp_path): None}, checkpoint_path=str(tmp_path / "c.json"), index_lock=lock)
+    held = []
+    monkeypatch.setattr(watcher, "_process", lambda paths: held.append(lock.locked()) or len(paths))
+
+    assert watcher.process(["a.txt"]) == 1
+    assert held == [True]
+    assert not lock.locked()
+
+
+def test_failing_file_is_retried_alone_then_quarantined(tmp_path, monkeypatch):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    good, bad = str(inbox / "good.txt"), str(inbox / "bad.txt")
+    for path in (good, bad):
+        with open(path, "w") as f:
+            f.write("From: a@x\n\nhi")
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    watcher = FolderWatcher({str(inbox): None}, checkpoint_path=checkpoint_path, use_watchdog=False,
+                            debounce_s=0, max_attempts=2, retry_backoff_s=0)
+    batches = []
+
+    def fake_process(paths):
+        batches.append(sorted(paths))
+        if bad in paths:
+            raise ValueError("cannot parse")
+        for path in paths:
+            stat = os.stat(path)
+            watcher.checkpoint.files[path] = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": "x"}
+        return len(paths)
+
+    monkeypatch.setattr(watcher, "_process", fake_process)
+
+    assert watcher._index_batch([bad, good]) == 1
+    assert batches == [[bad, good], [bad], [good]]
+    assert watcher._attempts == {bad: 1}
+
+    assert watcher._due() == [bad]
+    assert watcher._index_batch([bad]) == 0
+    assert watcher._due() == [] and watcher._attempts == {}
+    assert Checkpoint(checkpoint_path).failed() == [bad]
+
+    # Quarantined until the file changes
+    watcher.scan()
+    assert watcher._due() == []
+    with open(bad, "a") as f:
+        f.write("\nfixed")
+    watcher.scan()
+    assert watcher._due() == [bad]
@@ -1,24 +1,28 @@
 import streamlit as st
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain_community.llms import Ollama
-from langchain.prompts import PromptTemplate
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-from helpers.query_by_thread import ask_email_agent3
+from helpers.config import CHAT_SERVICE_URL, QUERY_SERVICE_URL
 
 st.set_page_config(page_title="🤖 Query Assistant", layout="wide")
 
 
 st.title("🤖 Email Query Assistant")
-# Load vectorstore
-embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-vectorstore = Chroma(persist_directory="chroma_email_db_3", embedding_function=embedding_model)
+if QUERY_SERVICE_URL:
+    # Shared query service: no model or vectorstore loaded in this process
+    from helpers.query_client import ChatSessionError, QueryServiceClient
+    client = QueryServiceClient(QUERY_SERVICE_URL)
+    answer_email_query = client.ask
+    all_threads = client.threads()
+else:
+    from helpers.query_by_thread import vectorstore
+    from helpers.query_router import answer_email_query
 
-# Load all docs just for thread list (won't affect retrieval later)
-all_docs = vectorstore.similarity_search(" ", k=1000)
-all_threads = sorted(list(set(doc.metadata.get("thread", "Unknown") for doc in all_docs)))
+    ChatSessionError = ()  # in-process sessions do not expire under the page
+
+    # Load all docs just for thread list (won't affect retrieval later)
+    all_docs = vectorstore.similarity_search(" ", k=1000)
+    all_threads = sorted(list(set(doc.metadata.get("thread", "Unknown") for doc in all_docs)))
 if not all_threads:
     st.info("No mail threads indexed yet")
     st.markdown(
@@ -35,18 +39,70 @@ if not all_threads:
 
 st.subheader("📂 Query Scope")
 thread_options = ["All Threads"] + all_threads
-selected_thread = st.selectbox("🔍 Select thread to query", options=thread_options)
-query = st.text_input("Ask a question:", placeholder="e.g., Who was invited to the kickoff meeting?")
+selected_thread = st.selectbox(
+    "🔍 Select thread to query", options=thread_options,
+    help="A folder name also covers the later conversations filed under it as \"<name> [abc123]\"."
+)
 top_k = st.slider("Number of documents to retrieve:", 1, 20, 5)
+chat_mode = st.toggle(
+    "💬 Chat mode",
+    help="Follow-up questions reuse the instructions and emails already sent to the LLM in this chat."
+)
+
+if chat_mode:
+    session = st.session_state.get("chat_session")
+    if st.button("🆕 New chat") or session is None or (session.thread, session.top_k) != (selected_thread, top_k):
+        if QUERY_SERVICE_URL:
+            # The session and its prompt state live in the (single-worker) chat service
+            try:
+                session = QueryServiceClient(CHAT_SERVICE_URL).chat_session(selected_thread, top_k)
+            except ChatSessionError as e:
+                st.error(f"❌ {e}")
+                st.stop()
+        else:
+            from helpers.chat_session import ChatSession
+
+            session = ChatSession(thread=selected_thread, top_k=top_k)
+        st.session_state.chat_session = session
+
+    for turn in session.turns:
+        with st.chat_message("user"):
+            st.markdown(turn["question"])
+        with st.chat_message("assistant"):
+            st.markdown(turn["answer"])
+            st.caption(f"{turn['new_docs']} new email(s) sent · {turn['prompt_tokens']} prompt token(s) prefilled")
+
+    question = st.chat_input("Ask a question or a follow-up")
+    if question:
+        with st.chat_message("user"):
+            st.markdown(question)
+        with st.chat_message("assistant"):
+            with st.spinner("Processing..."):
+                try:
+                    answer, docs, new_docs = session.ask(question)
+                except ChatSessionError as e:
+                    # Say so instead of quietly continuing in a new session without the earlier turns
+                    del st.session_state["chat_session"]
+                    st.warning(f"⚠️ {e}. Ask again to start a new chat.")
+                    st.stop()
+            st.markdown(answer)
+            st.caption(f"{new_docs} new email(s) sent · {session.turns[-1]['prompt_tokens']} prompt token(s) prefilled")
+            with st.expander("📄 Retrieved Context"):
+                for i, doc in enumerate(docs):
+                    st.markdown(f"**Document {i+1}:**\n\n{doc.page_content[:800]}...")
+    st.stop()
+
+query = st.text_input("Ask a question:", placeholder="e.g., Who was invited to the kickoff meeting?")
 
 if st.button("Run Query") and query:
     with st.spinner("Processing..."):
         print(selected_thread)
-        response, docs = ask_email_agent3(query, selected_thread, top_k=top_k)
+        result = answer_email_query(query, selected_thread, top_k=top_k)
+        response, docs = result or ("⚠️ No relevant documents found for the query.", [])
 
         st.subheader("🤖 Response")
         st.markdown(response)
 
         with st.expander("📄 Retrieved Context"):
             for i, doc in enumerate(docs):
-                st.markdown(f"**Document {i+1}:**\n\n{doc.page_content[:800]}...")
+                st.markdown(f"**Document {i+1}:**\n\n{doc.page_content[:800]}...")
\ No newline at end of file
@@ -1,87 +1,91 @@
 import streamlit as st
 import pandas as pd
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
+import sys
+import os
+from datetime import datetime, time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from helpers.config import DB_DIRECTORY
+from helpers.header_store import get_header_store
+from helpers.collection import get_collection
 
 st.set_page_config(page_title="📄 Email List & Preview", layout="wide")
 
-# Load vectorstore and documents
-embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-vectorstore = Chroma(persist_directory="chroma_email_db_3", embedding_function=embedding_model)
-print("🔍 Total documents in Chroma DB:", vectorstore._collection.count())
+# Metadata only: no embedding model. A fresh DB has no collection yet, so create the empty one
+collection = get_collection(DB_DIRECTORY, create=True)
+total = collection.count()
+print("🔍 Total documents in Chroma DB:", total)
 
-docs = vectorstore.similarity_search(" ", k=1000)
+PAGE_SIZE = 200
 
-# Safely extract metadata
-meta = []
-for i, doc in enumerate(docs):
-    metadata = doc.metadata
-    subject = metadata.get("subject", "No Subject")
-    sender = metadata.get("from", "Unknown")
-    raw_date = metadata.get("date", "1970-01-01")
-    try:
-        date_parsed = pd.to_datetime(raw_date)
-    except Exception:
-        date_parsed = pd.to_datetime("1970-01-01")
-
-    meta.append({
-        "index": i,
-        "subject": subject,
-        "from": sender,
-        "date": raw_date,
-        "date_parsed": date_parsed,
-        "thread": metadata.get("thread", "Unknown Thread")
-    })
-
-df = pd.DataFrame(meta)
-
-# Filters
 st.sidebar.title("📂 Filters")
-if df.empty:
+if not total:
     st.error("❌ No documents found in Chroma DB.")
     st.stop()
-# Thread Filter
-threads = df["thread"].dropna().unique().tolist()
-selected_threads = st.sidebar.multiselect("🧵 Thread ID", threads, default=threads)
-df["date_parsed"] = pd.to_datetime(df["date"], errors="coerce")
-df["date_parsed"].fillna(pd.to_datetime("1970-01-01"), inplace=True)
-min_date = df["date_parsed"].min()
-max_date = df["date_parsed"].max()
 
-date_range = st.sidebar.date_input("📅 Date Range", (min_date, max_date))
-senders = df["from"].unique().tolist()
-selected_senders = st.sidebar.multiselect("✉️ Sender", senders, default=senders)
+# Filter choices come from the header store, so the page never loads every email's metadata
+store = get_header_store()
+threads = store.threads()
+senders = store.senders()
+first_ts, last_ts = store.time_span()
+if not threads:
+    st.sidebar.caption("ℹ️ The header store is empty: backfill it (see README) to filter by thread, sender and date.")
 
-# Filter based on date and sender
-filtered_df = df[
-    (df["from"].isin(selected_senders)) &
-    (df["date_parsed"] >= pd.to_datetime(date_range[0])) &
-    (df["date_parsed"] <= pd.to_datetime(date_range[1])) &
-    (df["thread"].isin(selected_threads))
-]
+selected_threads = st.sidebar.multiselect("🧵 Thread ID", threads, placeholder="All threads")
+selected_senders = st.sidebar.multiselect("✉️ Sender", senders, placeholder="All senders")
+date_range = ()
+if first_ts is not None:
+    min_date, max_date = datetime.fromtimestamp(first_ts).date(), datetime.fromtimestamp(last_ts).date()
+    date_range = st.sidebar.date_input("📅 Date Range", (min_date, max_date), min_value=min_date, max_value=max_date,
+                                       help="Uses the stored \"timestamp\" metadata; emails indexed before it existed "
+                                            "get it from build_time_partitions.")
+
+# Chroma applies the filters and pages; only the emails shown are fetched
+clauses = []
+if selected_threads:
+    clauses.append({"thread": {"$in": selected_threads}})
+if selected_senders:
+    clauses.append({"from": {"$in": selected_senders}})
+if len(date_range) == 2 and (date_range[0] > min_date or date_range[1] < max_date):
+    clauses.append({"timestamp": {"$gte": datetime.combine(date_range[0], time.min).timestamp()}})
+    clauses.append({"timestamp": {"$lte": datetime.combine(date_range[1], time.max).timestamp()}})
+where = None if not clauses else clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+page = st.sidebar.number_input("📑 Page", min_value=1, value=1)
+found = collection.get(where=where, limit=PAGE_SIZE + 1, offset=(page - 1) * PAGE_SIZE,
+                       include=["documents", "metadatas"])
+docs = [(text, metadata or {}) for text, metadata in zip(found["documents"], found["metadatas"])]
+has_next = len(docs) > PAGE_SIZE
+docs = sorted(docs[:PAGE_SIZE], key=lambda doc: doc[1].get("timestamp") or 0, reverse=True)
+if docs:
+    scope = f"of {total}" if where is None else "matching"
+    st.sidebar.caption(f"Showing {(page - 1) * PAGE_SIZE + 1}–{(page - 1) * PAGE_SIZE + len(docs)} {scope} emails"
+                       + (", more on the next page" if has_next else ""))
 
 # Render list labels
 doc_labels = [
-    f"{row['subject']} | {row['date_parsed'].date()} | {row['from']}"
-    for _, row in filtered_df.iterrows()
+    f"{metadata.get('subject', 'No Subject')} | {pd.to_datetime(metadata.get('date'), errors='coerce').date()} | "
+    f"{metadata.get('from', 'Unknown')}"
+    for _, metadata in docs
 ]
 
 # Sidebar selection
-index_options = filtered_df["index"].tolist()
+index_options = list(range(len(docs)))
 if index_options:
     selected_index = st.sidebar.radio(
         "Select an email:",
         options=index_options,
-        format_func=lambda i: doc_labels[filtered_df.index.get_loc(i)]
+        format_func=lambda i: doc_labels[i]
     )
 
     # Preview
-    selected_doc = docs[selected_index]
+    selected_text, selected_meta = docs[selected_index]
     st.subheader("📄 Email Preview")
-    st.markdown(f"**Subject:** {selected_doc.metadata.get('subject', 'No Subject')}")
-    st.markdown(f"**From:** {selected_doc.metadata.get('from', 'Unknown')}")
-    st.markdown(f"**To:** {selected_doc.metadata.get('to', 'Unknown')}")
-    st.markdown(f"**Date:** {selected_doc.metadata.get('date', 'Unknown')}")
-    st.text_area("Content", selected_doc.page_content[:2000], height=300)
+    st.markdown(f"**Subject:** {selected_meta.get('subject', 'No Subject')}")
+    st.markdown(f"**From:** {selected_meta.get('from', 'Unknown')}")
+    st.markdown(f"**To:** {selected_meta.get('to', 'Unknown')}")
+    st.markdown(f"**Date:** {selected_meta.get('date', 'Unknown')}")
+    st.text_area("Content", selected_text[:2000], height=300)
+elif page > 1:
+    st.info("No more emails match the selected filters; go back a page.")
 else:
     st.info("No emails match the selected filters.")
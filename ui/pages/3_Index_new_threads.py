@@ -30,14 +30,16 @@ if uploaded_files:
         documents.append(Document(page_content=content, metadata=metadata))
 
     st.subheader("🧵 Thread Info")
-    thread_name = st.text_input("Enter a thread name for these emails (required):")
+    thread_name = st.text_input(
+        "Thread name for new conversations (optional):",
+        help="Emails are grouped into conversations from their Message-ID / In-Reply-To / References "
+             "headers and subjects. Replies to already indexed mail join the existing thread."
+    )
 
     if st.button("📌 Index Files"):
-        if not thread_name.strip():
-            st.error("Please enter a thread name before indexing.")
-        else:
-            with st.spinner("Processing..."):
-                index_email_uploaded(uploaded_files,thread_name)
-                # vectorstore.add_documents(documents)
-                # vectorstore.persist()
-                st.success(f"✅ Indexed {len(documents)} document(s) successfully!")
+        with st.spinner("Processing..."):
+            threads = index_email_uploaded(uploaded_files, thread_name.strip())
+            # vectorstore.add_documents(documents)
+            # vectorstore.persist()
+            st.success(f"✅ Indexed {len(documents)} document(s) successfully!")
+            st.markdown("**Threads:** " + ", ".join(f"`{t}`" for t in threads))